@@ -30,19 +30,21 @@ from app.handlers.user import (
     settings,
 )
 from app.handlers.user.premium import router as premium_router
-from app.middlewares.middlewares import (
-    AllowedUsersMiddleware,
-    CheckSubscription,
-    LoggingMiddleware,
-    UpdateUsernameMiddleware,
+from app.middlewares.middlewares import PreDispatchMiddleware
+from app.utils.database import (
+    Base,
+    get_engine,
+    get_session,
+    init_database,
+    log_pool_metrics,
+    run_migrations,
 )
-from app.middlewares.stats import StatsMiddleware
-from app.utils.database import Base, get_session, run_migrations, init_database
 from app.utils.misc import (
     create_premium_subscription_plans_if_not_exists,
     create_settings_definitions_if_not_exists,
 )
 from app.utils.scheduler import scheduler
+from app.utils.schema import upgrade_schema
 from app.utils.user.api.learnify.subscription import restore_renew_subscription_jobs
 
 env = Env()
@@ -77,6 +79,7 @@ async def main():
     
     client_session = None
     polling_task = None
+    invalidation_task = None
 
     # Настройка прокси
     if TELEGRAM_BOT_API:
@@ -120,6 +123,14 @@ async def main():
 
     # Инициализация подключения к БД
     await init_database()
+
+    # Новые столбцы и индексы для существующей базы (до autogenerate alembic,
+    # чтобы он видел уже дополненную схему)
+    try:
+        await upgrade_schema(await get_engine())
+    except Exception as e:
+        logger.exception(f"Error upgrading database schema: {e}")
+        return
     
     # Миграции базы данных
     if env.bool("USE_ALEMBIC", default=False):
@@ -132,8 +143,6 @@ async def main():
             return
 
     # Создание таблиц
-    from app.utils.database import get_engine
-    
     try:
         engine = await get_engine()
         async with engine.begin() as conn:
@@ -174,15 +183,10 @@ async def main():
 
     logger.debug(f"Total routers included: {len(dp.sub_routers)}")
 
-    # Middlewares
-    dp.update.middleware(LoggingMiddleware())
-    dp.update.middleware(StatsMiddleware())
-    dp.update.middleware(CheckSubscription())
-    dp.update.middleware(UpdateUsernameMiddleware())
-
+    # Middlewares: один проход на обновление
+    dp.update.middleware(PreDispatchMiddleware(only_allowed_users=ONLY_ALLOWED_USERS))
     if ONLY_ALLOWED_USERS:
-        dp.update.middleware(AllowedUsersMiddleware())
-        logger.info("Allowed users middleware enabled")
+        logger.info("Allowed users check enabled")
 
     # Удаление вебхука
     try:
@@ -197,6 +201,8 @@ async def main():
         new_notifications_checker,
     )
     from app.utils.user.api.mes.auth import restore_refresh_tokens_jobs
+    from app.utils.user.api.mes.notifications import prune_old_events
+    from app.utils.user.usernames import flush_username_updates
 
     # Создание настроек
     try:
@@ -216,11 +222,39 @@ async def main():
     # Настройка проверок и задач
     try:
         await new_notifications_checker(bot)
-        scheduler.add_job(new_notifications_checker, "interval", minutes=1, args=(bot,))
+        scheduler.add_job(
+            new_notifications_checker,
+            "interval",
+            seconds=NOTIFICATIONS_CHECKER_INTERVAL,
+            args=(bot,),
+            max_instances=1,
+            coalesce=True,
+        )
         logger.info("Notifications checker scheduled")
     except Exception as e:
         logger.error(f"Error setting up notifications checker: {e}")
 
+    if DB_POOL_METRICS_INTERVAL:
+        scheduler.add_job(
+            log_pool_metrics, "interval", seconds=DB_POOL_METRICS_INTERVAL, coalesce=True
+        )
+
+    scheduler.add_job(
+        flush_username_updates,
+        "interval",
+        seconds=USERNAME_SYNC_INTERVAL,
+        max_instances=1,
+        coalesce=True,
+    )
+
+    try:
+        scheduler.add_job(
+            prune_old_events, trigger="cron", hour=4, minute=0, max_instances=1
+        )
+        logger.info("Events retention job scheduled")
+    except Exception as e:
+        logger.error(f"Error setting up events retention job: {e}")
+
     try:
         await restore_refresh_tokens_jobs(bot)
         logger.info("Token refresh jobs restored")
@@ -274,6 +308,11 @@ async def main():
         logger.info(
             f"Bot @{bot_info.username} (ID: {bot_info.id}) is starting polling..."
         )
+        from app.utils.logstash import stats_shipper
+        from app.utils.user.cache import listen_cache_invalidation
+
+        stats_shipper.start()
+        invalidation_task = asyncio.create_task(listen_cache_invalidation())
         polling_task = asyncio.create_task(dp.start_polling(bot))
         await polling_task
         
@@ -298,6 +337,23 @@ async def main():
             except (asyncio.CancelledError, asyncio.TimeoutError):
                 logger.info("Polling task cancelled")
         
+        if invalidation_task and not invalidation_task.done():
+            invalidation_task.cancel()
+
+        # Отправка оставшейся статистики
+        try:
+            from app.utils.logstash import stats_shipper
+            await stats_shipper.stop()
+        except Exception as e:
+            logger.error(f"Error stopping stats shipper: {e}")
+
+        # Запись накопленных username
+        try:
+            from app.utils.user.usernames import flush_username_updates
+            await flush_username_updates()
+        except Exception as e:
+            logger.error(f"Error flushing username updates: {e}")
+
         # Закрытие базы данных
         try:
             from app.utils.database import close_database_connections
@@ -305,6 +361,13 @@ async def main():
         except Exception as e:
             logger.error(f"Error closing database connections: {e}")
         
+        # Закрытие сессии МЭШ
+        try:
+            from app.utils.user.clients import close_http_session
+            await close_http_session()
+        except Exception as e:
+            logger.error(f"Error closing MES HTTP session: {e}")
+
         # Закрытие сессии бота
         if bot:
             try:
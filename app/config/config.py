@@ -37,6 +37,17 @@ env.read_envfile()
 
 LOGSTASH_HOST = env.str("LOGSTASH_HOST")
 LOGSTASH_PORT = env.int("LOGSTASH_PORT")
+# Отправка статистики: буфер в памяти, пачки и сброс на диск при переполнении
+STATS_BUFFER_SIZE = env.int("STATS_BUFFER_SIZE", default=10000)
+STATS_BATCH_SIZE = env.int("STATS_BATCH_SIZE", default=200)
+STATS_FLUSH_INTERVAL = env.float("STATS_FLUSH_INTERVAL", default=2.0)
+STATS_SEND_TIMEOUT = env.float("STATS_SEND_TIMEOUT", default=5.0)
+STATS_SPILL_FILE = env.str("STATS_SPILL_FILE", default="logs/stats_spill.ndjson")
+STATS_SPILL_MAX_BYTES = env.int("STATS_SPILL_MAX_BYTES", default=52428800)
+# Отправка логов: очередь (при переполнении записи отбрасываются) и пачки
+LOGSTASH_LOG_QUEUE_SIZE = env.int("LOGSTASH_LOG_QUEUE_SIZE", default=50000)
+LOGSTASH_LOG_BATCH_SIZE = env.int("LOGSTASH_LOG_BATCH_SIZE", default=500)
+LOGSTASH_LOG_FLUSH_INTERVAL = env.float("LOGSTASH_LOG_FLUSH_INTERVAL", default=1.0)
 LEARNIFY_WEB = env.str("LEARNIFY_WEB")
 LEARNIFY_API_TOKEN = env.str("LEARNIFY_API_TOKEN", default=None)
 
@@ -61,6 +72,72 @@ MINIO_HOST = env.str("MINIO_HOST", default="localhost")
 MINIO_INTERNAL_PORT = env.int("MINIO_INTERNAL_PORT", default=9000)
 MINIO_BUCKET_NAME = env.str("MINIO_BUCKET_NAME", default="learnify_bot")
 
+# Notifications checker
+NOTIFICATIONS_CHECKER_INTERVAL = env.int("NOTIFICATIONS_CHECKER_INTERVAL", default=60)
+NOTIFICATIONS_CHECKER_CONCURRENCY = env.int(
+    "NOTIFICATIONS_CHECKER_CONCURRENCY", default=50
+)
+MES_RATE_LIMIT = env.float("MES_RATE_LIMIT", default=100)
+TELEGRAM_RATE_LIMIT = env.float("TELEGRAM_RATE_LIMIT", default=25)
+# Интервалы опроса уведомлений, в минутах
+POLL_INTERVAL_FAST = env.int("POLL_INTERVAL_FAST", default=1)
+POLL_INTERVAL_NORMAL = env.int("POLL_INTERVAL_NORMAL", default=5)
+POLL_INTERVAL_SLOW = env.int("POLL_INTERVAL_SLOW", default=15)
+POLL_INTERVAL_IDLE = env.int("POLL_INTERVAL_IDLE", default=60)
+POLL_RECENT_ACTIVITY_MINUTES = env.int("POLL_RECENT_ACTIVITY_MINUTES", default=30)
+POLL_IDLE_AFTER_DAYS = env.int("POLL_IDLE_AFTER_DAYS", default=14)
+# Сколько дней хранить события для дедупликации; уведомления старше считаются уже отправленными
+EVENTS_RETENTION_DAYS = env.int("EVENTS_RETENTION_DAYS", default=60)
+
+# Пул клиентов МЭШ
+MES_CLIENT_POOL_SIZE = env.int("MES_CLIENT_POOL_SIZE", default=10000)
+MES_CLIENT_POOL_TTL = env.int("MES_CLIENT_POOL_TTL", default=600)
+MES_CONNECTION_LIMIT = env.int("MES_CONNECTION_LIMIT", default=100)
+MES_KEEPALIVE_TIMEOUT = env.int("MES_KEEPALIVE_TIMEOUT", default=30)
+
+# Кэш данных пользователей (token, profile_id, student_id и т.д.)
+IDENTITY_CACHE_SIZE = env.int("IDENTITY_CACHE_SIZE", default=100000)
+IDENTITY_CACHE_TTL = env.int("IDENTITY_CACHE_TTL", default=600)
+
+# Отложенная запись username: последние известные значения и интервал записи
+USERNAME_SYNC_CACHE_SIZE = env.int("USERNAME_SYNC_CACHE_SIZE", default=100000)
+USERNAME_SYNC_INTERVAL = env.int("USERNAME_SYNC_INTERVAL", default=30)
+
+# Снимок оценок за учебный год
+MARKS_SNAPSHOT_TTL = env.int("MARKS_SNAPSHOT_TTL", default=21600)
+
+# Учебный календарь класса (Redis / память процесса)
+CALENDAR_CACHE_TTL = env.int("CALENDAR_CACHE_TTL", default=604800)
+CALENDAR_MEMORY_TTL = env.int("CALENDAR_MEMORY_TTL", default=3600)
+
+# Накопленная статистика для итогов
+RESULTS_STATE_TTL = env.int("RESULTS_STATE_TTL", default=2592000)
+# Сколько последних дней перезапрашивать при обновлении (отметки могут появиться позже)
+RESULTS_STATE_OVERLAP_DAYS = env.int("RESULTS_STATE_OVERLAP_DAYS", default=3)
+
+# Кэш готовых текстов в памяти процесса перед Redis
+CACHE_L1_SIZE = env.int("CACHE_L1_SIZE", default=20000)
+CACHE_L1_TTL = env.int("CACHE_L1_TTL", default=60)
+# Сколько хранить устаревший текст после TTL, чтобы отвечать сразу и обновлять в фоне
+SWR_STALE_TTL = env.int("SWR_STALE_TTL", default=86400)
+
+# Недельные ответы МЭШ (ДЗ, события, расписание) в памяти процесса
+PREFETCH_CACHE_SIZE = env.int("PREFETCH_CACHE_SIZE", default=5000)
+PREFETCH_TTL = env.int("PREFETCH_TTL", default=600)
+
+# Каталог предметов ученика (меняется раз в учебный год)
+SUBJECTS_CATALOG_TTL = env.int("SUBJECTS_CATALOG_TTL", default=604800)
+
+# Пул соединений с БД (на один процесс бота)
+DB_POOL_SIZE = env.int("DB_POOL_SIZE", default=10)
+DB_MAX_OVERFLOW = env.int("DB_MAX_OVERFLOW", default=20)
+DB_POOL_TIMEOUT = env.int("DB_POOL_TIMEOUT", default=30)
+DB_POOL_RECYCLE = env.int("DB_POOL_RECYCLE", default=1800)
+DB_POOL_PRE_PING = env.bool("DB_POOL_PRE_PING", default=True)
+DB_STATEMENT_CACHE_SIZE = env.int("DB_STATEMENT_CACHE_SIZE", default=100)
+# Как часто писать метрики пула, в секундах (0 — не писать)
+DB_POOL_METRICS_INTERVAL = env.int("DB_POOL_METRICS_INTERVAL", default=60)
+
 TG_PROXY = env.str("TG_PROXY", default=None)
 TELEGRAM_BOT_API = env.str("TELEGRAM_BOT_API", default=None)
 
@@ -32,6 +32,7 @@ from app.utils.user.api.mes.auth import (
     get_token_expire_date,
     schedule_refresh,
 )
+from app.utils.user.identity import invalidate_identity
 from app.utils.user.utils import (
     deep_links,
     ensure_user_settings,
@@ -113,6 +114,7 @@ async def cmd_start(
                 user.contract_id = clients.client_id.contract_id
 
                 await session.commit()
+                invalidate_identity(message.from_user.id)
 
                 # result = await session.execute(
                 #     db.select(AuthData).filter_by(
@@ -177,6 +179,7 @@ async def cmd_start(
                 user = User(user_id=user_id, active=False)
                 session.add(user)
                 await session.commit()
+                invalidate_identity(user_id)
                 logger.info(f"New user {user_id} registered")
 
             await message.answer(
@@ -330,11 +333,13 @@ async def sms_handler(message: Message, state: FSMContext, bot: Bot):
                         user = User(user_id=message.from_user.id, token=token)
                         session.add(user)
                         await session.commit()
+                        invalidate_identity(message.from_user.id)
                         logger.info(f"New user {user_id} created after SMS auth")
 
                     else:
                         user.token = token
                         await session.commit()
+                        invalidate_identity(message.from_user.id)
 
                     profile_info = await api.get_users_profile_info()
 
@@ -353,6 +358,7 @@ async def sms_handler(message: Message, state: FSMContext, bot: Bot):
                     user.active = True
 
                     await session.commit()
+                    invalidate_identity(message.from_user.id)
 
                     result = await session.execute(
                         db.select(AuthData).filter_by(user_id=message.from_user.id)
@@ -450,6 +456,7 @@ async def exit_from_account(callback: CallbackQuery):
         if user:
             user.active = False
             await session.commit()
+            invalidate_identity(callback.from_user.id)
 
             await callback.answer()
             await callback.message.edit_text(
@@ -553,6 +560,7 @@ async def token_message_handler(message: Message, state: FSMContext, bot: Bot):
         auth_data.client_secret = None
 
         await session.commit()
+        invalidate_identity(message.from_user.id)
 
         api, _ = await get_student(message.from_user.id, active=False)
 
@@ -573,6 +581,7 @@ async def token_message_handler(message: Message, state: FSMContext, bot: Bot):
         user.active = True
 
         await session.commit()
+        invalidate_identity(message.from_user.id)
 
         await ensure_user_settings(session, message.from_user.id)
 
@@ -655,6 +664,7 @@ async def auth_by_qr_callback_handler(callback: CallbackQuery, state: FSMContext
             auth_data.client_secret = None
 
             await session.commit()
+            invalidate_identity(callback.from_user.id)
 
             api, _ = await get_student(callback.from_user.id, active=False)
 
@@ -675,6 +685,7 @@ async def auth_by_qr_callback_handler(callback: CallbackQuery, state: FSMContext
             user.active = True
 
             await session.commit()
+            invalidate_identity(callback.from_user.id)
 
             await ensure_user_settings(session, callback.from_user.id)
 
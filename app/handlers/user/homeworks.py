@@ -2,6 +2,7 @@
 #
 # SPDX-License-Identifier: MIT
 
+import asyncio
 from datetime import datetime
 
 from aiogram import F, Router
@@ -16,6 +17,8 @@ from app.utils.user.api.mes.homeworks import (
     get_homework_by_subject,
     handle_homework_navigation,
 )
+from app.utils.user.api.mes.prefetch import HOMEWORKS, warm_up
+from app.utils.user.revalidation import revalidate_message
 
 router = Router()
 
@@ -29,10 +32,12 @@ async def homeworks_handler(message: Message, state: FSMContext):
 
     await state.set_state(HomeworkState.date)
 
-    text, new_date = await get_homework(user_id, date, direction="today")
+    text, new_date = await get_homework(user_id, date, direction="today", mark_stale=True)
+    asyncio.create_task(warm_up(user_id, HOMEWORKS, new_date))
 
     await state.update_data(date=new_date)
-    await message.answer(text, reply_markup=kb.homework)
+    homework_message = await message.answer(text, reply_markup=kb.homework)
+    await revalidate_message(homework_message, text, kb.homework)
     logger.debug(f"Homeworks sent to user {user_id}")
 
 
@@ -46,12 +51,13 @@ async def general_homework_navigation(callback: CallbackQuery, state: FSMContext
     logger.info(f"User {user_id} navigating homeworks: {direction}")
 
     text, date, markup = await handle_homework_navigation(
-        user_id, state, direction, subject_mode=False
+        user_id, state, direction, subject_mode=False, mark_stale=True
     )
 
     await state.update_data(date=date)
     await callback.answer()
     await callback.message.edit_text(text, reply_markup=markup)
+    await revalidate_message(callback.message, text, markup)
     
     logger.debug(f"Homework navigation successful for user {user_id}")
 
@@ -78,11 +84,12 @@ async def back_to_homework_callback_handler(callback: CallbackQuery, state: FSMC
     
     logger.debug(f"User {user_id} returning to homeworks")
 
-    text, new_date = await get_homework(user_id, date, direction="today")
+    text, new_date = await get_homework(user_id, date, direction="today", mark_stale=True)
 
     await state.update_data(date=new_date)
     await callback.answer()
     await callback.message.edit_text(text, reply_markup=kb.homework)
+    await revalidate_message(callback.message, text, kb.homework)
     
     logger.debug(f"Returned to homeworks for user {user_id}")
 
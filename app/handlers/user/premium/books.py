@@ -45,7 +45,7 @@ from app.utils.user.api.learnify.subscription import (
     get_user_info,
     successful_payment,
 )
-from app.utils.user.utils import get_student
+from app.utils.user.api.mes.subjects import UNKNOWN_SUBJECT, get_subjects_catalog
 
 router = Router()
 
@@ -109,17 +109,9 @@ async def select_book_handler(message: Message, state, bot):
     logger.info(f"User {user_id} uploading book for subject_id={subject_id}")
     logger.debug(f"Document: {message.document.file_name} ({message.document.file_size} bytes)")
     
-    api, user = await get_student(message.from_user.id)
-    subjects = await api.get_subjects(
-        student_id=user.student_id, profile_id=user.profile_id
-    )
-    subject_name = next(
-        (
-            subject.subject_name
-            for subject in subjects.payload
-            if subject.subject_id == subject_id
-        ),
-        "Неизвестный предмет",
+    catalog = await get_subjects_catalog(message.from_user.id)
+    subject_name = (
+        catalog.get_name(subject_id, UNKNOWN_SUBJECT) if catalog else UNKNOWN_SUBJECT
     )
     
     logger.debug(f"Subject name: {subject_name}")
@@ -47,7 +47,7 @@ from app.utils.user.api.learnify.subscription import (
     get_user_info,
     successful_payment,
 )
-from app.utils.user.utils import get_student
+from app.utils.user.api.mes.subjects import UNKNOWN_SUBJECT, get_subjects_catalog
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -149,17 +149,9 @@ async def select_subject_auto_gdz_handler(callback: CallbackQuery, state: FSMCon
                 reply_markup=await kb.auto_gdz_settings(subject_gdz=subject_gdz),
             )
         else:
-            api, user = await get_student(callback.from_user.id)
-            subjects = await api.get_subjects(
-                student_id=user.student_id, profile_id=user.profile_id
-            )
-            subject_name = next(
-                (
-                    subject.subject_name
-                    for subject in subjects.payload
-                    if subject.subject_id == subject_id
-                ),
-                "Неизвестный предмет",
+            catalog = await get_subjects_catalog(callback.from_user.id)
+            subject_name = (
+                catalog.get_name(subject_id, UNKNOWN_SUBJECT) if catalog else UNKNOWN_SUBJECT
             )
             
             logger.debug(f"No config found for user {user_id}, subject {subject_id}, creating new")
@@ -12,9 +12,11 @@ from loguru import logger
 
 from app.keyboards import user as kb
 from app.states.user.states import ScheduleState
+from app.utils.user.api.mes.prefetch import SCHEDULE, warm_up
 from app.utils.user.api.mes.schedule import (
     get_schedule,
 )
+from app.utils.user.revalidation import revalidate_message
 
 router = Router()
 
@@ -27,8 +29,9 @@ async def schedule_handler(message: Message, state: FSMContext):
     await state.set_state(ScheduleState.date)
 
     text, new_date = await get_schedule(
-        message.from_user.id, datetime.now(), direction="today"
+        message.from_user.id, datetime.now(), direction="today", mark_stale=True
     )
+    asyncio.create_task(warm_up(user_id, SCHEDULE, new_date))
 
     await state.update_data(date=new_date)
     if text:
@@ -38,6 +41,7 @@ async def schedule_handler(message: Message, state: FSMContext):
             text,
             reply_markup=kb.schedule,
         )
+        await revalidate_message(schedule_message, text, kb.schedule)
     else:
         logger.warning(f"No schedule data returned for user {user_id}")
 
@@ -56,7 +60,9 @@ async def schedule_left_callback_handler(callback: CallbackQuery, state: FSMCont
     new_date = date - timedelta(days=1)
     logger.debug(f"Moving to previous day: {new_date.strftime('%Y-%m-%d')}")
 
-    text, new_date = await get_schedule(callback.from_user.id, new_date, direction="left")
+    text, new_date = await get_schedule(
+        callback.from_user.id, new_date, direction="left", mark_stale=True
+    )
 
     await state.update_data(date=new_date)
     if text:
@@ -65,6 +71,7 @@ async def schedule_left_callback_handler(callback: CallbackQuery, state: FSMCont
             text,
             reply_markup=kb.schedule,
         )
+        await revalidate_message(callback.message, text, kb.schedule)
     else:
         logger.warning(f"No schedule data returned for user {user_id} on {new_date.strftime('%Y-%m-%d')}")
 
@@ -83,7 +90,7 @@ async def schedule_right_callback_handler(callback: CallbackQuery, state: FSMCon
     new_date = date + timedelta(days=1)
     logger.debug(f"Moving to next day: {new_date.strftime('%Y-%m-%d')}")
 
-    text, new_date = await get_schedule(user_id, new_date, direction="right")
+    text, new_date = await get_schedule(user_id, new_date, direction="right", mark_stale=True)
 
     await state.update_data(date=new_date)
     if text:
@@ -92,6 +99,7 @@ async def schedule_right_callback_handler(callback: CallbackQuery, state: FSMCon
             text,
             reply_markup=kb.schedule,
         )
+        await revalidate_message(callback.message, text, kb.schedule)
     else:
         logger.warning(f"No schedule data returned for user {user_id} on {new_date.strftime('%Y-%m-%d')}")
 
@@ -106,7 +114,7 @@ async def schedule_today_callback_handler(callback: CallbackQuery, state: FSMCon
     await state.set_state(ScheduleState.date)
 
     text, new_date = await get_schedule(
-        user_id, datetime.now(), direction="today"
+        user_id, datetime.now(), direction="today", mark_stale=True
     )
 
     await state.update_data(date=new_date)
@@ -117,5 +125,6 @@ async def schedule_today_callback_handler(callback: CallbackQuery, state: FSMCon
             text,
             reply_markup=kb.schedule,
         )
+        await revalidate_message(callback.message, text, kb.schedule)
     else:
         logger.warning(f"No schedule data returned for user {user_id} for today")
\ No newline at end of file
@@ -10,6 +10,7 @@ from loguru import logger
 from app.keyboards import user as kb
 from app.states.user.states import SettingsEditStates
 from app.utils.database import get_session, SettingDefinition, Settings, db
+from app.utils.user.api.mes.prefetch import publish_prefetch_invalidation
 from app.utils.user.cache import clear_user_cache
 from app.utils.user.utils import send_settings_editor
 
@@ -185,6 +186,8 @@ async def clear_cache_handler(callback: CallbackQuery):
     
     logger.info(f"User {user_id} clearing cache")
     
+    # Ответы МЭШ, подгруженные в память процессов, сбрасываются до отрисовок
+    await publish_prefetch_invalidation(user_id)
     num = await clear_user_cache(user_id)
     text = (
         "✅ <b>Кэш успешно очищен!</b>\n\n"
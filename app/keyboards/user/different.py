@@ -6,7 +6,8 @@ from aiogram.types import InlineKeyboardButton, KeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 
 from app.config.config import LEARNIFY_API_TOKEN
-from app.utils.user.utils import get_emoji_subject, get_student
+from app.utils.user.api.mes.subjects import get_subjects_catalog
+from app.utils.user.utils import get_emoji_subject
 
 
 async def main(user_id):
@@ -30,19 +31,15 @@ async def main(user_id):
 
 
 async def choice_subject(user_id, for_):
-    api, user = await get_student(user_id)
-
-    subjects = await api.get_subjects(
-        student_id=user.student_id, profile_id=user.profile_id
-    )
+    catalog = await get_subjects_catalog(user_id)
 
     keyboard = InlineKeyboardBuilder()
 
-    for subject in subjects.payload:
+    for subject_id, subject_name in catalog.items() if catalog else ():
         keyboard.row(
             InlineKeyboardButton(
-                text=f"{await get_emoji_subject(subject.subject_name)} {subject.subject_name}",
-                callback_data=f"select_subject_{for_}_{subject.subject_id}",
+                text=f"{await get_emoji_subject(subject_name)} {subject_name}",
+                callback_data=f"select_subject_{for_}_{subject_id}",
             )
         )
 
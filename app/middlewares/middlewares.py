@@ -2,138 +2,106 @@
 #
 # SPDX-License-Identifier: MIT
 
+from datetime import datetime
 from typing import Any, Awaitable, Callable, Dict
 from loguru import logger
 
 from aiogram import BaseMiddleware
-from aiogram.types import TelegramObject
+from aiogram.types import Update
 from envparse import env
 
 from app.keyboards import user as kb
-from app.config.config import ALLOWED_USERS, LOG_FILE, NO_SUBSCRIPTION_TO_CHANNEL_ERROR
-from app.utils.database import get_session, UserData, db
+from app.config.config import ALLOWED_USERS, NO_SUBSCRIPTION_TO_CHANNEL_ERROR
+from app.middlewares.stats import AUTH_STATES, build_stats_doc
+from app.utils.logstash import stats_shipper
 from app.utils.misc import check_subscription
+from app.utils.user.identity import get_identity
+from app.utils.user.usernames import username_sync
 from app.utils.user.utils import user_send_message
 
 env.read_envfile()
 
 
-class LoggingMiddleware(BaseMiddleware):
+class PreDispatchMiddleware(BaseMiddleware):
+    """
+    Единый проход перед хендлерами: логирование, белый список, статистика,
+    проверка подписки на канал и синхронизация username.
+    Пользователь, действие и состояние FSM определяются один раз и
+    передаются дальше через data.
+    """
+
+    def __init__(self, only_allowed_users=False):
+        self.only_allowed_users = only_allowed_users
+
     async def __call__(
         self,
-        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
-        event: TelegramObject,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
         data: Dict[str, Any],
     ):
-        user = None
+        action_type = None
+        action_data = None
         if event.message:
-            user = event.message.from_user
-            user_info = f"{user.full_name} (@{user.username}, ID: {user.id})"
-            logger.info(f"Message from {user_info}: {event.message.text}")
-
+            action_type, action_data = "message", event.message.text
         elif event.callback_query:
-            user = event.callback_query.from_user
-            user_info = f"{user.full_name} (@{user.username}, ID: {user.id})"
-            logger.info(f"Callback from {user_info}: {event.callback_query.data}")
+            action_type, action_data = "callback_query", event.callback_query.data
 
-        return await handler(event, data)
+        # Пользователь и чат уже определены UserContextMiddleware aiogram
+        user = data.get("event_from_user")
 
+        if action_type and user:
+            kind = "Message" if action_type == "message" else "Callback"
+            logger.info(f"{kind} from {user.full_name} (@{user.username}, ID: {user.id}): {action_data}")
 
-class CheckSubscription(BaseMiddleware):
-    async def __call__(
-        self,
-        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
-        event: TelegramObject,
-        data: Dict[str, Any],
-    ):
-        if not (
-            getattr(event, "message", None) or getattr(event, "callback_query", None)
-        ):
+        if self.only_allowed_users:
+            if user is None:
+                logger.warning(f"Cannot determine user_id for update {event.update_id}, blocking access")
+                return None
+            if user.id not in ALLOWED_USERS:
+                logger.warning(f"User {user.id} is not in allowed users list, blocking access")
+                return None
+
+        if user is None:
             return await handler(event, data)
 
-        if event.message:
-            if event.message.text == "/start":
-                logger.debug(f"User {event.message.from_user.id} started bot, skipping subscription check")
-                return await handler(event, data)
+        state_name = None
+        state = data.get("state")
+        if action_type and state is not None:
+            state_name = await state.get_state()
+        data["state_name"] = state_name
 
-            user_id = event.message.from_user.id
-        elif event.callback_query:
-            user_id = event.callback_query.from_user.id
+        started_at = datetime.now()
+        result = await self._dispatch(handler, event, data, user, action_type, action_data)
 
-        logger.debug(f"Checking subscription for user {user_id}")
-        result = await check_subscription(user_id=user_id, bot=event.bot)
-        
-        if result:
-            logger.debug(f"User {user_id} is subscribed, allowing access")
-            return await handler(event, data)
-        else:
-            logger.warning(f"User {user_id} is not subscribed to channel, blocking access")
-            await user_send_message(
-                user_id, NO_SUBSCRIPTION_TO_CHANNEL_ERROR, kb.link_to_channel
+        if action_type and state_name not in AUTH_STATES:
+            processing_time = (datetime.now() - started_at).total_seconds() * 1000
+            # Отправкой в Logstash занимается фоновая задача
+            stats_shipper.enqueue(
+                build_stats_doc(user, action_type, action_data, started_at, processing_time)
             )
 
+        return result
 
-class AllowedUsersMiddleware(BaseMiddleware):
-    async def __call__(
-        self,
-        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
-        event: TelegramObject,
-        data: Dict[str, Any],
-    ):
-        user_id = None
-        
-        if hasattr(event, "message") and event.message and event.message.from_user:
-            user_id = event.message.from_user.id
-        elif hasattr(event, "callback_query") and event.callback_query and event.callback_query.from_user:
-            user_id = event.callback_query.from_user.id
-        elif hasattr(event, "inline_query") and event.inline_query and event.inline_query.from_user:
-            user_id = event.inline_query.from_user.id
-        
-        if user_id is not None:
-            if user_id in ALLOWED_USERS:
-                logger.debug(f"User {user_id} is in allowed users list")
-                return await handler(event, data)
-            else:
-                logger.warning(f"User {user_id} is not in allowed users list, blocking access")
+    async def _dispatch(self, handler, event, data, user, action_type, action_data):
+        # Подписка проверяется только для сообщений и callback, кроме /start
+        if action_type and action_data != "/start":
+            if not await check_subscription(user_id=user.id, bot=event.bot):
+                logger.warning(f"User {user.id} is not subscribed to channel, blocking access")
+                await user_send_message(
+                    user.id, NO_SUBSCRIPTION_TO_CHANNEL_ERROR, kb.link_to_channel
+                )
                 return None
-        logger.warning(f"Cannot determine user_id for event {event}, blocking access")
-        return None
 
+        identity = await get_identity(user.id, active=False)
+        data["identity"] = identity
+        self._sync_username(user, identity)
 
-class UpdateUsernameMiddleware(BaseMiddleware):
-    async def __call__(
-        self,
-        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
-        event: TelegramObject,
-        data: Dict[str, Any],
-    ):
-        user_id = None
-        username = None
-
-        if hasattr(event, "message") and event.message and event.message.from_user:
-            user_id = event.message.from_user.id
-            username = event.message.from_user.username
-        elif hasattr(event, "callback_query") and event.callback_query and event.callback_query.from_user:
-            user_id = event.callback_query.from_user.id
-            username = event.callback_query.from_user.username
-        elif hasattr(event, "inline_query") and event.inline_query and event.inline_query.from_user:
-            user_id = event.inline_query.from_user.id
-            username = event.inline_query.from_user.username
-        
-        async with await get_session() as session:
-            result = await session.execute(
-                db.select(UserData).filter_by(user_id=user_id)
-            )
-            user_data: UserData = result.scalar_one_or_none()
-            if user_data and user_data.username != username:
-                if username:
-                    old_username = user_data.username
-                    user_data.username = username
-                    await session.commit()
-                    logger.info(f"Updated username for user {user_id}: {old_username} -> {username}")
-                else:
-                    logger.debug(f"User {user_id} has no username in Telegram")
-            elif not user_data:
-                logger.debug(f"No UserData found for user {user_id}")
-                
         return await handler(event, data)
+
+    def _sync_username(self, user, identity):
+        if not identity or not identity.has_user_data or not user.username:
+            return
+
+        # Сравнение в памяти, запись в БД — пачкой из flush_username_updates
+        if username_sync.observe(user.id, user.username, identity.username):
+            logger.info(f"Queued username update for user {user.id}: @{user.username}")
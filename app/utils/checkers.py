@@ -8,131 +8,177 @@ from aiogram import Bot
 from loguru import logger
 
 from app.keyboards import user as kb
-from app.utils.database import get_session, User, UserData, db
+from app.config.config import (
+    MES_RATE_LIMIT,
+    NOTIFICATIONS_CHECKER_CONCURRENCY,
+    NOTIFICATIONS_CHECKER_INTERVAL,
+    TELEGRAM_RATE_LIMIT,
+)
+from app.utils.database import get_session, UserData, db
+from app.utils.fanout import (
+    MES_HOST,
+    TELEGRAM_HOST,
+    exclusive_run,
+    fan_out,
+    get_host_limiter,
+)
 from app.utils.user.api.gigachat.birthday import birthday_greeting
 from app.utils.user.api.mes.notifications import get_notifications
 from app.utils.user.api.mes.replaces import get_replaces
+from app.utils.user.identity import load_identities
+from app.utils.user.polling import mark_polled, select_due_users
 
 
 async def new_notifications_checker(bot: Bot):
-    logger.info("Starting new notifications checker...")
+    async with exclusive_run(
+        "new_notifications_checker", NOTIFICATIONS_CHECKER_INTERVAL * 5
+    ) as allowed:
+        if not allowed:
+            logger.warning("Previous notifications checker run is still active, skipping")
+            return
+
+        logger.info("Starting new notifications checker...")
 
-    async with await get_session() as session:
         try:
-            result = await session.execute(db.select(User))
-            users = result.scalars().all()
-            logger.debug(f"Found {len(users)} users to check for notifications")
+            # Прогреваем кэш, чтобы get_student не ходил в БД за каждым пользователем
+            identities = await load_identities()
+            user_ids = [identity.user_id for identity in identities]
+            logger.debug(f"Found {len(user_ids)} users to check for notifications")
         except Exception as e:
             logger.exception(f"Error fetching users for notifications checker: {e}")
             return
 
+        started_at = datetime.now()
+        user_ids = await select_due_users(user_ids, started_at)
+        if not user_ids:
+            logger.info("No users due for notifications check on this tick")
+            return
+
+        mes_limiter = get_host_limiter(MES_HOST, MES_RATE_LIMIT)
+        telegram_limiter = get_host_limiter(TELEGRAM_HOST, TELEGRAM_RATE_LIMIT)
         sent_count = 0
         error_count = 0
 
-        for user in users:
+        async def check_user(user_id):
+            nonlocal sent_count, error_count
+
+            result = await get_notifications(user_id, all=False, is_checker=True)
+            if not result:
+                return
+
             try:
-                result = await get_notifications(
-                    user.user_id, all=False, is_checker=True
-                )
-                if result:
-                    try:
-                        chat = await bot.get_chat(user.user_id)
-                        await bot.send_message(
-                            chat_id=chat.id, text=result, reply_markup=kb.delete_message
-                        )
-                        sent_count += 1
-                        logger.debug(f"Sent notification to user {user.user_id}")
-                    except Exception as e:
-                        error_count += 1
-                        logger.debug(
-                            f"Failed to send notification to user {user.user_id}: {e}"
-                        )
-                        continue
+                async with telegram_limiter:
+                    await bot.send_message(
+                        chat_id=user_id, text=result, reply_markup=kb.delete_message
+                    )
+                sent_count += 1
+                logger.debug(f"Sent notification to user {user_id}")
             except Exception as e:
                 error_count += 1
-                logger.error(
-                    f"Error processing notifications for user {user.user_id}: {e}"
-                )
+                logger.debug(f"Failed to send notification to user {user_id}: {e}")
+
+        stats = await fan_out(
+            "new_notifications_checker",
+            user_ids,
+            check_user,
+            concurrency=NOTIFICATIONS_CHECKER_CONCURRENCY,
+            limiter=mes_limiter,
+        )
+
+        try:
+            await mark_polled(stats["succeeded"], started_at.timestamp())
+        except Exception as e:
+            logger.warning(f"Failed to save polling time for {len(stats['succeeded'])} users: {e}")
 
         logger.info(
-            f"Notifications checker completed. Sent: {sent_count}, Errors: {error_count}"
+            f"Notifications checker completed in {stats['elapsed']:.1f}s. "
+            f"Users: {stats['total']}, Sent: {sent_count}, "
+            f"Errors: {error_count + stats['failed']}"
         )
+        if stats["total"] and stats["failed"] == stats["total"]:
+            logger.critical(
+                f"Notifications checker failed for all {stats['total']} users, "
+                f"no notifications are being delivered"
+            )
+        if stats["elapsed"] > NOTIFICATIONS_CHECKER_INTERVAL:
+            logger.warning(
+                f"Notifications checker took {stats['elapsed']:.1f}s, "
+                f"longer than its {NOTIFICATIONS_CHECKER_INTERVAL}s interval"
+            )
 
 
 async def replaced_checker(bot: Bot):
     logger.info("Starting replaced checker...")
 
-    async with await get_session() as session:
-        try:
-            result = await session.execute(db.select(User))
-            users = result.scalars().all()
-            logger.debug(f"Found {len(users)} users to check for replacements")
-        except Exception as e:
-            logger.exception(f"Error fetching users for replaced checker: {e}")
-            return
+    try:
+        users = await load_identities(active=False)
+        logger.debug(f"Found {len(users)} users to check for replacements")
+    except Exception as e:
+        logger.exception(f"Error fetching users for replaced checker: {e}")
+        return
 
-        today_count = 0
-        tomorrow_count = 0
-        error_count = 0
+    today_count = 0
+    tomorrow_count = 0
+    error_count = 0
 
-        for user in users:
-            # Проверка на сегодня
-            try:
-                result_today = await get_replaces(user.user_id, datetime.now())
-                if result_today:
-                    try:
-                        chat = await bot.get_chat(user.user_id)
-                        await bot.send_message(
-                            chat_id=chat.id,
-                            text=result_today,
-                            reply_markup=kb.delete_message,
-                        )
-                        today_count += 1
-                        logger.debug(
-                            f"Sent today's replacements to user {user.user_id}"
-                        )
-                    except Exception as e:
-                        error_count += 1
-                        logger.debug(
-                            f"Failed to send today's replacements to user {user.user_id}: {e}"
-                        )
-            except Exception as e:
-                error_count += 1
-                logger.error(
-                    f"Error processing today's replacements for user {user.user_id}: {e}"
-                )
+    for user in users:
+        # Проверка на сегодня
+        try:
+            result_today = await get_replaces(user.user_id, datetime.now())
+            if result_today:
+                try:
+                    chat = await bot.get_chat(user.user_id)
+                    await bot.send_message(
+                        chat_id=chat.id,
+                        text=result_today,
+                        reply_markup=kb.delete_message,
+                    )
+                    today_count += 1
+                    logger.debug(
+                        f"Sent today's replacements to user {user.user_id}"
+                    )
+                except Exception as e:
+                    error_count += 1
+                    logger.debug(
+                        f"Failed to send today's replacements to user {user.user_id}: {e}"
+                    )
+        except Exception as e:
+            error_count += 1
+            logger.error(
+                f"Error processing today's replacements for user {user.user_id}: {e}"
+            )
 
-            # Проверка на завтра
-            try:
-                result_tomorrow = await get_replaces(
-                    user.user_id, datetime.now() + timedelta(days=1)
-                )
-                if result_tomorrow:
-                    try:
-                        chat = await bot.get_chat(user.user_id)
-                        await bot.send_message(
-                            chat_id=chat.id,
-                            text=result_tomorrow,
-                            reply_markup=kb.delete_message,
-                        )
-                        tomorrow_count += 1
-                        logger.debug(
-                            f"Sent tomorrow's replacements to user {user.user_id}"
-                        )
-                    except Exception as e:
-                        error_count += 1
-                        logger.debug(
-                            f"Failed to send tomorrow's replacements to user {user.user_id}: {e}"
-                        )
-            except Exception as e:
-                error_count += 1
-                logger.error(
-                    f"Error processing tomorrow's replacements for user {user.user_id}: {e}"
-                )
+        # Проверка на завтра
+        try:
+            result_tomorrow = await get_replaces(
+                user.user_id, datetime.now() + timedelta(days=1)
+            )
+            if result_tomorrow:
+                try:
+                    chat = await bot.get_chat(user.user_id)
+                    await bot.send_message(
+                        chat_id=chat.id,
+                        text=result_tomorrow,
+                        reply_markup=kb.delete_message,
+                    )
+                    tomorrow_count += 1
+                    logger.debug(
+                        f"Sent tomorrow's replacements to user {user.user_id}"
+                    )
+                except Exception as e:
+                    error_count += 1
+                    logger.debug(
+                        f"Failed to send tomorrow's replacements to user {user.user_id}: {e}"
+                    )
+        except Exception as e:
+            error_count += 1
+            logger.error(
+                f"Error processing tomorrow's replacements for user {user.user_id}: {e}"
+            )
 
-        logger.info(
-            f"Replaced checker completed. Today: {today_count}, Tomorrow: {tomorrow_count}, Errors: {error_count}"
-        )
+    logger.info(
+        f"Replaced checker completed. Today: {today_count}, Tomorrow: {tomorrow_count}, Errors: {error_count}"
+    )
 
 
 async def birthday_checker(bot: Bot):
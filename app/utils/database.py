@@ -4,16 +4,30 @@
 
 import asyncio
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
+import hashlib
 import subprocess
+import time
 from datetime import datetime
 from typing import Optional
 
 import sqlalchemy as db
 from envparse import Env
 from loguru import logger
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.config.config import (
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_STATEMENT_CACHE_SIZE,
+)
 
 
 env = Env()
@@ -25,6 +39,65 @@ DATABASE_URL = f'postgresql+asyncpg://{env.str("PG_USER")}:{env.str("PG_PASSWORD
 _engine = None
 _session_factory = None
 
+
+class PoolMetrics:
+    """Ожидание соединений из пула с момента прошлого снимка"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, wait: float):
+        self.checkouts += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+    def snapshot(self, pool) -> dict:
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        checked_out = pool.checkedout()
+        data = {
+            "pool_size": pool.size(),
+            "checked_out": checked_out,
+            "overflow": max(pool.overflow(), 0),
+            "utilization": checked_out / capacity if capacity else 0.0,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": self.wait_total / self.checkouts * 1000 if self.checkouts else 0.0,
+            "wait_max_ms": self.wait_max * 1000,
+        }
+        self.reset()
+        return data
+
+
+pool_metrics = PoolMetrics()
+# QueuePool._do_get вызывает себя повторно; время считаем только для внешнего вызова
+_in_checkout: ContextVar[bool] = ContextVar("_in_checkout", default=False)
+
+
+class MeteredPool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool, который измеряет время получения соединения"""
+
+    def _do_get(self):
+        if _in_checkout.get():
+            return super()._do_get()
+
+        token = _in_checkout.set(True)
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        finally:
+            _in_checkout.reset(token)
+            pool_metrics.record(time.perf_counter() - started)
+
+
 async def init_database():
     """Инициализация подключения к БД (вызывается один раз в main)"""
     global _engine, _session_factory
@@ -36,8 +109,20 @@ async def init_database():
     logger.info(f"Initializing database connection: {db_url_for_log}")
     
     try:
-        _engine = create_async_engine(DATABASE_URL, echo=False)
-        logger.debug("Async database engine created successfully")
+        _engine = create_async_engine(
+            DATABASE_URL,
+            echo=False,
+            poolclass=MeteredPool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+            connect_args={"statement_cache_size": DB_STATEMENT_CACHE_SIZE},
+        )
+        logger.debug(
+            f"Async database engine created: pool_size={DB_POOL_SIZE}, max_overflow={DB_MAX_OVERFLOW}"
+        )
     except Exception as e:
         logger.exception(f"Failed to create database engine: {e}")
         raise
@@ -80,6 +165,20 @@ async def session_scope():
     finally:
         await session.close()
 
+async def log_pool_metrics():
+    """Пишет метрики пула соединений (через лог они попадают и в Logstash)"""
+    if _engine is None:
+        return
+
+    metrics = pool_metrics.snapshot(_engine.pool)
+    logger.info(
+        f"DB pool: {metrics['checked_out']}/{metrics['pool_size']}+{metrics['overflow']} in use "
+        f"({metrics['utilization']:.0%}), checkouts={metrics['checkouts']}, "
+        f"wait avg={metrics['wait_avg_ms']:.1f}ms max={metrics['wait_max_ms']:.1f}ms, "
+        f"timeouts={metrics['timeouts']}"
+    )
+    return metrics
+
 async def close_database():
     """Закрытие соединения с БД"""
     global _engine
@@ -172,6 +271,8 @@ class AuthData(Base):
         db.BigInteger,
         db.ForeignKey("users.user_id", ondelete="CASCADE"),
         nullable=False,
+        unique=True,
+        index=True,
     )
     auth_method = db.Column(db.String, nullable=True)
     token_expired_at = db.Column(db.DateTime, nullable=True)
@@ -184,16 +285,27 @@ class Event(Base):
     __tablename__ = "events"
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    student_id = db.Column(db.BigInteger, nullable=False)
+    student_id = db.Column(db.BigInteger, nullable=False, index=True)
     event_type = db.Column(db.String, nullable=False)
     subject_name = db.Column(db.String, nullable=False)
-    date = db.Column(db.DateTime, nullable=False)
+    date = db.Column(db.DateTime, nullable=False, index=True)
     teacher_id = db.Column(db.BigInteger, nullable=False)
+    # sha256 от (student_id, teacher_id, event_type, date): ключ дедупликации уведомлений
+    fingerprint = db.Column(db.String(64), nullable=True, unique=True, index=True)
+
+    @staticmethod
+    def make_fingerprint(student_id, teacher_id, event_type, date: datetime) -> str:
+        # Формат повторяет выражение в app/utils/schema.py, которое заполняет старые записи
+        raw = f"{student_id}:{teacher_id}:{event_type}:{date.strftime('%Y-%m-%dT%H:%M:%S')}"
+        return hashlib.sha256(raw.encode()).hexdigest()
 
 
 # Таблица для сохранения уведомлений, которые созданы ботом и не приходят с API МЭШ
 class BotNotification(Base):
     __tablename__ = "bot_notifications"
+    __table_args__ = (
+        db.Index("ix_bot_notifications_user_id_created_at", "user_id", "created_at"),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(
@@ -214,6 +326,8 @@ class Settings(Base):
         db.BigInteger,
         db.ForeignKey("users.user_id", ondelete="CASCADE"),
         nullable=False,
+        unique=True,
+        index=True,
     )
     enable_new_mark_notification = db.Column(db.Boolean, default=True)
     enable_homework_notification = db.Column(db.Boolean, default=True)
@@ -250,6 +364,8 @@ class UserData(Base):
         db.BigInteger,
         db.ForeignKey("users.user_id", ondelete="CASCADE"),
         nullable=False,
+        unique=True,
+        index=True,
     )
     first_name = db.Column(db.String, nullable=True)
     last_name = db.Column(db.String, nullable=True)
@@ -284,6 +400,8 @@ class PremiumSubscription(Base):
         db.BigInteger,
         db.ForeignKey("users.user_id", ondelete="CASCADE"),
         nullable=False,
+        unique=True,
+        index=True,
     )
     expires_at = db.Column(db.DateTime, nullable=True)
     is_active = db.Column(db.Boolean, default=True)
@@ -313,14 +431,26 @@ class Transaction(Base):
 
 class Homework(Base):
     __tablename__ = "homeworks"
+    __table_args__ = (
+        db.UniqueConstraint("subject_id", "task_hash", name="uq_homeworks_subject_task_hash"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     task = db.Column(db.String, nullable=False)
     subject_id = db.Column(db.Integer, nullable=False)
+    # sha256 текста задания: короткий ключ для поиска и ON CONFLICT вместо длинного task
+    task_hash = db.Column(db.String(64), nullable=True)
+
+    @staticmethod
+    def hash_task(task: str) -> str:
+        return hashlib.sha256(task.encode()).hexdigest()
 
 
 class Gdz(Base):
     __tablename__ = "gdz"
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "subject_id", name="uq_gdz_user_subject"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(
@@ -336,6 +466,9 @@ class Gdz(Base):
 
 class StudentBook(Base):
     __tablename__ = "student_books"
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "subject_id", name="uq_student_books_user_subject"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(
@@ -0,0 +1,151 @@
+# SPDX-FileCopyrightText: 2024-2026 Mag329
+#
+# SPDX-License-Identifier: MIT
+
+import asyncio
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+from loguru import logger
+
+from app.utils.user.cache import redis_client
+
+MES_HOST = "school.mos.ru"
+TELEGRAM_HOST = "api.telegram.org"
+
+_host_limiters = {}
+_run_locks = {}
+
+# Снимает блокировку, только если она всё ещё наша: после истечения ttl
+# её мог взять другой процесс
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class RateLimiter:
+    """Token bucket: не более rate запросов в секунду с запасом burst"""
+
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated_at) * self.rate
+                )
+                self._updated_at = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+def get_host_limiter(host: str, rate: float = None, burst: int = None) -> RateLimiter:
+    """Общий лимитер для хоста (один на процесс)"""
+    limiter = _host_limiters.get(host)
+    if limiter is None:
+        limiter = RateLimiter(rate or 0, burst)
+        _host_limiters[host] = limiter
+        logger.debug(f"Rate limiter for {host} created: {rate} req/s, burst {limiter.burst}")
+    return limiter
+
+
+@asynccontextmanager
+async def exclusive_run(name: str, ttl: int):
+    """
+    Гарантирует, что одновременно выполняется только один запуск задачи.
+    Внутри процесса — asyncio.Lock, между процессами — блокировка в Redis.
+    Отдаёт True, если запуск разрешён, и False, если задача уже выполняется.
+    """
+    lock = _run_locks.setdefault(name, asyncio.Lock())
+    if lock.locked():
+        yield False
+        return
+
+    async with lock:
+        lock_key = f"lock:{name}"
+        token = uuid.uuid4().hex
+        acquired = True
+        try:
+            acquired = bool(await redis_client.set(lock_key, token, nx=True, ex=ttl))
+        except Exception as e:
+            logger.warning(f"Redis lock for {name} unavailable, using local lock only: {e}")
+
+        if not acquired:
+            yield False
+            return
+
+        try:
+            yield True
+        finally:
+            try:
+                released = await redis_client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+                if not released:
+                    logger.warning(f"Redis lock for {name} expired before the run finished")
+            except Exception as e:
+                logger.warning(f"Failed to release Redis lock for {name}: {e}")
+
+
+async def fan_out(name, items, worker, concurrency=10, limiter=None, progress_every=500):
+    """
+    Выполняет worker(item) для всех items параллельно, не более concurrency
+    одновременно. Если передан limiter, каждый вызов сначала ждёт его.
+    Возвращает статистику запуска; в succeeded — элементы, для которых
+    worker завершился без исключения.
+    """
+    total = len(items)
+    stats = {"total": total, "processed": 0, "failed": 0, "elapsed": 0.0, "succeeded": []}
+
+    if not total:
+        return stats
+
+    semaphore = asyncio.Semaphore(concurrency)
+    started_at = time.monotonic()
+
+    async def run(item):
+        async with semaphore:
+            if limiter:
+                await limiter.acquire()
+            try:
+                await worker(item)
+                stats["succeeded"].append(item)
+            except Exception as e:
+                stats["failed"] += 1
+                logger.error(f"{name}: error processing {item}: {e}")
+            finally:
+                stats["processed"] += 1
+                processed = stats["processed"]
+                if progress_every and processed % progress_every == 0 and processed < total:
+                    elapsed = time.monotonic() - started_at
+                    logger.info(
+                        f"{name}: {processed}/{total} ({processed * 100 // total}%), "
+                        f"{processed / elapsed:.1f} items/s"
+                    )
+
+    await asyncio.gather(*(run(item) for item in items))
+
+    stats["elapsed"] = time.monotonic() - started_at
+    return stats
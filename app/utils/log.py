@@ -0,0 +1,12 @@
+# SPDX-FileCopyrightText: 2024-2026 Mag329
+#
+# SPDX-License-Identifier: MIT
+
+from loguru import logger
+
+from app.config.config import LOG_LEVEL
+
+# Включён ли DEBUG. В горячих циклах f-строки и strftime для logger.debug
+# строятся только под этим флагом: loguru отбрасывает сообщение по уровню
+# уже после того, как аргумент вычислен.
+DEBUG_ENABLED = logger.level(LOG_LEVEL.upper()).no <= logger.level("DEBUG").no
@@ -0,0 +1,387 @@
+# SPDX-FileCopyrightText: 2024-2026 Mag329
+#
+# SPDX-License-Identifier: MIT
+
+import asyncio
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+
+from loguru import logger
+
+from app.config.config import (
+    BOT_VERSION,
+    LOGSTASH_HOST,
+    LOGSTASH_PORT,
+    LOGSTASH_LOG_BATCH_SIZE,
+    LOGSTASH_LOG_FLUSH_INTERVAL,
+    LOGSTASH_LOG_QUEUE_SIZE,
+    STATS_BATCH_SIZE,
+    STATS_BUFFER_SIZE,
+    STATS_FLUSH_INTERVAL,
+    STATS_SEND_TIMEOUT,
+    STATS_SPILL_FILE,
+    STATS_SPILL_MAX_BYTES,
+)
+
+
+def _encode(docs):
+    return "".join(json.dumps(doc, ensure_ascii=False) + "\n" for doc in docs).encode("utf-8")
+
+
+class StatsShipper:
+    """
+    Отправка документов в Logstash из фоновой задачи.
+    enqueue только кладёт документ в буфер; задача отправляет пачки по
+    STATS_BATCH_SIZE или раз в STATS_FLUSH_INTERVAL через одно постоянное
+    соединение. Переполненный буфер сбрасывается на диск и дочитывается,
+    когда Logstash снова доступен.
+    """
+
+    def __init__(self, host, port, buffer_size, batch_size, flush_interval, spill_file):
+        self.host = host
+        self.port = port
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_file = spill_file
+
+        self._buffer = deque()
+        self._spills: list[list] = []
+        self._wakeup = asyncio.Event()
+        self._writer = None
+        self._task = None
+
+        self.sent = 0
+        self.spilled = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self):
+        return bool(self.host and self.port)
+
+    def enqueue(self, doc: dict):
+        if not self.enabled:
+            return
+
+        self._buffer.append(doc)
+        if len(self._buffer) >= self.buffer_size:
+            # Буфер отдаём целиком на запись на диск, сама запись — в фоновой задаче
+            self._spills.append(list(self._buffer))
+            self._buffer.clear()
+            self._wakeup.set()
+        elif len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.debug(f"Stats shipper started: {self.host}:{self.port}")
+
+    async def stop(self, timeout=5.0):
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        # Остаток буфера: последняя попытка отправить, иначе на диск
+        try:
+            await asyncio.wait_for(self._flush(), timeout)
+        except Exception as e:
+            logger.debug(f"Final stats flush failed: {e}")
+        if self._buffer:
+            self._spills.append(list(self._buffer))
+            self._buffer.clear()
+        await self._write_spills()
+
+        await self._close()
+        logger.info(
+            f"Stats shipper stopped: sent={self.sent}, spilled={self.spilled}, dropped={self.dropped}"
+        )
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            await self._write_spills()
+            try:
+                await self._flush()
+                await self._replay_spill()
+            except (OSError, asyncio.TimeoutError) as e:
+                logger.debug(f"Logstash {self.host}:{self.port} unavailable: {e}")
+                await self._close()
+
+    async def _flush(self):
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            try:
+                await self._send(_encode(batch))
+            except BaseException:
+                # Пачка возвращается в начало буфера и уйдёт при следующей попытке
+                self._buffer.extendleft(reversed(batch))
+                raise
+            self.sent += len(batch)
+
+    async def _send(self, payload: bytes):
+        if self._writer is None or self._writer.is_closing():
+            _, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), STATS_SEND_TIMEOUT
+            )
+        self._writer.write(payload)
+        await asyncio.wait_for(self._writer.drain(), STATS_SEND_TIMEOUT)
+
+    async def _close(self):
+        writer, self._writer = self._writer, None
+        if writer is None:
+            return
+        try:
+            writer.close()
+            await asyncio.wait_for(writer.wait_closed(), 1)
+        except Exception:
+            pass
+
+    async def _write_spills(self):
+        if not self._spills:
+            return
+
+        spills, self._spills = self._spills, []
+        docs = [doc for spill in spills for doc in spill]
+        try:
+            written = await asyncio.to_thread(self._append_spill, _encode(docs))
+        except OSError as e:
+            logger.warning(f"Failed to spill {len(docs)} stats documents: {e}")
+            written = False
+
+        if written:
+            self.spilled += len(docs)
+            logger.debug(f"Stats buffer full, spilled {len(docs)} documents to {self.spill_file}")
+        else:
+            self.dropped += len(docs)
+
+    def _append_spill(self, payload: bytes):
+        directory = os.path.dirname(self.spill_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.spill_file) and os.path.getsize(self.spill_file) + len(payload) > STATS_SPILL_MAX_BYTES:
+            return False
+        with open(self.spill_file, "ab") as file:
+            file.write(payload)
+        return True
+
+    async def _replay_spill(self):
+        # Недоотправленный .sending дочитывается раньше нового файла
+        sending = f"{self.spill_file}.sending"
+        if not os.path.exists(sending):
+            if not os.path.exists(self.spill_file):
+                return
+            os.replace(self.spill_file, sending)
+
+        # В .offset — сколько байт .sending уже отправлено: после обрыва
+        # дочитываем с этого места, а не шлём отправленные пачки повторно
+        offset_file = f"{sending}.offset"
+        offset = await asyncio.to_thread(self._read_offset, offset_file)
+
+        payload = await asyncio.to_thread(self._read_file, sending)
+        lines = payload[offset:].splitlines(keepends=True)
+        for start in range(0, len(lines), self.batch_size):
+            chunk = b"".join(lines[start:start + self.batch_size])
+            await self._send(chunk)
+            offset += len(chunk)
+            self.sent += len(lines[start:start + self.batch_size])
+            await asyncio.to_thread(self._write_offset, offset_file, offset)
+
+        os.remove(sending)
+        if os.path.exists(offset_file):
+            os.remove(offset_file)
+        logger.info(f"Replayed {len(lines)} spilled stats documents to Logstash")
+
+    @staticmethod
+    def _read_offset(path):
+        try:
+            with open(path) as file:
+                return int(file.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    @staticmethod
+    def _write_offset(path, offset):
+        with open(path, "w") as file:
+            file.write(str(offset))
+
+    @staticmethod
+    def _read_file(path):
+        with open(path, "rb") as file:
+            return file.read()
+
+
+stats_shipper = StatsShipper(
+    LOGSTASH_HOST,
+    LOGSTASH_PORT,
+    STATS_BUFFER_SIZE,
+    STATS_BATCH_SIZE,
+    STATS_FLUSH_INTERVAL,
+    STATS_SPILL_FILE,
+)
+
+
+class LogstashLogSink:
+    """
+    Sink loguru для Logstash. Вызов sink только кладёт запись в очередь
+    (при переполнении запись отбрасывается и учитывается в dropped),
+    отправкой пачками NDJSON через одно соединение занимается отдельный поток.
+    Внутри потока loguru не используется, чтобы sink не писал сам в себя.
+    """
+
+    _STOP = object()
+
+    def __init__(self, host, port, queue_size, batch_size, flush_interval):
+        self.host = host
+        self.port = port
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._socket = None
+        self._retry_at = 0.0
+        self._backoff = 1.0
+
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        self._reported_losses = 0
+
+        self._thread = threading.Thread(target=self._run, name="logstash-sink", daemon=True)
+        self._thread.start()
+
+    def __call__(self, message):
+        try:
+            self._queue.put_nowait(self._make_entry(message.record))
+        except queue.Full:
+            self.dropped += 1
+
+    @staticmethod
+    def _make_entry(record):
+        entry = {
+            "event_type": "log",
+            "@timestamp": record["time"].isoformat(),
+            "level": record["level"].name,
+            "logger": record["name"],
+            "module": record["name"],
+            "function": record["function"],
+            "line": record["line"],
+            "message": record["message"],
+            "process_id": record["process"].id,
+            "thread_id": record["thread"].id,
+            "bot_version": BOT_VERSION,
+            "environment": os.getenv("ENVIRONMENT", "development"),
+        }
+
+        exception = record["exception"]
+        if exception:
+            entry["exception"] = repr(exception.value)
+            entry["traceback"] = "".join(
+                traceback.format_exception(exception.type, exception.value, exception.traceback)
+            )
+        return entry
+
+    def stop(self, timeout=5.0):
+        try:
+            self._queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = any(entry is self._STOP for entry in batch)
+            batch = [entry for entry in batch if entry is not self._STOP]
+            self._add_loss_report(batch)
+            if batch:
+                self._send(batch)
+
+            if stopping:
+                self._close()
+                return
+
+    def _add_loss_report(self, batch):
+        losses = self.dropped + self.failed
+        if losses == self._reported_losses:
+            return
+
+        batch.append(
+            {
+                "event_type": "log",
+                "@timestamp": datetime.now().astimezone().isoformat(),
+                "level": "WARNING",
+                "logger": __name__,
+                "message": (
+                    f"Logstash sink lost {losses - self._reported_losses} records "
+                    f"(dropped={self.dropped}, failed={self.failed})"
+                ),
+                "bot_version": BOT_VERSION,
+            }
+        )
+        self._reported_losses = losses
+
+    def _send(self, batch):
+        # Пока Logstash недоступен, пачки не ждут переподключения, а отбрасываются
+        if self._socket is None and time.monotonic() < self._retry_at:
+            self.failed += len(batch)
+            return
+
+        try:
+            if self._socket is None:
+                self._socket = socket.create_connection((self.host, self.port), timeout=2)
+            self._socket.sendall(_encode(batch))
+            self.sent += len(batch)
+            self._backoff = 1.0
+        except OSError:
+            self.failed += len(batch)
+            self._close()
+            self._retry_at = time.monotonic() + self._backoff
+            self._backoff = min(self._backoff * 2, 30.0)
+
+    def _close(self):
+        sock, self._socket = self._socket, None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+
+def create_log_sink():
+    return LogstashLogSink(
+        LOGSTASH_HOST,
+        LOGSTASH_PORT,
+        LOGSTASH_LOG_QUEUE_SIZE,
+        LOGSTASH_LOG_BATCH_SIZE,
+        LOGSTASH_LOG_FLUSH_INTERVAL,
+    )
@@ -22,7 +22,7 @@ from app.utils.database import (
     SettingDefinition,
     db,
 )
-from app.utils.user.cache import redis_client
+from app.utils.user.cache import cache_get, cache_set
 
 
 morph = pymorphy3.MorphAnalyzer()
@@ -111,8 +111,8 @@ async def check_subscription(user_id, bot):
 
     cache_key = f"subscriptions:{user_id}"
 
-    # Check cache
-    cache = await redis_client.get(cache_key)
+    # Check cache (память процесса, затем Redis)
+    cache = await cache_get(cache_key)
     if cache:
         is_subscribed = cache == "true"
         logger.debug(f"Subscription cache hit for user {user_id}: {is_subscribed}")
@@ -126,7 +126,7 @@ async def check_subscription(user_id, bot):
         is_subscribed = user_channel_status.status != "left"
 
         if is_subscribed:
-            await redis_client.setex(cache_key, DEFAULT_MEDIUM_CACHE_TTL, "true")
+            await cache_set(cache_key, DEFAULT_MEDIUM_CACHE_TTL, "true", user_id)
             logger.debug(
                 f"User {user_id} is subscribed, cached for {DEFAULT_MEDIUM_CACHE_TTL} seconds"
             )
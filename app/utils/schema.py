@@ -0,0 +1,178 @@
+# SPDX-FileCopyrightText: 2024-2026 Mag329
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Дополнение схемы существующей базы при запуске.
+
+create_all не добавляет столбцы и индексы в уже созданные таблицы, а
+ревизии alembic у каждой установки свои (autogenerate), поэтому новые
+столбцы и индексы добавляются здесь идемпотентными запросами
+(IF NOT EXISTS) независимо от USE_ALEMBIC. На пустой базе ничего
+не делается: таблицы вместе с индексами создаст create_all.
+"""
+
+import sqlalchemy as db
+from loguru import logger
+
+# Одновременный запуск нескольких процессов бота не должен выполнять шаги дважды
+SCHEMA_LOCK_ID = 7_302_118_018
+
+# Таблицы, где на пользователя приходится одна запись
+ONE_PER_USER = ["settings", "user_data", "auth_data", "premium_subscriptions"]
+# (таблица, имя индекса) — одна запись на пользователя и предмет
+ONE_PER_SUBJECT = [
+    ("gdz", "uq_gdz_user_subject"),
+    ("student_books", "uq_student_books_user_subject"),
+]
+
+
+async def _has_table(conn, table):
+    return (
+        await conn.execute(db.text("SELECT to_regclass(:table)"), {"table": table})
+    ).scalar() is not None
+
+
+async def _has_index(conn, name):
+    return (
+        await conn.execute(db.text("SELECT to_regclass(:name)"), {"name": name})
+    ).scalar() is not None
+
+
+async def _create_unique_index(conn, table, name, columns):
+    """
+    Создаёт уникальный индекс, если в таблице нет дубликатов. Дубликаты
+    не удаляются (в auth_data и premium_subscriptions это токены и баланс):
+    индекс пропускается, а количество групп пишется в лог для ручного разбора.
+    """
+    if await _has_index(conn, name):
+        return True
+
+    column_list = ", ".join(columns)
+    duplicates = (
+        await conn.execute(
+            db.text(
+                f"SELECT count(*) FROM (SELECT 1 FROM {table} "
+                f"WHERE {' AND '.join(f'{column} IS NOT NULL' for column in columns)} "
+                f"GROUP BY {column_list} HAVING count(*) > 1) duplicates"
+            )
+        )
+    ).scalar()
+    if duplicates:
+        logger.error(
+            f"Schema upgrade: {table} has {duplicates} groups of duplicate ({column_list}), "
+            f"unique index {name} not created. Resolve the duplicates manually and restart"
+        )
+        return False
+
+    await conn.execute(db.text(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table} ({column_list})"))
+    logger.info(f"Schema upgrade: created unique index {name}")
+    return True
+
+
+async def _create_index(conn, table, name, columns):
+    if await _has_index(conn, name):
+        return
+    await conn.execute(db.text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+    logger.info(f"Schema upgrade: created index {name}")
+
+
+async def _upgrade_homeworks(conn):
+    # Homework ищется по (subject_id, sha256(task)): индекс по самому тексту
+    # задания упирается в ограничение размера строки btree
+    await conn.execute(db.text("ALTER TABLE homeworks ADD COLUMN IF NOT EXISTS task_hash VARCHAR(64)"))
+
+    # Хэш получает одна (самая старая) запись на каждое задание, id остальных
+    # остаются рабочими для уже отправленных ссылок
+    result = await conn.execute(
+        db.text(
+            """
+            UPDATE homeworks h
+            SET task_hash = encode(sha256(convert_to(h.task, 'UTF8')), 'hex')
+            FROM (
+                SELECT DISTINCT ON (subject_id, task) id
+                FROM homeworks
+                WHERE task_hash IS NULL
+                ORDER BY subject_id, task, id
+            ) first
+            WHERE h.id = first.id
+              AND NOT EXISTS (
+                  SELECT 1 FROM homeworks other
+                  WHERE other.subject_id = h.subject_id
+                    AND other.task_hash = encode(sha256(convert_to(h.task, 'UTF8')), 'hex')
+              )
+            """
+        )
+    )
+    if result.rowcount:
+        logger.info(f"Schema upgrade: backfilled task_hash for {result.rowcount} homeworks")
+
+    await _create_unique_index(
+        conn, "homeworks", "uq_homeworks_subject_task_hash", ["subject_id", "task_hash"]
+    )
+
+
+async def _upgrade_events(conn):
+    await conn.execute(db.text("ALTER TABLE events ADD COLUMN IF NOT EXISTS fingerprint VARCHAR(64)"))
+
+    # Тот же ключ, что и Event.make_fingerprint; без него уже отправленные
+    # уведомления пришли бы пользователям повторно. Дубликаты остаются без
+    # отпечатка и удаляются задачей очистки.
+    result = await conn.execute(
+        db.text(
+            """
+            UPDATE events e
+            SET fingerprint = first.fingerprint
+            FROM (
+                SELECT DISTINCT ON (fingerprint) id, fingerprint
+                FROM (
+                    SELECT id, encode(sha256(convert_to(
+                        student_id || ':' || teacher_id || ':' || event_type || ':'
+                        || to_char(date, 'YYYY-MM-DD"T"HH24:MI:SS'),
+                        'UTF8'
+                    )), 'hex') AS fingerprint
+                    FROM events
+                    WHERE fingerprint IS NULL
+                ) hashed
+                ORDER BY fingerprint, id
+            ) first
+            WHERE e.id = first.id
+              AND NOT EXISTS (
+                  SELECT 1 FROM events other WHERE other.fingerprint = first.fingerprint
+              )
+            """
+        )
+    )
+    if result.rowcount:
+        logger.info(f"Schema upgrade: backfilled fingerprint for {result.rowcount} events")
+
+    await _create_unique_index(conn, "events", "ix_events_fingerprint", ["fingerprint"])
+    await _create_index(conn, "events", "ix_events_date", ["date"])
+
+
+async def upgrade_schema(engine):
+    async with engine.begin() as conn:
+        await conn.execute(db.text("SELECT pg_advisory_xact_lock(:id)"), {"id": SCHEMA_LOCK_ID})
+
+        for table in ONE_PER_USER:
+            if await _has_table(conn, table):
+                await _create_unique_index(conn, table, f"ix_{table}_user_id", ["user_id"])
+
+        for table, name in ONE_PER_SUBJECT:
+            if await _has_table(conn, table):
+                await _create_unique_index(conn, table, name, ["user_id", "subject_id"])
+
+        if await _has_table(conn, "events"):
+            await _create_index(conn, "events", "ix_events_student_id", ["student_id"])
+            await _upgrade_events(conn)
+
+        if await _has_table(conn, "bot_notifications"):
+            await _create_index(
+                conn,
+                "bot_notifications",
+                "ix_bot_notifications_user_id_created_at",
+                ["user_id", "created_at"],
+            )
+
+        if await _has_table(conn, "homeworks"):
+            await _upgrade_homeworks(conn)
@@ -0,0 +1,67 @@
+# SPDX-FileCopyrightText: 2024-2026 Mag329
+#
+# SPDX-License-Identifier: MIT
+
+import asyncio
+from functools import wraps
+
+from loguru import logger
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные вызовы с одинаковым ключом: выполняется
+    только первый, остальные ждут его результат (или его исключение).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: dict = {}
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    async def do(self, key, factory):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            logger.debug(f"Single-flight {self.name}: joined in-flight call")
+
+        # Отмена одного из ожидающих не должна отменять общий вызов
+        return await asyncio.shield(task)
+
+    def __len__(self):
+        return len(self._calls)
+
+
+def single_flight(key=None):
+    """
+    Декоратор для async-функций: одновременные вызовы с одинаковыми
+    аргументами выполняются один раз. key(*args, **kwargs) строит ключ
+    вместо аргументов целиком.
+    """
+
+    def decorator(func):
+        group = SingleFlight(func.__name__)
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            if key is not None:
+                call_key = key(*args, **kwargs)
+            else:
+                call_key = (args, tuple(sorted(kwargs.items())))
+
+            try:
+                hash(call_key)
+            except TypeError:
+                return await func(*args, **kwargs)
+
+            return await group.do(call_key, lambda: func(*args, **kwargs))
+
+        return wrapper
+
+    return decorator
@@ -22,7 +22,7 @@ from app.utils.database import (
     db,
 )
 from app.utils.scheduler import scheduler
-from app.utils.user.cache import redis_client
+from app.utils.user.cache import cache_set, redis_client
 from app.utils.user.decorators import handle_api_error
 
 
@@ -218,7 +218,7 @@ async def get_gdz_answers(user_id, subject_id, homework=None, number=None):
             )
 
     cache_data = {"main_text": main_text, "solutions": solutions}
-    await redis_client.setex(cache_key, DEFAULT_LONG_CACHE_TTL, json.dumps(cache_data))
+    await cache_set(cache_key, DEFAULT_LONG_CACHE_TTL, json.dumps(cache_data), user_id)
     logger.success(f"GDZ answers found and cached for user {user_id}, {len(solutions)} solutions")
 
     return main_text, solutions
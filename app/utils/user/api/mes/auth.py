@@ -16,6 +16,7 @@ from app.keyboards import user as kb
 from app.config.config import LEARNIFY_WEB
 from app.utils.database import get_session, AuthData, User, db
 from app.utils.scheduler import scheduler
+from app.utils.user.identity import invalidate_identity
 from app.utils.user.utils import get_student
 
 
@@ -163,6 +164,7 @@ async def refresh_token(user_id, bot: Bot):
                 need_update_date = await get_token_expire_date(api.token)
                 auth_data.token_expired_at = need_update_date
                 await session.commit()
+                invalidate_identity(user_id)
                 
                 logger.success(f"Token refreshed successfully for user {user_id}, new expiry: {need_update_date}")
 
@@ -0,0 +1,273 @@
+# SPDX-FileCopyrightText: 2024-2026 Mag329
+#
+# SPDX-License-Identifier: MIT
+
+import json
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+from loguru import logger
+
+from app.config.config import CALENDAR_CACHE_TTL, CALENDAR_MEMORY_TTL
+from app.utils.user.api.mes.marks_snapshot import get_academic_year
+from app.utils.user.cache import cache_set, redis_client
+
+CALENDAR_MEMORY_SIZE = 5000
+
+# (class_unit_id, год) -> (expires_at, AcademicCalendar)
+_calendars: OrderedDict = OrderedDict()
+
+
+async def get_quarter_periods(periods_schedules):
+    logger.debug("Calculating quarter periods")
+    quarters = []
+    current_start = None
+
+    sorted_schedules = sorted(periods_schedules, key=lambda x: x.date)
+
+    for item in sorted_schedules:
+        if item.type == "vacation" or (item.title and "каник" in item.title.lower()):
+            if current_start:
+                quarters.append((current_start, item.date - timedelta(days=1)))
+                current_start = None
+        elif item.type in ("workday", "other"):
+            if current_start is None:
+                current_start = item.date
+
+    if current_start:
+        quarters.append((current_start, sorted_schedules[-1].date))
+        logger.debug(f"Final quarter: {current_start} - {sorted_schedules[-1].date}")
+
+    logger.info(f"Found {len(quarters)} quarters")
+    return quarters
+
+
+async def get_half_year_periods(periods_schedules):
+    logger.debug("Calculating half-year periods")
+    
+    quarters = await get_quarter_periods(periods_schedules)
+
+    half_years = []
+
+    if len(quarters) >= 2:
+        half_years.append((quarters[0][0], quarters[1][1]))
+        logger.debug(f"First half-year: {quarters[0][0]} - {quarters[1][1]}")
+
+    if len(quarters) >= 4:
+        half_years.append((quarters[2][0], quarters[3][1]))
+        logger.debug(f"Second half-year: {quarters[2][0]} - {quarters[3][1]}")
+    
+    elif len(quarters) == 3:
+        half_years.append((quarters[2][0], quarters[2][1]))
+        logger.debug(f"Third half-year (partial): {quarters[2][0]} - {quarters[2][1]}")
+
+    logger.info(f"Found {len(half_years)} half-years")
+    return half_years
+
+
+async def get_trimester_periods(periods_schedules):
+    logger.debug("Calculating trimester periods")
+    
+    quarters = await get_quarter_periods(periods_schedules)
+
+    trimesters = []
+
+    if len(quarters) >= 3:
+        trimesters.append((quarters[0][0], quarters[1][1]))
+        trimesters.append((quarters[2][0], quarters[2][1]))
+        logger.debug(f"First trimester: {quarters[0][0]} - {quarters[1][1]}")
+        logger.debug(f"Second trimester: {quarters[2][0]} - {quarters[2][1]}")
+        
+        if len(quarters) >= 4:
+            trimesters.append((quarters[3][0], quarters[3][1]))
+            logger.debug(f"Third trimester: {quarters[3][0]} - {quarters[3][1]}")
+            
+    elif len(quarters) == 2:
+        trimesters = quarters
+        logger.debug(f"Using 2 quarters as trimesters: {quarters[0]} - {quarters[1]}")
+
+    logger.info(f"Found {len(trimesters)} trimesters")
+    return trimesters
+
+
+PERIOD_BUILDERS = {
+    "quarters": get_quarter_periods,
+    "half_years": get_half_year_periods,
+    "trimesters": get_trimester_periods,
+}
+
+
+class CalendarDay:
+    __slots__ = ("date", "type", "title")
+
+    def __init__(self, date, type, title):
+        self.date = date
+        self.type = type
+        self.title = title
+
+
+class AcademicCalendar:
+    """Учебный календарь класса на год с уже посчитанными границами периодов"""
+
+    def __init__(self, year, days):
+        self.year = year
+        self.days = days
+        self._periods = {}
+
+    async def get_periods(self, period_type):
+        if period_type not in PERIOD_BUILDERS:
+            period_type = "quarters"
+
+        if period_type not in self._periods:
+            self._periods[period_type] = await PERIOD_BUILDERS[period_type](self.days)
+        return self._periods[period_type]
+
+    async def get_current_period(self, period_type, today: date = None):
+        today = today or date.today()
+        periods = await self.get_periods(period_type)
+
+        for i, (start_date, end_date) in enumerate(periods, 1):
+            if start_date <= today <= end_date:
+                logger.info(f"Current period: {i} ({start_date} - {end_date})")
+                return i
+
+        for i, (start_date, end_date) in reversed(list(enumerate(periods, 1))):
+            if today > end_date:
+                return i
+
+        logger.warning("Could not determine current period, defaulting to 1")
+        return 1
+
+    async def get_available_periods(self, period_type, current_date: date = None):
+        current_date = current_date or date.today()
+        periods = await self.get_periods(period_type)
+        return [
+            i
+            for i, (period_start, _) in enumerate(periods, 1)
+            if current_date >= period_start
+        ]
+
+    async def get_period_bounds(self, period_type, period_number):
+        """Границы периода; period_number == -1 — весь учебный год"""
+        periods = await self.get_periods(period_type)
+        if not periods:
+            return None
+
+        if period_number == -1:
+            return periods[0][0], periods[-1][1]
+        if 1 <= period_number <= len(periods):
+            return periods[period_number - 1]
+        return None
+
+    def dumps(self):
+        return json.dumps(
+            [[day.date.isoformat(), day.type, day.title] for day in self.days],
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+
+    @classmethod
+    def loads(cls, year, data):
+        return cls(
+            year,
+            [
+                CalendarDay(date.fromisoformat(day), type_, title)
+                for day, type_, title in json.loads(data)
+            ],
+        )
+
+    @classmethod
+    def from_schedules(cls, year, periods_schedules):
+        days = []
+        for item in periods_schedules or []:
+            if item.date is None:
+                continue
+            day = item.date.date() if isinstance(item.date, datetime) else item.date
+            days.append(CalendarDay(day, item.type, item.title))
+
+        days.sort(key=lambda x: x.date)
+        return cls(year, days)
+
+
+def _get_from_memory(key):
+    entry = _calendars.get(key)
+    if entry is None:
+        return None
+
+    expires_at, calendar = entry
+    if expires_at < time.monotonic():
+        del _calendars[key]
+        return None
+
+    _calendars.move_to_end(key)
+    return calendar
+
+
+def _put_to_memory(key, calendar):
+    _calendars[key] = (time.monotonic() + CALENDAR_MEMORY_TTL, calendar)
+    _calendars.move_to_end(key)
+    while len(_calendars) > CALENDAR_MEMORY_SIZE:
+        _calendars.popitem(last=False)
+
+
+async def save_class_unit_id(user_id, class_unit_id):
+    await cache_set(
+        f"class_unit:{user_id}", CALENDAR_CACHE_TTL, str(class_unit_id or 0), user_id
+    )
+
+
+async def get_class_unit_id(api, user):
+    cache_key = f"class_unit:{user.user_id}"
+    cached = await redis_client.get(cache_key)
+    if cached is not None:
+        return int(cached) or None
+
+    profile = await api.get_family_profile(profile_id=user.profile_id)
+    children = profile.children or []
+    child = next((c for c in children if c.id == user.student_id), None)
+    if child is None and children:
+        child = children[0]
+
+    class_unit_id = getattr(child, "class_unit_id", None)
+    await save_class_unit_id(user.user_id, class_unit_id)
+    logger.debug(f"Class unit for user {user.user_id}: {class_unit_id}")
+    return class_unit_id
+
+
+async def get_calendar(api, user, year=None):
+    """
+    Календарь учебного года. Один на класс: ученики одного класса
+    используют общую запись в памяти и в Redis.
+    """
+    year = year or get_academic_year()
+    class_unit_id = await get_class_unit_id(api, user)
+    owner = f"class:{class_unit_id}" if class_unit_id else f"user:{user.user_id}"
+    key = (owner, year)
+
+    calendar = _get_from_memory(key)
+    if calendar is not None:
+        return calendar
+
+    cache_key = f"calendar:{owner}:{year}"
+    cached = await redis_client.get(cache_key)
+    if cached:
+        logger.debug(f"Cache hit for calendar {owner}, year {year}")
+        calendar = AcademicCalendar.loads(year, cached)
+    else:
+        logger.debug(f"Fetching calendar for {owner}, year {year} from API")
+        periods_schedules = await api.get_periods_schedules(
+            student_id=user.student_id,
+            profile_id=user.profile_id,
+            from_date=datetime(year, 9, 1),
+            to_date=datetime(year + 1, 6, 1),
+        )
+        calendar = AcademicCalendar.from_schedules(year, periods_schedules)
+        if class_unit_id:
+            await redis_client.setex(cache_key, CALENDAR_CACHE_TTL, calendar.dumps())
+        else:
+            await cache_set(cache_key, CALENDAR_CACHE_TTL, calendar.dumps(), user.user_id)
+        logger.info(f"Calendar for {owner}, year {year} cached: {len(calendar.days)} days")
+
+    _put_to_memory(key, calendar)
+    return calendar
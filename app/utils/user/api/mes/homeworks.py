@@ -7,33 +7,96 @@ from datetime import datetime, timedelta, timezone
 from loguru import logger
 
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.dialects.postgresql import insert
 
 from app.keyboards import user as kb
 from app.config.config import DEFAULT_SHORT_CACHE_TTL, LEARNIFY_API_TOKEN
 from app.utils.database import get_session, Homework, Settings, db
 from app.utils.misc import has_numbers
-from app.utils.user.cache import get_ttl, redis_client
+from app.utils.singleflight import single_flight
+from app.utils.user.api.mes.prefetch import (
+    EVENTS,
+    HOMEWORKS,
+    SKIP_EMPTY_MAX_DAYS,
+    find_day,
+    get_for_day,
+    get_homeworks_for_range,
+    invalidate_prefetched,
+    shift_to_day,
+)
+from app.utils.user.api.mes.subjects import get_subjects_catalog
+from app.utils.user.cache import cache_get, cache_set, cache_set_swr, get_ttl, is_fresh
 from app.utils.user.decorators import handle_api_error
+from app.utils.user.revalidation import serve_stale
 from app.utils.user.utils import generate_deeplink, get_emoji_subject, get_student
 
-# Temp dicts
-temp_events = {}
 
+async def resolve_homework_ids(tasks):
+    """
+    Id записей Homework для всех заданий экрана: [(subject_id, task)] -> {(subject_id, task): id}.
+    Новые записи создаются одним INSERT ... ON CONFLICT DO NOTHING, id уже
+    существующих читаются одним SELECT.
+    """
+    rows = {(subject_id, Homework.hash_task(task)): (subject_id, task) for subject_id, task in tasks}
+    if not rows:
+        return {}
 
+    async with await get_session() as session:
+        result = await session.execute(
+            insert(Homework)
+            .values(
+                [
+                    {"subject_id": subject_id, "task": task, "task_hash": task_hash}
+                    for (subject_id, task_hash), (_, task) in rows.items()
+                ]
+            )
+            .on_conflict_do_nothing(index_elements=["subject_id", "task_hash"])
+            .returning(Homework.id, Homework.subject_id, Homework.task_hash)
+        )
+        ids = {(subject_id, task_hash): id for id, subject_id, task_hash in result.all()}
+        created = len(ids)
+
+        existing = [key for key in rows if key not in ids]
+        if existing:
+            result = await session.execute(
+                db.select(Homework.id, Homework.subject_id, Homework.task_hash).where(
+                    db.tuple_(Homework.subject_id, Homework.task_hash).in_(existing)
+                )
+            )
+            ids.update(
+                {(subject_id, task_hash): id for id, subject_id, task_hash in result.all()}
+            )
+
+        await session.commit()
+
+    if created:
+        logger.debug(f"Created {created} new Homework records")
+
+    return {rows[key]: id for key, id in ids.items()}
+
+
+@single_flight()
 @handle_api_error()
-async def get_homework(user_id, date_object, direction="right"):
+async def get_homework(user_id, date_object, direction="right", revalidate=False, mark_stale=False):
     logger.info(f"Getting homework for user {user_id}, date: {date_object.strftime('%Y-%m-%d')}, direction: {direction}")
 
     cache_key = f"homeworks:{user_id}:{date_object.strftime('%Y-%m-%d')}:{direction if direction != 'to_date' else 'today'}"
     logger.debug(f"Cache key: {cache_key}")
     
     # Чтение кэша только если это не "to_date"
-    if direction != "to_date":
-        cached_full = await redis_client.get(cache_key)
-        if cached_full:
+    if direction != "to_date" and not revalidate:
+        data = await cache_get(cache_key, json.loads)
+        if data and not is_fresh(data):
+            logger.debug(f"Stale cache hit for homework: user {user_id}, date {date_object.strftime('%Y-%m-%d')}")
+            return serve_stale(
+                cache_key,
+                data,
+                lambda: get_homework(user_id, date_object, direction, revalidate=True),
+                mark=mark_stale,
+            )
+        elif data:
             logger.debug(f"Cache hit for homework: user {user_id}, date {date_object.strftime('%Y-%m-%d')}")
             
-            data = json.loads(cached_full)
             return data["text"], datetime.strptime(data["date"], "%Y-%m-%d")
         else:
             logger.debug(f"Cache miss for homework: user {user_id}, date {date_object.strftime('%Y-%m-%d')}")
@@ -44,6 +107,9 @@ async def get_homework(user_id, date_object, direction="right"):
         return f'❌ <b>Ошибка</b>\n\nНе удалось получить данные ученика', date_object
 
     original_date = date_object
+    if revalidate:
+        # Фоновое обновление должно видеть свежие данные МЭШ
+        invalidate_prefetched(user_id, HOMEWORKS)
 
     async with await get_session() as session:
         result = await session.execute(
@@ -51,79 +117,39 @@ async def get_homework(user_id, date_object, direction="right"):
         )
         settings: Settings = result.scalar_one_or_none()
 
-    logger.debug(f"Fetching schedule for {date_object.strftime('%Y-%m-%d')}")
-    schedule = await api.get_events(
-        person_id=user.person_id,
-        mes_role=user.role,
-        begin_date=date_object,
-        end_date=date_object,
-    )
-
     # Проверка на окончание уроков
-    if (
-        schedule.response
-        and schedule.response[-1].finish_at < datetime.now(timezone.utc)
-        and direction == "today"
-        and settings
-        and settings.next_day_if_lessons_end_homeworks
-    ):
-        old_date = date_object
-        date_object += timedelta(days=1)
-        logger.debug(f"Lessons ended for today, moving to next day: {date_object.strftime('%Y-%m-%d')} (was {old_date.strftime('%Y-%m-%d')})")
-        
-        homework = await api.get_homeworks(
-            student_id=user.student_id,
-            profile_id=user.profile_id,
-            from_date=date_object,
-            to_date=date_object,
-        )
-
-    # Пропуск пустых дней
+    if direction == "today" and settings and settings.next_day_if_lessons_end_homeworks:
+        logger.debug(f"Fetching schedule for {date_object.strftime('%Y-%m-%d')}")
+        schedule = await get_for_day(EVENTS, api, user, date_object)
+
+        if (
+            schedule.response
+            and schedule.response[-1].finish_at < datetime.now(timezone.utc)
+        ):
+            old_date = date_object
+            date_object += timedelta(days=1)
+            logger.debug(f"Lessons ended for today, moving to next day: {date_object.strftime('%Y-%m-%d')} (was {old_date.strftime('%Y-%m-%d')})")
+
+    # Пропуск пустых дней: окно из SKIP_EMPTY_MAX_DAYS дней загружается одним запросом
     if settings.skip_empty_days_homeworks and direction != "to_date":
-        homework_count = 0
-        empty_days = 0
-        original_for_empty = date_object
-        
         logger.debug(f"Checking for empty homework days, starting from {date_object.strftime('%Y-%m-%d')}")
 
-        while homework_count <= 0 and empty_days <= 14:
-            homework = await api.get_homeworks(
-                student_id=user.student_id,
-                profile_id=user.profile_id,
-                from_date=date_object,
-                to_date=date_object,
-            )
-            homework_count = len(homework.payload)
+        step = -1 if direction == "left" else 1
+        found_day, homework = await find_day(
+            HOMEWORKS, api, user, date_object, step, lambda day: bool(day.payload)
+        )
 
-            if homework_count <= 0:
-                empty_days += 1
-                if direction in ["right", "today"]:
-                    date_object += timedelta(days=1)  # Переход вправо
-                else:
-                    date_object -= timedelta(days=1)  # Переход влево
-                logger.debug(f"No homework on {original_for_empty.strftime('%Y-%m-%d')}, moving to {date_object.strftime('%Y-%m-%d')}, empty days: {empty_days}")
-            else:
-                logger.debug(f"Found {homework_count} homeworks on {date_object.strftime('%Y-%m-%d')}")
-                empty_days = 0
-
-        if empty_days > 14:
-            logger.warning(f"Too many empty days ({empty_days}) for user {user_id}, reverting to original date")
-            homework = await api.get_homeworks(
-                student_id=user.student_id,
-                profile_id=user.profile_id,
-                from_date=original_date,
-                to_date=original_date,
-            )
+        if found_day is None:
+            logger.warning(f"No homework within {SKIP_EMPTY_MAX_DAYS} days for user {user_id}, reverting to original date")
+            homework = await get_for_day(HOMEWORKS, api, user, original_date)
             date_object = original_date
+        else:
+            date_object = shift_to_day(date_object, found_day)
+            logger.debug(f"Found {len(homework.payload)} homeworks on {date_object.strftime('%Y-%m-%d')}")
 
     else:
         logger.debug(f"Fetching homework for {date_object.strftime('%Y-%m-%d')}")
-        homework = await api.get_homeworks(
-            student_id=user.student_id,
-            profile_id=user.profile_id,
-            from_date=date_object,
-            to_date=date_object,
-        )
+        homework = await get_for_day(HOMEWORKS, api, user, date_object)
         
     if not homework:
         logger.error(f"No homework data returned for user {user_id}")
@@ -134,6 +160,10 @@ async def get_homework(user_id, date_object, direction="right"):
 
     homework_count = len(homework.payload)
     logger.debug(f"Found {homework_count} homeworks")
+
+    homework_ids = await resolve_homework_ids(
+        [(task.subject_id, task.description.rstrip("\n")) for task in sorted_homeworks]
+    )
     
     for task in sorted_homeworks:
         description = task.description.rstrip("\n")
@@ -147,20 +177,7 @@ async def get_homework(user_id, date_object, direction="right"):
             else f"<i>{description}</i>"
         )
         is_done = task.is_done
-
-        async with await get_session() as session:
-            result = await session.execute(
-                db.select(Homework).filter_by(
-                    task=description, subject_id=task.subject_id
-                )
-            )
-            homework_db = result.scalar_one_or_none()
-            if not homework_db:
-                homework_db = Homework(task=description, subject_id=task.subject_id)
-                session.add(homework_db)
-                await session.commit()
-                await session.refresh(homework_db)
-                logger.debug(f"Created new Homework record for task: {description[:50]}...")
+        homework_id = homework_ids.get((task.subject_id, description))
 
         # Генерация ссылок
         if settings.enable_homework_done_function:
@@ -173,8 +190,8 @@ async def get_homework(user_id, date_object, direction="right"):
         
         if LEARNIFY_API_TOKEN:
             gdz_link = (
-                f'<a href="{await generate_deeplink(f'autogdz-{homework_db.id}')}">⚡</a>'
-                if await has_numbers(description)
+                f'<a href="{await generate_deeplink(f'autogdz-{homework_id}')}">⚡</a>'
+                if homework_id and await has_numbers(description)
                 else ""
             )
 
@@ -192,7 +209,7 @@ async def get_homework(user_id, date_object, direction="right"):
     if date_object == original_date:
         cache_data = {"text": text, "date": date_object.strftime("%Y-%m-%d")}
         ttl = await get_ttl()
-        await redis_client.setex(cache_key, ttl, json.dumps(cache_data))
+        await cache_set_swr(cache_key, ttl, cache_data, user_id, date_object)
         logger.debug(f"Cached homework for user {user_id}, key: {cache_key}, TTL: {ttl}")
 
     logger.info(f"Homework retrieved for user {user_id}, {homework_count} tasks on {date_object.strftime('%Y-%m-%d')}")
@@ -200,6 +217,7 @@ async def get_homework(user_id, date_object, direction="right"):
 
 
 
+@single_flight()
 @handle_api_error()
 async def get_homework_by_subject(user_id, subject_id, date_object):
     logger.info(f"Getting homework by subject for user {user_id}, subject_id: {subject_id}, week starting: {date_object.strftime('%Y-%m-%d')}")
@@ -208,7 +226,7 @@ async def get_homework_by_subject(user_id, subject_id, date_object):
 
     cache_key = f"homework_subject:{user_id}:{subject_id}:{date_object.strftime('%Y-%m-%d')}"
 
-    cache_redis = await redis_client.get(cache_key)
+    cache_redis = await cache_get(cache_key)
     if cache_redis:
         logger.debug(f"Cache hit for subject homework: user {user_id}, subject {subject_id}")
         return cache_redis
@@ -218,37 +236,10 @@ async def get_homework_by_subject(user_id, subject_id, date_object):
         logger.error(f"Failed to get student data for user {user_id}")
         return f'❌ <b>Ошибка</b>\n\nНе удалось получить данные ученика'
 
-    cache = temp_events.get(user_id)
-
-    now = datetime.now()
     begin_date = date_object
     end_date = date_object + timedelta(days=6)
 
-    if (
-        cache is not None
-        and cache["timestamp"] + timedelta(hours=1) > now
-        and cache["begin_date"] <= begin_date
-        and cache["end_date"] >= end_date
-    ):
-        homeworks = cache["data"]
-        logger.debug(f"Using temp cache for user {user_id}, found {len(homeworks.payload)} homeworks")
-
-    else:
-        logger.debug(f"Fetching homeworks from API for week {begin_date.strftime('%Y-%m-%d')} - {end_date.strftime('%Y-%m-%d')}")
-        homeworks = await api.get_homeworks(
-            student_id=user.student_id,
-            profile_id=user.profile_id,
-            from_date=begin_date,
-            to_date=end_date,
-        )
-
-        temp_events[user_id] = {
-            "data": homeworks,
-            "timestamp": now,
-            "begin_date": begin_date,
-            "end_date": end_date,
-        }
-        logger.debug(f"Updated temp cache for user {user_id}")
+    homeworks = await get_homeworks_for_range(api, user, begin_date, end_date)
 
     if not homeworks or not homeworks.payload:
         logger.warning(f"No homework data for user {user_id} in specified week")
@@ -310,18 +301,9 @@ async def get_homework_by_subject(user_id, subject_id, date_object):
     logger.debug(f"Found {total_for_subject} homework entries for subject {subject_id}")
 
     if not subject_name:
-        logger.debug(f"Subject name not found in homework data, fetching from subjects list")
-        subjects = await api.get_subjects(
-            student_id=user.student_id, profile_id=user.profile_id
-        )
-        subject_name = next(
-            (
-                subject.subject_name
-                for subject in subjects.payload
-                if subject.subject_id == subject_id
-            ),
-            None,
-        )
+        logger.debug(f"Subject name not found in homework data, using subjects catalog")
+        catalog = await get_subjects_catalog(user_id, api, user)
+        subject_name = catalog.get_name(subject_id) if catalog else None
 
     # Формирование текста
     text = f"{await get_emoji_subject(subject_name)} <b>{subject_name}</b> {begin_date.strftime("%d %b")} – {end_date.strftime("%d %b")}\n\n"
@@ -329,31 +311,23 @@ async def get_homework_by_subject(user_id, subject_id, date_object):
     days_with_homework = 0
     days_without_homework = 0
 
+    homework_ids = await resolve_homework_ids(
+        [(subject_id, homework["homework"]) for homework in homeworks_list if homework["homework"]]
+    )
+
     for homework in homeworks_list:
         if homework["homework"] or len(homework["materials"]) > 0:
             days_with_homework += 1
             text += f"📅 <b>{homework['date'].strftime('%d %B (%a)')}:</b>\n"
             if homework["homework"]:
                 task = homework["homework"]
-
-                # Работа с БД для домашнего задания
-                async with await get_session() as session:
-                    result = await session.execute(
-                        db.select(Homework).filter_by(task=task, subject_id=subject_id)
-                    )
-                    homework_db = result.scalar_one_or_none()
-                    if not homework_db:
-                        homework_db = Homework(task=task, subject_id=subject_id)
-                        session.add(homework_db)
-                        await session.commit()
-                        await session.refresh(homework_db)
-                        logger.debug(f"Created new Homework record for task: {task[:50]}...")
+                homework_id = homework_ids.get((subject_id, task))
 
                 text += f"    📚 <b>Домашние задание:</b>\n"
                 if LEARNIFY_API_TOKEN:
                     gdz_link = (
-                        f'<a href="{await generate_deeplink(f'autogdz-{homework_db.id}')}">⚡</a>'
-                        if await has_numbers(task)
+                        f'<a href="{await generate_deeplink(f'autogdz-{homework_id}')}">⚡</a>'
+                        if homework_id and await has_numbers(task)
                         else ""
                     )
                     text += f"        - {f'<code>{task}</code>' if 'https://' not in task else f'<i>{task}</i>'} {gdz_link}\n"
@@ -379,7 +353,9 @@ async def get_homework_by_subject(user_id, subject_id, date_object):
     else:
         logger.info(f"Subject homework formatted: {days_with_homework} days with homework, {days_without_homework} without")
 
-    await redis_client.setex(cache_key, DEFAULT_SHORT_CACHE_TTL, text)
+    # Запись зависит от всех дней недели, поэтому регистрируем её в индексе каждого дня
+    week_days = [begin_date + timedelta(days=i) for i in range(7)]
+    await cache_set(cache_key, DEFAULT_SHORT_CACHE_TTL, text, user_id, *week_days)
     logger.debug(f"Cached subject homework for user {user_id}, key: {cache_key}, TTL: {DEFAULT_SHORT_CACHE_TTL}")
 
     return text
@@ -392,6 +368,7 @@ async def handle_homework_navigation(
     subject_mode: bool = False,
     date: datetime = None,
     subject_id=None,
+    mark_stale: bool = False,
 ):
     logger.info(f"Handling homework navigation for user {user_id}, direction={direction}, subject_mode={subject_mode}")
     
@@ -425,7 +402,7 @@ async def handle_homework_navigation(
         markup = kb.subject_homework
     else:
         logger.debug(f"Getting homework for date {date.strftime('%Y-%m-%d')}")
-        text, date = await get_homework(user_id, date, direction)
+        text, date = await get_homework(user_id, date, direction, mark_stale=mark_stale)
         markup = kb.homework
 
     logger.info(f"Homework navigation successful for user {user_id}")
@@ -3,14 +3,14 @@
 # SPDX-License-Identifier: MIT
 
 from datetime import datetime, timedelta, timezone
-import json
 from loguru import logger
 
 from aiogram.fsm.context import FSMContext
 
 from app.keyboards import user as kb
-from app.config.config import DEFAULT_LONG_CACHE_TTL
-from app.utils.user.cache import redis_client
+from app.utils.singleflight import single_flight
+from app.utils.user.api.mes.marks_snapshot import get_marks_snapshot
+from app.utils.user.cache import cache_get, cache_set
 from app.utils.user.decorators import handle_api_error
 from app.utils.user.utils import (
     generate_deeplink,
@@ -20,6 +20,7 @@ from app.utils.user.utils import (
 )
 
 
+@single_flight()
 @handle_api_error()
 async def get_marks(user_id, date_object):
     logger.info(f"Getting marks for user {user_id}, date: {date_object.strftime('%Y-%m-%d')}")
@@ -28,7 +29,7 @@ async def get_marks(user_id, date_object):
     logger.debug(f"Cache key: {cache_key}")
 
     # Пытаемся получить данные из кэша
-    cached_text = await redis_client.get(cache_key)
+    cached_text = await cache_get(cache_key)
     if cached_text:
         logger.debug(
             f"Cache hit for marks: user {user_id}, date {date_object.strftime('%Y-%m-%d')}"
@@ -75,42 +76,30 @@ async def get_marks(user_id, date_object):
 
     logger.info(f"Successfully formatted {marks_count} marks for user {user_id}")
     
-    await redis_client.setex(cache_key, 7200, text)
+    await cache_set(cache_key, 7200, text, user_id, date_object)
     logger.debug(f"Cached marks for user {user_id} with TTL 7200s")
     
     return text
 
 
+@single_flight()
 @handle_api_error()
 async def get_marks_by_subject(user_id, subject_id, need_period=False, all_=False):
     logger.info(f"Getting marks by subject for user {user_id}, subject_id: {subject_id}")
     
-    current_period_cache_key = f"current_period:{user_id}:{subject_id}"
-    
-    if not need_period:
-        if await redis_client.exists(current_period_cache_key):
-            current_period = int(await redis_client.get(current_period_cache_key))
-            need_period = current_period
-        
-    cache_key = f"marks_subject:{user_id}:{subject_id}:{need_period}"
-        
-    if need_period and not all_:
-        cached = await redis_client.get(cache_key)
-        if cached:
-            logger.debug(f"Cache key: {cache_key}")
-            data = json.loads(cached)
-            return data['text'], data['periods']
-        
-    
-    api, user = await get_student(user_id)
-    if not api or not user:
-        logger.error(f"Failed to get student data for user {user_id}")
-        return f'❌ <b>Ошибка</b>\n\nНе удалось получить данные ученика', []
+    snapshot = await get_marks_snapshot(user_id)
+    marks_for_subject = snapshot.get_subject(subject_id=subject_id) if snapshot else None
 
-    logger.debug(f"Fetching marks for subject {subject_id} from API")
-    marks_for_subject = await api.get_subject_marks_for_subject(
-        student_id=user.student_id, profile_id=user.profile_id, subject_id=subject_id
-    )
+    if not marks_for_subject:
+        api, user = await get_student(user_id)
+        if not api or not user:
+            logger.error(f"Failed to get student data for user {user_id}")
+            return f'❌ <b>Ошибка</b>\n\nНе удалось получить данные ученика', []
+
+        logger.debug(f"Subject {subject_id} not in marks snapshot, fetching from API")
+        marks_for_subject = await api.get_subject_marks_for_subject(
+            student_id=user.student_id, profile_id=user.profile_id, subject_id=subject_id
+        )
 
     if not marks_for_subject:
         logger.warning(f"No data returned for subject {subject_id}")
@@ -124,6 +113,7 @@ async def get_marks_by_subject(user_id, subject_id, need_period=False, all_=Fals
         return text, []
     
     period_num = 0
+    current_period = None
     now = datetime.now()
     
     
@@ -137,9 +127,8 @@ async def get_marks_by_subject(user_id, subject_id, need_period=False, all_=Fals
         
         period_num += 1
         
-        if period.start < now < period.end:            
+        if period.start and period.end and period.start < now < period.end:
             current_period = period_num
-            await redis_client.setex(current_period_cache_key, DEFAULT_LONG_CACHE_TTL, str(current_period))
 
             if not need_period:
                 need_period = current_period
@@ -205,14 +194,6 @@ async def get_marks_by_subject(user_id, subject_id, need_period=False, all_=Fals
 
     logger.info(f"Successfully formatted marks for subject {marks_for_subject.subject_name}: period {period_num}, {marks_count} total marks")
     
-    cache_data = {
-        'text': text,
-        'periods': periods
-    }
-    
-    await redis_client.setex(cache_key, 7200, json.dumps(cache_data, ensure_ascii=False))
-    logger.debug(f"Cached marks by subject for user {user_id} with TTL 7200s")
-    
     return text, periods
 
 
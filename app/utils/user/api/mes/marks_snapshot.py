@@ -0,0 +1,253 @@
+# SPDX-FileCopyrightText: 2024-2026 Mag329
+#
+# SPDX-License-Identifier: MIT
+
+import json
+from datetime import date, datetime
+
+from loguru import logger
+
+from app.config.config import MARKS_SNAPSHOT_TTL
+from app.utils.user.cache import cache_set, redis_client
+from app.utils.user.utils import get_student
+
+MARK_EVENTS = {"create_mark", "update_mark", "delete_mark"}
+PERIOD_TYPES = ("quarters", "half_years", "trimesters")
+
+
+def get_academic_year(today: date = None):
+    today = today or date.today()
+    return today.year if today >= date(today.year, 9, 1) else today.year - 1
+
+
+def _parse_dt(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    try:
+        # Сравниваем с datetime.now(), поэтому храним наивное локальное время
+        return datetime.fromisoformat(str(value)).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def _dump_dt(value):
+    value = _parse_dt(value)
+    return value.isoformat() if value else None
+
+
+class SnapshotMark:
+    __slots__ = ("value", "weight", "date", "control_form_name", "comment")
+
+    def __init__(self, value, weight, date, control_form_name, comment):
+        self.value = value
+        self.weight = weight
+        self.date = date
+        self.control_form_name = control_form_name
+        self.comment = comment
+
+
+class SnapshotPeriod:
+    __slots__ = ("title", "start", "end", "value", "marks")
+
+    def __init__(self, title, start, end, value, marks):
+        self.title = title
+        self.start = start
+        self.end = end
+        self.value = value
+        self.marks = marks
+
+
+class SnapshotSubject:
+    __slots__ = ("subject_id", "subject_name", "average", "periods")
+
+    def __init__(self, subject_id, subject_name, average, periods):
+        self.subject_id = subject_id
+        self.subject_name = subject_name
+        self.average = average
+        self.periods = periods
+
+
+def _pack_subject(subject):
+    """Компактное представление предмета для Redis (ответ МЭШ -> списки)"""
+    periods = []
+    for period in subject.periods or []:
+        if not period:
+            continue
+        periods.append(
+            [
+                period.title,
+                _dump_dt(getattr(period, "start_iso", None) or period.start),
+                _dump_dt(getattr(period, "end_iso", None) or period.end),
+                period.value,
+                [
+                    [
+                        mark.value,
+                        mark.weight,
+                        _dump_dt(mark.date),
+                        mark.control_form_name,
+                        mark.comment,
+                    ]
+                    for mark in period.marks or []
+                ],
+            ]
+        )
+    return [subject.subject_id, subject.subject_name, subject.average, periods]
+
+
+def _unpack_subject(data):
+    subject_id, subject_name, average, periods = data
+    return SnapshotSubject(
+        subject_id,
+        subject_name,
+        average,
+        [
+            SnapshotPeriod(
+                title,
+                _parse_dt(start),
+                _parse_dt(end),
+                value,
+                [
+                    SnapshotMark(value_, weight, _parse_dt(date_), form, comment)
+                    for value_, weight, date_, form, comment in marks
+                ],
+            )
+            for title, start, end, value, marks in periods
+        ],
+    )
+
+
+class MarksSnapshot:
+    """Оценки ученика по всем предметам за учебный год"""
+
+    def __init__(self, year, packed_subjects):
+        self.year = year
+        self.packed_subjects = packed_subjects
+        self.subjects = [_unpack_subject(item) for item in packed_subjects]
+
+    def get_subject(self, subject_id=None, subject_name=None):
+        for subject in self.subjects:
+            if subject_id is not None and subject.subject_id == subject_id:
+                return subject
+            if subject_name is not None and subject.subject_name == subject_name:
+                return subject
+        return None
+
+    def detect_period_type(self):
+        """Определяет тип учебных периодов по названиям периодов в оценках"""
+        periods = next(
+            (subject.periods for subject in self.subjects if subject.periods), []
+        )
+        period_titles = [p.title.lower() for p in periods if p.title]
+        logger.debug(f"Period titles found: {period_titles}")
+
+        if any("полугодие" in title for title in period_titles):
+            return "half_years"
+        elif any("триместр" in title for title in period_titles):
+            return "trimesters"
+        elif any("четверть" in title for title in period_titles):
+            return "quarters"
+
+        # Fallback based on number of periods
+        logger.warning(f"Could not detect period type by title, using count: {len(periods)}")
+        if len(periods) <= 2:
+            return "half_years"
+        elif len(periods) == 3:
+            return "trimesters"
+        return "quarters"
+
+    def dumps(self):
+        return json.dumps(self.packed_subjects, ensure_ascii=False, separators=(",", ":"))
+
+
+def get_snapshot_key(user_id, year):
+    return f"marks_snapshot:{user_id}:{year}"
+
+
+async def get_marks_snapshot(user_id, api=None, user=None, force=False):
+    year = get_academic_year()
+    cache_key = get_snapshot_key(user_id, year)
+
+    if not force:
+        cached = await redis_client.get(cache_key)
+        if cached:
+            logger.debug(f"Cache hit for marks snapshot: user {user_id}, year {year}")
+            return MarksSnapshot(year, json.loads(cached))
+
+    if api is None or user is None:
+        api, user = await get_student(user_id)
+        if not api or not user:
+            logger.error(f"Failed to get student data for user {user_id}")
+            return None
+
+    logger.debug(f"Fetching marks snapshot from API for user {user_id}")
+    subjects_marks = await api.get_subjects_marks(
+        profile_id=user.profile_id, student_id=user.student_id
+    )
+
+    snapshot = MarksSnapshot(
+        year, [_pack_subject(subject) for subject in subjects_marks.payload or []]
+    )
+    await cache_set(cache_key, MARKS_SNAPSHOT_TTL, snapshot.dumps(), user_id)
+    logger.info(f"Marks snapshot saved for user {user_id}: {len(snapshot.subjects)} subjects")
+
+    return snapshot
+
+
+async def refresh_marks_snapshot(user_id, subject_names):
+    """
+    Обновляет в снимке только предметы, по которым пришли уведомления об оценках.
+    Если снимка ещё нет, ничего не делает — он будет загружен при первом запросе.
+    """
+    year = get_academic_year()
+    cache_key = get_snapshot_key(user_id, year)
+
+    try:
+        cached = await redis_client.get(cache_key)
+        if not cached:
+            return
+
+        packed_subjects = json.loads(cached)
+
+        api, user = await get_student(user_id)
+        if not api or not user:
+            return
+
+        for subject_name in subject_names:
+            marks_for_subject = await api.get_subject_marks_for_subject(
+                student_id=user.student_id,
+                profile_id=user.profile_id,
+                subject_name=subject_name,
+            )
+            if not marks_for_subject:
+                continue
+
+            packed = _pack_subject(marks_for_subject)
+            index = next(
+                (i for i, item in enumerate(packed_subjects) if item[1] == subject_name),
+                None,
+            )
+            if index is None:
+                packed_subjects.append(packed)
+            else:
+                # В ответе for_subject может не быть subject_id
+                packed[0] = packed[0] or packed_subjects[index][0]
+                packed_subjects[index] = packed
+
+        snapshot = MarksSnapshot(year, packed_subjects)
+        await redis_client.set(cache_key, snapshot.dumps(), keepttl=True)
+
+        # Итоги считаются из снимка, поэтому старые итоги больше не актуальны
+        await redis_client.delete(
+            *(
+                f"results:{user_id}:{period_type}:{number}"
+                for period_type in PERIOD_TYPES
+                for number in (-1, 1, 2, 3, 4)
+            )
+        )
+        logger.info(f"Marks snapshot refreshed for user {user_id}: {', '.join(subject_names)}")
+    except Exception as e:
+        logger.error(f"Error refreshing marks snapshot for user {user_id}: {e}")
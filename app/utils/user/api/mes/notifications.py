@@ -3,14 +3,23 @@
 # SPDX-License-Identifier: MIT
 
 import asyncio
+from datetime import datetime, timedelta
 from loguru import logger
 
 from octodiary.exceptions import APIError
+from sqlalchemy.dialects.postgresql import insert
 
 from app.keyboards import user as kb
-from app.config.config import ERROR_403_MESSAGE, ERROR_MESSAGE
+from app.config.config import ERROR_403_MESSAGE, ERROR_MESSAGE, EVENTS_RETENTION_DAYS
 from app.utils.database import get_session, Event, Settings, db
+from app.utils.log import DEBUG_ENABLED
+from app.utils.user.api.mes.marks_snapshot import (
+    MARK_EVENTS,
+    refresh_marks_snapshot,
+)
+from app.utils.user.api.mes.prefetch import publish_prefetch_invalidation
 from app.utils.user.cache import invalidate_cache_for_notification
+from app.utils.user.polling import mark_user_activity
 from app.utils.user.utils import (
     get_emoji_subject,
     get_mark_with_weight,
@@ -56,52 +65,67 @@ async def get_notifications(user_id, all=True, is_checker=False):
                 )
             ).scalar_one_or_none()
 
-            logger.debug(f"Fetching existing events for student {notifications[0].student_profile_id}")
-            
-            events = (
-                (
-                    await session.execute(
-                        db.select(Event).filter(
-                            Event.student_id == notifications[0].student_profile_id
-                        )
+            # Уведомления старше окна хранения событий считаются уже отправленными
+            cutoff = datetime.now() - timedelta(days=EVENTS_RETENTION_DAYS)
+            recent = {}
+            for n in notifications:
+                if n.created_at.replace(tzinfo=None) < cutoff:
+                    continue
+                fingerprint = Event.make_fingerprint(
+                    n.student_profile_id, n.author_profile_id, n.event_type, n.created_at
+                )
+                recent.setdefault(fingerprint, n)
+
+            # Новые события — те, что вставились; уже известные отсекает уникальный индекс
+            inserted = set()
+            if recent:
+                result = await session.execute(
+                    insert(Event)
+                    .values(
+                        [
+                            {
+                                "student_id": n.student_profile_id,
+                                "event_type": n.event_type,
+                                "subject_name": n.subject_name,
+                                "date": n.created_at,
+                                "teacher_id": n.author_profile_id,
+                                "fingerprint": fingerprint,
+                            }
+                            for fingerprint, n in recent.items()
+                        ]
                     )
+                    .on_conflict_do_nothing(index_elements=["fingerprint"])
+                    .returning(Event.fingerprint)
                 )
-                .scalars()
-                .all()
-            )
+                inserted = set(result.scalars().all())
 
-            existing = {(e.teacher_id, e.event_type, e.date) for e in events}
-            logger.debug(f"Found {len(existing)} existing events")
+            new_notifications = [
+                n for fingerprint, n in recent.items() if fingerprint in inserted
+            ]
+            cache_invalidation_tasks = [
+                invalidate_cache_for_notification(user_id, n) for n in new_notifications
+            ]
 
-            new_notifications = []
-            cache_invalidation_tasks = []
-            new_events_count = 0
+            logger.debug(f"Found {len(new_notifications)} new notifications out of {len(recent)} recent")
+            await session.commit()
 
-            for n in notifications:
-                key = (n.author_profile_id, n.event_type, n.created_at)
-                if key not in existing:
-                    new_notifications.append(n)
-                    session.add(
-                        Event(
-                            student_id=n.student_profile_id,
-                            event_type=n.event_type,
-                            subject_name=n.subject_name,
-                            date=n.created_at,
-                            teacher_id=n.author_profile_id,
-                        )
-                    )
-                    new_events_count += 1
-                    cache_invalidation_tasks.append(
-                        invalidate_cache_for_notification(user_id, n)
-                    )
+            if new_notifications:
+                # Сначала загруженные ответы МЭШ во всех процессах, затем отрисовки
+                await publish_prefetch_invalidation(user_id)
 
-            logger.debug(f"Found {new_events_count} new notifications to save")
-            await session.commit()
-            
             if cache_invalidation_tasks:
                 for task in cache_invalidation_tasks:
                     asyncio.create_task(task)
 
+        if new_notifications:
+            await mark_user_activity(user_id)
+
+            changed_subjects = sorted(
+                {n.subject_name for n in new_notifications if n.event_type in MARK_EVENTS}
+            )
+            if changed_subjects:
+                asyncio.create_task(refresh_marks_snapshot(user_id, changed_subjects))
+
         if not all:
             notifications = new_notifications
             logger.debug(f"Filtered to only new notifications: {len(notifications)}")
@@ -158,7 +182,8 @@ async def get_notifications(user_id, all=True, is_checker=False):
                 detail = f"<b>{action}:</b>\n            <i><code>{n.new_hw_description.rstrip()}</code></i>"
                 processed_types[n.event_type] = processed_types.get(n.event_type, 0) + 1
             else:
-                logger.debug(f"Skipping unknown event type: {n.event_type}")
+                if DEBUG_ENABLED:
+                    logger.debug(f"Skipping unknown event type: {n.event_type}")
                 continue
 
             text += f"{subject}{detail}\n\n"
@@ -168,17 +193,50 @@ async def get_notifications(user_id, all=True, is_checker=False):
 
     except APIError as e:
         logger.error(f"APIError ({e.status_code}) for user {user_id} in get_notifications: {e}")
-        if not is_checker:
-            msg = ERROR_403_MESSAGE if e.status_code in [401, 403] else ERROR_MESSAGE
-            await user_send_message(
-                user_id,
-                msg,
-                kb.reauth if e.status_code in [401, 403] else kb.delete_message,
-            )
+        if is_checker:
+            # Проверка должна знать, что опрос не удался (см. mark_polled)
+            raise
+        msg = ERROR_403_MESSAGE if e.status_code in [401, 403] else ERROR_MESSAGE
+        await user_send_message(
+            user_id,
+            msg,
+            kb.reauth if e.status_code in [401, 403] else kb.delete_message,
+        )
         return None
     
+    except db.exc.ProgrammingError as e:
+        # Ошибка схемы (например, нет events.fingerprint) касается всех
+        # пользователей сразу: не глотаем её, чтобы проверка падала явно
+        logger.critical(f"Database schema error in get_notifications: {e}")
+        raise
+
     except Exception as e:
         logger.exception(f"Unexpected error in get_notifications for user {user_id}: {e}")
-        if not is_checker:
-            await user_send_message(user_id, ERROR_MESSAGE, kb.delete_message)
+        if is_checker:
+            raise
+        await user_send_message(user_id, ERROR_MESSAGE, kb.delete_message)
         return None
+
+
+async def prune_old_events(batch_size=10000):
+    """Удаляет события старше окна дедупликации (пачками, чтобы не держать долгие блокировки)"""
+    cutoff = datetime.now() - timedelta(days=EVENTS_RETENTION_DAYS)
+    deleted = 0
+
+    while True:
+        async with await get_session() as session:
+            result = await session.execute(
+                db.delete(Event).where(
+                    Event.id.in_(
+                        db.select(Event.id).where(Event.date < cutoff).limit(batch_size)
+                    )
+                )
+            )
+            await session.commit()
+
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            break
+
+    logger.info(f"Pruned {deleted} events older than {cutoff.strftime('%Y-%m-%d')}")
+    return deleted
@@ -0,0 +1,308 @@
+# SPDX-FileCopyrightText: 2024-2026 Mag329
+#
+# SPDX-License-Identifier: MIT
+
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+from loguru import logger
+
+from app.config.config import PREFETCH_CACHE_SIZE, PREFETCH_TTL
+from app.utils.singleflight import SingleFlight
+from app.utils.user.cache import publish_invalidation
+
+HOMEWORKS = "homeworks"
+EVENTS = "events"
+SCHEDULE = "schedule"
+
+# Ключи в канале cache:invalidate: prefetch:{user_id} или prefetch:{user_id}:{kind}
+PREFETCH_INVALIDATION_PREFIX = "prefetch:"
+
+# Сколько дней просматривать при пропуске пустых дней
+SKIP_EMPTY_MAX_DAYS = 14
+# Веб-расписание загружается по одному запросу на день, поэтому warm_up
+# подгружает только соседние дни, а не неделю
+SCHEDULE_WARM_UP_DAYS = 1
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def get_week_bounds(day):
+    day = _as_date(day)
+    monday = day - timedelta(days=day.weekday())
+    return monday, monday + timedelta(days=6)
+
+
+def _as_datetime(day: date):
+    return datetime(day.year, day.month, day.day)
+
+
+class PrefetchCache:
+    """
+    Ответы МЭШ, разложенные по дням, в памяти процесса.
+    LRU по пользователям, у каждого дня свой срок жизни.
+    """
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._users: OrderedDict[int, dict] = OrderedDict()
+
+    def get(self, user_id, kind, day):
+        days = self._users.get(user_id)
+        if days is None:
+            return None
+
+        entry = days.get((kind, day))
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del days[(kind, day)]
+            return None
+
+        self._users.move_to_end(user_id)
+        return value
+
+    def put(self, user_id, kind, values: dict):
+        days = self._users.setdefault(user_id, {})
+        expires_at = time.monotonic() + self.ttl
+        for day, value in values.items():
+            days[(kind, day)] = (expires_at, value)
+
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.maxsize:
+            self._users.popitem(last=False)
+
+    def invalidate(self, user_id, kind=None):
+        if kind is None:
+            self._users.pop(user_id, None)
+            return
+
+        days = self._users.get(user_id)
+        if days:
+            for key in [key for key in days if key[0] == kind]:
+                del days[key]
+
+    def clear(self):
+        self._users.clear()
+
+
+prefetch_cache = PrefetchCache(PREFETCH_CACHE_SIZE, PREFETCH_TTL)
+_prefetches = SingleFlight("prefetch")
+
+
+def _split_by_day(response, field, item_date, begin, end):
+    """Раскладывает ответ за диапазон на копии ответа для каждого дня"""
+    by_day = {begin + timedelta(days=i): [] for i in range((end - begin).days + 1)}
+    for item in getattr(response, field) or []:
+        day = _as_date(item_date(item))
+        if day in by_day:
+            by_day[day].append(item)
+
+    return {
+        day: response.model_copy(update={field: items})
+        for day, items in by_day.items()
+    }
+
+
+async def _fetch_week_homeworks(api, user, begin, end):
+    logger.debug(f"Prefetching homeworks for user {user.user_id}: {begin} - {end}")
+    response = await api.get_homeworks(
+        student_id=user.student_id,
+        profile_id=user.profile_id,
+        from_date=_as_datetime(begin),
+        to_date=_as_datetime(end),
+    )
+    if response is None:
+        return {}
+    return _split_by_day(
+        response, "payload", lambda item: item.date_prepared_for, begin, end
+    )
+
+
+async def _fetch_week_events(api, user, begin, end):
+    logger.debug(f"Prefetching events for user {user.user_id}: {begin} - {end}")
+    response = await api.get_events(
+        person_id=user.person_id,
+        mes_role=user.role,
+        begin_date=_as_datetime(begin),
+        end_date=_as_datetime(end),
+    )
+    if response is None:
+        return {}
+    return _split_by_day(response, "response", lambda item: item.start_at, begin, end)
+
+
+async def _fetch_week_schedule(web_api, user, begin, end):
+    # Веб-расписание отдаётся только за один день: загружаем параллельно
+    # только те дни диапазона, которых ещё нет в памяти
+    days = [
+        day
+        for day in (begin + timedelta(days=i) for i in range((end - begin).days + 1))
+        if prefetch_cache.get(user.user_id, SCHEDULE, day) is None
+    ]
+    logger.debug(f"Prefetching schedule for user {user.user_id}: {len(days)} days in {begin} - {end}")
+    schedules = await asyncio.gather(
+        *(
+            web_api.get_schedule(student_id=user.student_id, date=_as_datetime(day))
+            for day in days
+        )
+    )
+    return {
+        day: schedule for day, schedule in zip(days, schedules) if schedule is not None
+    }
+
+
+FETCHERS = {
+    HOMEWORKS: _fetch_week_homeworks,
+    EVENTS: _fetch_week_events,
+    SCHEDULE: _fetch_week_schedule,
+}
+
+
+def _missing_days(user_id, kind, begin, end):
+    days = (begin + timedelta(days=i) for i in range((end - begin).days + 1))
+    return [day for day in days if prefetch_cache.get(user_id, kind, day) is None]
+
+
+async def prefetch_range(kind, api, user, begin, end):
+    """
+    Загружает диапазон дат одним запросом и раскладывает его по дням.
+    Дни, уже лежащие в памяти, не запрашиваются: диапазон сужается
+    до отсутствующих, а если все есть — запроса нет.
+    """
+    missing = _missing_days(user.user_id, kind, _as_date(begin), _as_date(end))
+    if not missing:
+        return
+    begin, end = missing[0], missing[-1]
+
+    async def fetch():
+        values = await FETCHERS[kind](api, user, begin, end)
+        prefetch_cache.put(user.user_id, kind, values)
+
+    await _prefetches.do((kind, user.user_id, begin, end), fetch)
+
+
+async def prefetch_week(kind, api, user, day):
+    """Загружает неделю, в которую входит day"""
+    await prefetch_range(kind, api, user, *get_week_bounds(day))
+
+
+async def get_for_day(kind, api, user, day):
+    """
+    Ответ МЭШ за один день: из памяти, а при промахе — загрузкой всей недели.
+    Для SCHEDULE в api передаётся веб-клиент; расписание при промахе
+    загружается только за этот день, неделю подгружает warm_up.
+    """
+    day = _as_date(day)
+    value = prefetch_cache.get(user.user_id, kind, day)
+    if value is None:
+        if kind == SCHEDULE:
+            await prefetch_range(kind, api, user, day, day)
+        else:
+            await prefetch_week(kind, api, user, day)
+        value = prefetch_cache.get(user.user_id, kind, day)
+    return value
+
+
+async def find_day(kind, api, user, start, step, predicate, max_days=SKIP_EMPTY_MAX_DAYS):
+    """
+    Ищет ближайший день от start (включительно) в сторону step (+1/-1),
+    для которого predicate(ответ за день) истинен. Все дни окна загружаются
+    одним запросом за диапазон. Возвращает (день, ответ) или (None, None).
+    """
+    start = _as_date(start)
+    days = [start + timedelta(days=step * i) for i in range(max_days + 1)]
+
+    await prefetch_range(kind, api, user, min(days), max(days))
+
+    for day in days:
+        value = prefetch_cache.get(user.user_id, kind, day)
+        if value is not None and predicate(value):
+            return day, value
+
+    return None, None
+
+
+def shift_to_day(date_object: datetime, day: date):
+    """Переносит datetime на другой день, сохраняя время"""
+    return date_object + timedelta(days=(day - _as_date(date_object)).days)
+
+
+async def get_homeworks_for_range(api, user, begin, end):
+    """Домашние задания за диапазон дат одним ответом"""
+    begin, end = _as_date(begin), _as_date(end)
+    days = [
+        await get_for_day(HOMEWORKS, api, user, begin + timedelta(days=i))
+        for i in range((end - begin).days + 1)
+    ]
+    days = [day for day in days if day is not None]
+    if not days:
+        return None
+
+    return days[0].model_copy(
+        update={"payload": [item for day in days for item in day.payload or []]}
+    )
+
+
+def invalidate_prefetched(user_id, kind=None):
+    """Сбрасывает загруженные ответы только в памяти этого процесса"""
+    prefetch_cache.invalidate(user_id, kind)
+
+
+async def publish_prefetch_invalidation(user_id, kind=None):
+    """
+    Сбрасывает загруженные ответы во всех процессах бота. Вызывается до
+    инвалидации отрисованных записей, иначе другой процесс успеет заново
+    отрисовать и закэшировать старые данные.
+    """
+    key = f"{PREFETCH_INVALIDATION_PREFIX}{user_id}"
+    if kind is not None:
+        key += f":{kind}"
+    await publish_invalidation([key])
+    invalidate_prefetched(user_id, kind)
+
+
+def apply_prefetch_invalidation(keys):
+    """Применяет ключи prefetch:* из канала инвалидации"""
+    for key in keys:
+        if not key.startswith(PREFETCH_INVALIDATION_PREFIX):
+            continue
+        user_id, _, kind = key[len(PREFETCH_INVALIDATION_PREFIX):].partition(":")
+        invalidate_prefetched(int(user_id), kind or None)
+
+
+async def warm_up(user_id, kind, day):
+    """
+    Загружает в фоне то, что понадобится для ⬅️/➡️: неделю после day,
+    а для расписания — только соседние дни. Загруженное раньше не запрашивается.
+    """
+    from app.utils.user.utils import get_student, get_web_api
+
+    try:
+        if kind == SCHEDULE:
+            api, user = await get_web_api(user_id)
+        else:
+            api, user = await get_student(user_id)
+        if not api or not user:
+            return
+
+        day = _as_date(day)
+        if kind == SCHEDULE:
+            await prefetch_range(
+                kind,
+                api,
+                user,
+                day - timedelta(days=SCHEDULE_WARM_UP_DAYS),
+                day + timedelta(days=SCHEDULE_WARM_UP_DAYS),
+            )
+        else:
+            await prefetch_week(kind, api, user, day + timedelta(days=7))
+    except Exception as e:
+        logger.debug(f"Prefetch warm-up failed for user {user_id}: {e}")
@@ -7,10 +7,12 @@ from loguru import logger
 
 from app.config.config import DEFAULT_LONG_CACHE_TTL
 from app.utils.database import get_session, UserData, db
+from app.utils.singleflight import single_flight
 from app.utils.user.decorators import cache_text_only, handle_api_error
 from app.utils.user.utils import get_student, parse_and_format_phone
 
 
+@single_flight()
 @handle_api_error()
 @cache_text_only(DEFAULT_LONG_CACHE_TTL)
 async def get_profile(user_id):
@@ -5,10 +5,12 @@
 from collections import defaultdict
 from loguru import logger
 
+from app.utils.singleflight import single_flight
 from app.utils.user.decorators import cache_text_only, handle_api_error
 from app.utils.user.utils import get_student
 
 
+@single_flight()
 @handle_api_error()
 @cache_text_only()
 async def get_rating_rank_class(user_id):
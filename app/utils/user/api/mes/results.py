@@ -2,29 +2,38 @@
 #
 # SPDX-License-Identifier: MIT
 
+import asyncio
 import json
 from collections import Counter, defaultdict
 from datetime import date, datetime, time, timedelta
 from statistics import median, mode
+from time import monotonic
 
 from octodiary.exceptions import APIError
 from loguru import logger
 
+from app.config.config import RESULTS_STATE_OVERLAP_DAYS, RESULTS_STATE_TTL
 from app.utils.database import get_session, Settings, db
-from app.utils.user.cache import get_ttl, redis_client
+from app.utils.log import DEBUG_ENABLED
+from app.utils.singleflight import single_flight
+from app.utils.user.api.mes.calendar import get_calendar
+from app.utils.user.api.mes.marks_snapshot import get_marks_snapshot
+from app.utils.user.cache import cache_set, get_ttl, redis_client
 from app.utils.user.decorators import handle_api_error
 from app.utils.user.utils import get_emoji_subject, get_student
 
 
 async def time_to_minutes(duration):
-    logger.debug(f"Converting duration to minutes: {duration}")
+    if DEBUG_ENABLED:
+        logger.debug(f"Converting duration to minutes: {duration}")
     try:
         if "ч." in duration:
             hours, minutes = map(int, duration.split(" ч."))
             minutes += hours * 60
         else:
             minutes = int(duration) * 60
-        logger.debug(f"Converted to {minutes} minutes")
+        if DEBUG_ENABLED:
+            logger.debug(f"Converted to {minutes} minutes")
         return minutes
     except Exception as e:
         logger.error(f"Error converting duration '{duration}' to minutes: {e}")
@@ -32,10 +41,12 @@ async def time_to_minutes(duration):
 
 
 async def str_to_time(time_str):
-    logger.debug(f"Parsing time string: {time_str}")
+    if DEBUG_ENABLED:
+        logger.debug(f"Parsing time string: {time_str}")
     try:
         result = datetime.strptime(time_str, "%H:%M")
-        logger.debug(f"Parsed time: {result}")
+        if DEBUG_ENABLED:
+            logger.debug(f"Parsed time: {result}")
         return result
     except Exception as e:
         logger.error(f"Error parsing time string '{time_str}': {e}")
@@ -43,18 +54,21 @@ async def str_to_time(time_str):
 
 
 async def minutes_to_time(duration_minutes):
-    logger.debug(f"Converting {duration_minutes} minutes to time format")
+    if DEBUG_ENABLED:
+        logger.debug(f"Converting {duration_minutes} minutes to time format")
     hours = duration_minutes // 60
     minutes = duration_minutes % 60
     result = f"{hours} ч. {minutes} мин."
-    logger.debug(f"Converted to: {result}")
+    if DEBUG_ENABLED:
+        logger.debug(f"Converted to: {result}")
     return result
 
 
 async def convert_dates(obj):
     if isinstance(obj, (date, datetime)):
         result = obj.isoformat()
-        logger.debug(f"Converted date {obj} to {result}")
+        if DEBUG_ENABLED:
+            logger.debug(f"Converted date {obj} to {result}")
         return result
     elif isinstance(obj, dict):
         return {k: convert_dates(v) for k, v in obj.items()}
@@ -69,127 +83,26 @@ async def parse_date(date_str):
         return "Н/Д"
     try:
         result = datetime.fromisoformat(date_str).date()
-        logger.debug(f"Parsed date {date_str} to {result}")
+        if DEBUG_ENABLED:
+            logger.debug(f"Parsed date {date_str} to {result}")
         return result
     except Exception as e:
         logger.error(f"Error parsing date '{date_str}': {e}")
         return date_str
 
 
-async def get_quarter_periods(periods_schedules):
-    logger.debug("Calculating quarter periods")
-    quarters = []
-    current_start = None
-
-    sorted_schedules = sorted(periods_schedules, key=lambda x: x.date)
-
-    for item in sorted_schedules:
-        if item.type == "vacation" or (item.title and "каник" in item.title.lower()):
-            if current_start:
-                quarters.append((current_start, item.date - timedelta(days=1)))
-                current_start = None
-        elif item.type in ("workday", "other"):
-            if current_start is None:
-                current_start = item.date
-
-    if current_start:
-        quarters.append((current_start, sorted_schedules[-1].date))
-        logger.debug(f"Final quarter: {current_start} - {sorted_schedules[-1].date}")
-
-    logger.info(f"Found {len(quarters)} quarters")
-    return quarters
-
-
-async def get_half_year_periods(periods_schedules):
-    logger.debug("Calculating half-year periods")
-    
-    quarters = await get_quarter_periods(periods_schedules)
-
-    half_years = []
-
-    if len(quarters) >= 2:
-        half_years.append((quarters[0][0], quarters[1][1]))
-        logger.debug(f"First half-year: {quarters[0][0]} - {quarters[1][1]}")
-
-    if len(quarters) >= 4:
-        half_years.append((quarters[2][0], quarters[3][1]))
-        logger.debug(f"Second half-year: {quarters[2][0]} - {quarters[3][1]}")
-    
-    elif len(quarters) == 3:
-        half_years.append((quarters[2][0], quarters[2][1]))
-        logger.debug(f"Third half-year (partial): {quarters[2][0]} - {quarters[2][1]}")
-
-    logger.info(f"Found {len(half_years)} half-years")
-    return half_years
-
-
-async def get_trimester_periods(periods_schedules):
-    logger.debug("Calculating trimester periods")
-    
-    quarters = await get_quarter_periods(periods_schedules)
-
-    trimesters = []
-
-    if len(quarters) >= 3:
-        trimesters.append((quarters[0][0], quarters[1][1]))
-        trimesters.append((quarters[2][0], quarters[2][1]))
-        logger.debug(f"First trimester: {quarters[0][0]} - {quarters[1][1]}")
-        logger.debug(f"Second trimester: {quarters[2][0]} - {quarters[2][1]}")
-        
-        if len(quarters) >= 4:
-            trimesters.append((quarters[3][0], quarters[3][1]))
-            logger.debug(f"Third trimester: {quarters[3][0]} - {quarters[3][1]}")
-            
-    elif len(quarters) == 2:
-        trimesters = quarters
-        logger.debug(f"Using 2 quarters as trimesters: {quarters[0]} - {quarters[1]}")
-
-    logger.info(f"Found {len(trimesters)} trimesters")
-    return trimesters
-
-
 async def detect_period_type(api, user):
     """Определяет тип учебных периодов (четверти/полугодия/триместры)"""
     logger.info(f"Detecting period type for user {user.user_id}")
     
     try:
-        subjects = await api.get_subjects(
-            student_id=user.student_id, profile_id=user.profile_id
-        )
+        snapshot = await get_marks_snapshot(user.user_id, api, user)
 
-        if not subjects.payload:
+        if not snapshot or not snapshot.subjects:
             logger.warning("No subjects found, defaulting to quarters")
             return "quarters"
 
-        first_subject = subjects.payload[0]
-        logger.debug(f"Checking first subject: {first_subject.subject_name}")
-        
-        subject_marks_info = await api.get_subject_marks_for_subject(
-            student_id=user.student_id,
-            profile_id=user.profile_id,
-            subject_name=first_subject.subject_name,
-        )
-
-        period_titles = [p.title.lower() for p in subject_marks_info.periods if p.title]
-        logger.debug(f"Period titles found: {period_titles}")
-
-        if any("полугодие" in title for title in period_titles):
-            return "half_years"
-        elif any("триместр" in title for title in period_titles):
-            return "trimesters"
-        elif any("четверть" in title for title in period_titles):
-            return "quarters"
-        else:
-            # Fallback based on number of periods
-            periods_count = len(subject_marks_info.periods)
-            logger.warning(f"Could not detect period type by title, using count: {periods_count}")
-            
-            if len(subject_marks_info.periods) <= 2:
-                return "half_years"
-            elif len(subject_marks_info.periods) == 3:
-                return "trimesters"
-            else:
-                return "quarters"
+        return snapshot.detect_period_type()
     except Exception as e:
         logger.exception(f"Error detecting period type: {e}")
         return "quarters"
@@ -199,40 +112,8 @@ async def get_current_period(api, user, period_type):
     logger.info(f"Getting current {period_type} for user {user.user_id}")
     
     try:
-        today = date.today()
-        start_year = today.year if today >= date(today.year, 9, 1) else today.year - 1
-        logger.debug(f"Academic year start: {start_year}")
-
-        periods_schedules = await api.get_periods_schedules(
-            student_id=user.student_id,
-            profile_id=user.profile_id,
-            from_date=datetime(start_year, 9, 1),
-            to_date=datetime(start_year + 1, 6, 1),
-        )
-
-        if period_type == "quarters":
-            periods = await get_quarter_periods(periods_schedules)
-        elif period_type == "half_years":
-            periods = await get_half_year_periods(periods_schedules)
-        elif period_type == "trimesters":
-            periods = await get_trimester_periods(periods_schedules)
-        else:
-            periods = await get_quarter_periods(periods_schedules)
-
-        logger.debug(f"Found {len(periods)} periods")
-        
-        for i, (start_date, end_date) in enumerate(periods, 1):
-            if start_date <= today <= end_date:
-                logger.info(f"Current period: {i} ({start_date} - {end_date})")
-                return i
-
-        for i, (start_date, end_date) in reversed(list(enumerate(periods, 1))):
-            if today > end_date:
-                return i
-
-        logger.warning("Could not determine current period, defaulting to 1")
-        return 1
-    
+        calendar = await get_calendar(api, user)
+        return await calendar.get_current_period(period_type)
     except Exception as e:
         logger.exception(f"Error getting current period: {e}")
         return 1
@@ -273,28 +154,11 @@ async def get_available_periods(api, user, period_type, current_date=None):
             else current_date.year - 1
         )
 
-        periods_schedules = await api.get_periods_schedules(
-            student_id=user.student_id,
-            profile_id=user.profile_id,
-            from_date=datetime(start_year, 9, 1),
-            to_date=datetime(start_year + 1, 6, 1),
+        calendar = await get_calendar(api, user, start_year)
+        available_periods = await calendar.get_available_periods(
+            period_type, current_date
         )
 
-        if period_type == "quarters":
-            periods_dates = await get_quarter_periods(periods_schedules)
-        elif period_type == "half_years":
-            periods_dates = await get_half_year_periods(periods_schedules)
-        elif period_type == "trimesters":
-            periods_dates = await get_trimester_periods(periods_schedules)
-        else:
-            periods_dates = await get_quarter_periods(periods_schedules)
-
-        available_periods = []
-
-        for i, (period_start, period_end) in enumerate(periods_dates, 1):
-            if current_date >= period_start:
-                available_periods.append(i)
-
         logger.info(f"Available periods: {available_periods}")
         return available_periods
     except Exception as e:
@@ -334,6 +198,150 @@ async def get_school_days_from_schedule(
     return school_days
 
 
+def get_results_state_key(user_id, year):
+    return f"results_state:{user_id}:{year}"
+
+
+def _to_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+async def update_results_state(api, user, user_id, year, period_start, period_end):
+    """
+    Накопленная по дням статистика для итогов: {iso_date: [дз, уроки, учебный день, посещения]}.
+    Дни раньше final_until уже не меняются, поэтому запрашиваются только
+    данные с final_until до конца периода.
+    """
+    cache_key = get_results_state_key(user_id, year)
+    cached = await redis_client.get(cache_key)
+    if cached:
+        state = json.loads(cached)
+        final_until = date.fromisoformat(state["final_until"])
+        days = state["days"]
+    else:
+        final_until = min(period_start, date(year, 9, 1))
+        days = {}
+
+    if final_until > period_end:
+        logger.debug(f"Results state for user {user_id} is final up to {final_until}, nothing to fetch")
+        return days
+
+    today = date.today()
+    fetch_from = final_until
+    homeworks_to = min(today, period_end)
+    logger.debug(f"Updating results state for user {user_id}: {fetch_from} - {period_end}")
+
+    async def fetch_homeworks():
+        if fetch_from > homeworks_to:
+            return None
+        return await api.get_homeworks_short(
+            student_id=user.student_id,
+            profile_id=user.profile_id,
+            from_date=fetch_from,
+            to_date=homeworks_to,
+        )
+
+    async def fetch_visits_and_schedule():
+        try:
+            return await asyncio.gather(
+                api.get_visits(
+                    profile_id=user.profile_id,
+                    student_id=user.student_id,
+                    contract_id=user.contract_id,
+                    from_date=fetch_from,
+                    to_date=period_end,
+                ),
+                api.get_events(
+                    person_id=user.person_id,
+                    mes_role=user.role,
+                    begin_date=fetch_from,
+                    end_date=period_end,
+                ),
+            )
+        except APIError as e:
+            logger.error(f"Error getting visits/schedule: {e}")
+            return None, None
+
+    homeworks_short, (visits, schedule) = await asyncio.gather(
+        fetch_homeworks(), fetch_visits_and_schedule()
+    )
+    complete = visits is not None and schedule is not None
+
+    # Дни из загруженного диапазона пересчитываются заново
+    fetched = {}
+    day = fetch_from
+    while day <= period_end:
+        old = days.get(day.isoformat(), [0, 0, False, []])
+        fetched[day] = [0, 0, False, []] if complete else [0, *old[1:]]
+        day += timedelta(days=1)
+
+    if homeworks_short:
+        for item in homeworks_short.payload:
+            record = fetched.get(_to_date(item.date))
+            if record:
+                record[0] += 1
+
+    if schedule:
+        for school_day in await get_school_days_from_schedule(
+            schedule, fetch_from, period_end, include_future=True
+        ):
+            fetched[school_day][2] = True
+
+        for item in schedule.response:
+            record = fetched.get(item.start_at.date())
+            if (
+                record
+                and item.cancelled is False
+                and item.lesson_type == "NORMAL"
+                and not item.is_missed_lesson
+            ):
+                record[1] += 1
+
+    if visits is not None and visits.payload:
+        for entry in visits.payload:
+            record = fetched.get(_to_date(entry.date))
+            if not record:
+                continue
+
+            for visit in entry.visits:
+                if "-" in visit.duration:
+                    # Пропуск в учебный день
+                    continue
+
+                record[3].append(
+                    [
+                        visit.in_,
+                        visit.out,
+                        await time_to_minutes(visit.duration.replace(" мин.", "")),
+                    ]
+                )
+
+    days.update({day.isoformat(): record for day, record in fetched.items()})
+
+    if complete:
+        final_until = max(
+            final_until,
+            min(
+                today - timedelta(days=RESULTS_STATE_OVERLAP_DAYS),
+                period_end + timedelta(days=1),
+            ),
+        )
+
+    await cache_set(
+        cache_key,
+        RESULTS_STATE_TTL,
+        json.dumps(
+            {"final_until": final_until.isoformat(), "days": days},
+            separators=(",", ":"),
+        ),
+        user_id,
+    )
+    logger.debug(f"Results state for user {user_id} saved, final until {final_until}")
+
+    return days
+
+
+@single_flight()
 @handle_api_error()
 async def get_results(
     user_id, period_number, period_type="quarters", cache_bypass=False
@@ -367,30 +375,21 @@ async def get_results(
     start_year = today.year if today >= date(today.year, 9, 1) else today.year - 1
     logger.debug(f"Academic year: {start_year}-{start_year+1}")
 
-    periods_schedules = await api.get_periods_schedules(
-        student_id=user.student_id,
-        profile_id=user.profile_id,
-        from_date=datetime(start_year, 9, 1),
-        to_date=datetime(start_year + 1, 6, 1),
-    )
+    started_at = monotonic()
 
-    subjects = await api.get_subjects(
-        student_id=user.student_id, profile_id=user.profile_id
+    calendar, snapshot = await asyncio.gather(
+        get_calendar(api, user, start_year),
+        get_marks_snapshot(user_id, api, user, force=cache_bypass),
     )
-    logger.debug(f"Found {len(subjects.payload)} subjects")
+    logger.debug(f"Found {len(snapshot.subjects)} subjects")
 
     detected_period_type = period_type
     uses_half_years = False
 
-    if period_type is None and subjects.payload:
-        first_subject = subjects.payload[0]
-        subject_marks_info = await api.get_subject_marks_for_subject(
-            student_id=user.student_id,
-            profile_id=user.profile_id,
-            subject_name=first_subject.subject_name,
-        )
+    if period_type is None and snapshot.subjects:
+        first_subject = snapshot.subjects[0]
 
-        period_titles_list = [p.title for p in subject_marks_info.periods if p.title]
+        period_titles_list = [p.title for p in first_subject.periods if p.title]
 
         uses_half_years = any(
             "полугодие" in title.lower() for title in period_titles_list
@@ -403,14 +402,8 @@ async def get_results(
             detected_period_type = "quarters"
             logger.info("Auto-detected quarter periods")
     
-    if detected_period_type == "half_years":
-        periods = await get_half_year_periods(periods_schedules)
-        uses_half_years = True
-    elif detected_period_type == "trimesters":
-        periods = await get_trimester_periods(periods_schedules)
-    else:
-        periods = await get_quarter_periods(periods_schedules)
-        uses_half_years = False
+    periods = await calendar.get_periods(detected_period_type)
+    uses_half_years = detected_period_type == "half_years"
         
     logger.debug(f"Found {len(periods)} periods")
 
@@ -434,7 +427,24 @@ async def get_results(
     else:
         target_title = f"{period_number} период"
     logger.debug(f"Target period title: {target_title}")
-    
+
+    days = await update_results_state(
+        api, user, user_id, start_year, period_start, period_end
+    )
+    logger.info(
+        f"Results data for user {user_id} fetched in {monotonic() - started_at:.2f}s "
+        f"({len(snapshot.subjects)} subjects)"
+    )
+
+    today = date.today()
+    period_days = {
+        day: record
+        for day, record in (
+            (date.fromisoformat(day), record) for day, record in sorted(days.items())
+        )
+        if period_start <= day <= period_end
+    }
+
     # Сбор данных по предметам
     global_marks = []
     max_marks_subject_name = ""
@@ -442,14 +452,9 @@ async def get_results(
     marks_by_grade = Counter()
     subject_data = []
 
-    for subject in subjects.payload:
-        logger.debug(f"Processing subject: {subject.subject_name}")
-        
-        subject_marks_info = await api.get_subject_marks_for_subject(
-            student_id=user.student_id,
-            profile_id=user.profile_id,
-            subject_name=subject.subject_name,
-        )
+    for subject in snapshot.subjects:
+        if DEBUG_ENABLED:
+            logger.debug(f"Processing subject: {subject.subject_name}")
 
         subject_info = {
             "subject_name": f"{subject.subject_name}",
@@ -460,10 +465,10 @@ async def get_results(
         }
 
         if period_number == -1:
-            target_periods = [p for p in subject_marks_info.periods if p]
+            target_periods = [p for p in subject.periods if p]
         else:
             target_period = next(
-                (p for p in subject_marks_info.periods if p and p.title == target_title),
+                (p for p in subject.periods if p and p.title == target_title),
                 None
             )
             target_periods = [target_period] if target_period else []
@@ -493,22 +498,21 @@ async def get_results(
                 max_marks_subject_name = subject.subject_name
                 max_marks_subject_amount = len(all_marks)
             
-            logger.debug(f"Subject {subject.subject_name}: {len(all_marks)} marks, avg grade {target_period.value}")
+            if DEBUG_ENABLED:
+                logger.debug(f"Subject {subject.subject_name}: {len(all_marks)} marks, avg grade {target_period.value}")
 
             subject_data.append(subject_info)
             
     logger.info(f"Total marks collected: {len(global_marks)}")
 
     # Анализ домашних заданий
-    homeworks_short = await api.get_homeworks_short(
-        student_id=user.student_id,
-        profile_id=user.profile_id,
-        from_date=period_start,
-        to_date=min(date.today(), period_end),
+    date_counts = Counter(
+        {
+            day: record[0]
+            for day, record in period_days.items()
+            if record[0] and day <= today
+        }
     )
-
-    dates = [item.date for item in homeworks_short.payload]
-    date_counts = Counter(dates)
     logger.debug(f"Homework days: {len(date_counts)}")
 
     if date_counts:
@@ -527,28 +531,6 @@ async def get_results(
         avg_homework_count = 0
         logger.debug("No homework data")
 
-    # Получение данных о посещениях и расписании
-    try:
-        visits = await api.get_visits(
-            profile_id=user.profile_id,
-            student_id=user.student_id,
-            contract_id=user.contract_id,
-            from_date=period_start,
-            to_date=period_end,
-        )
-
-        schedule = await api.get_events(
-            person_id=user.person_id,
-            mes_role=user.role,
-            begin_date=period_start,
-            end_date=period_end,
-        )
-        logger.debug("Visits and schedule data retrieved")
-    except APIError as e:
-        logger.error(f"Error getting visits/schedule: {e}")
-        visits = None
-        schedule = None
-
     daily_durations = defaultdict(int)
     longest_day = None
     shortest_day = None
@@ -560,88 +542,44 @@ async def get_results(
     skipped_days = 0
     total_time_in_school = 0
 
-    school_days_from_schedule = await get_school_days_from_schedule(
-        schedule, period_start, period_end
-    )
+    school_days_from_schedule = {
+        day for day, record in period_days.items() if record[2] and day <= today
+    }
     total_school_days = len(school_days_from_schedule)
     logger.debug(f"Total school days: {total_school_days}")
 
-    lessons_by_day = defaultdict(list)
-    total_lessons = 0
+    total_lessons = sum(record[1] for record in period_days.values())
+    logger.debug(f"Total lessons in period: {total_lessons}")
 
-    if schedule:
-        for item in schedule.response:
-            if (
-                item.cancelled is False
-                and item.lesson_type == "NORMAL"
-                and not item.is_missed_lesson
-                and period_start <= item.start_at.date() <= period_end
-            ):
+    visited_dates = set()
 
-                day = item.start_at.date()
-                lessons_by_day[day].append(
-                    {
-                        "subject": item.subject_name,
-                        "start": item.start_at.time(),
-                        "end": item.finish_at.time(),
-                        "room": item.room_name or item.room_number,
-                    }
-                )
-                total_lessons += 1
-                
-        logger.debug(f"Total lessons in period: {total_lessons}")
-
-    if visits is not None and visits.payload:
-        visited_dates = set()
-
-        for entry in visits.payload:
-            date_ = entry.date
+    for date_, record in period_days.items():
+        if date_ not in school_days_from_schedule:
+            # Не учебный день - пропускаем
+            continue
 
-            if date_ not in school_days_from_schedule:
-                # Не учебный день - пропускаем
-                continue
+        for in_, out, duration_minutes in record[3]:
+            # Нормальное посещение в учебный день
+            if date_ not in visited_dates:
+                visited_dates.add(date_)
+                visited_days += 1
 
-            day_has_valid_visit = False
+            daily_durations[date_] += duration_minutes
+            total_time_in_school += duration_minutes
 
-            for visit in entry.visits:
-                if "-" in visit.duration:
-                    # Пропуск в учебный день
-                    continue
+            try:
+                in_time = await str_to_time(in_)
+                out_time = await str_to_time(out)
 
-                # Нормальное посещение в учебный день
-                if not day_has_valid_visit:
-                    visited_dates.add(date_)
-                    visited_days += 1
-                    day_has_valid_visit = True
+                if not earliest_in or in_time < earliest_in["time"]:
+                    earliest_in = {"date": date_, "time": in_time}
+                if not latest_out or out_time > latest_out["time"]:
+                    latest_out = {"date": date_, "time": out_time}
+            except Exception as e:
+                logger.error(f"Error parsing time for visit: {e}")
 
-                duration_minutes = await time_to_minutes(
-                    visit.duration.replace(" мин.", "")
-                )
-                daily_durations[date_] += duration_minutes
-                total_time_in_school += duration_minutes
-
-                try:
-                    in_time = await str_to_time(visit.in_)
-                    out_time = await str_to_time(visit.out)
-
-                    if not earliest_in or in_time < earliest_in["time"]:
-                        earliest_in = {"date": date_, "time": in_time}
-                    if not latest_out or out_time > latest_out["time"]:
-                        latest_out = {"date": date_, "time": out_time}
-                except Exception as e:
-                    logger.error(f"Error parsing time for visit: {e}")
-                
-        skipped_days = 0
-        for school_day in school_days_from_schedule:
-            if school_day not in visited_dates:
-                skipped_days += 1
-                
-        logger.debug(f"Visited days: {visited_days}, skipped: {skipped_days}")
-    else:
-        # Если нет данных о посещениях
-        visited_days = 0
-        skipped_days = total_school_days
-        logger.debug("No visit data available")
+    skipped_days = total_school_days - len(visited_dates)
+    logger.debug(f"Visited days: {visited_days}, skipped: {skipped_days}")
 
     # Обработка статистики
     if daily_durations:
@@ -737,7 +675,7 @@ async def get_results(
     logger.success(f"Results generated for user {user_id}, period {period_number}")
     
     ttl = await get_ttl()
-    await redis_client.setex(cache_key, ttl, json.dumps(result))
+    await cache_set(cache_key, ttl, json.dumps(result), user_id)
     logger.debug(f"Cached results for user {user_id}, key: {cache_key}, TTL: {ttl}")
 
     return result
@@ -796,7 +734,8 @@ async def results_format(
                 text += f'    📅 <i>Период:</i> <span class="tg-spoiler">{start_date.strftime("%d.%m.%Y")} - {end_date.strftime("%d.%m.%Y")}</span>\n'
                 if "period_duration_days" in data:
                     text += f'    ⏱ <i>Длительность:</i> <span class="tg-spoiler">{data["period_duration_days"]} дней</span>\n'
-                logger.debug(f"Period: {start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}, duration: {data.get('period_duration_days')} days")
+                if DEBUG_ENABLED:
+                    logger.debug(f"Period: {start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}, duration: {data.get('period_duration_days')} days")
 
         # Основная статистика по оценкам
         total_grades = data.get("total_grades", 0)
@@ -5,17 +5,27 @@
 import json
 from datetime import datetime, timedelta, timezone
 
-from octodiary.types.mobile.subjects import Subjects
-
 from aiogram.types import Message
 from loguru import logger
 import pytz
 
-from app.config.config import DEFAULT_LONG_CACHE_TTL
 from app.keyboards import user as kb
 from app.utils.database import get_session, Settings, db
-from app.utils.user.cache import get_ttl, redis_client
+from app.utils.log import DEBUG_ENABLED
+from app.utils.singleflight import single_flight
+from app.utils.user.api.mes.prefetch import (
+    EVENTS,
+    SCHEDULE,
+    SKIP_EMPTY_MAX_DAYS,
+    find_day,
+    get_for_day,
+    invalidate_prefetched,
+    shift_to_day,
+)
+from app.utils.user.cache import cache_get, cache_set_swr, get_ttl, is_fresh
+from app.utils.user.api.mes.subjects import get_subjects_catalog
 from app.utils.user.decorators import handle_api_error
+from app.utils.user.revalidation import serve_stale
 from app.utils.misc import morph
 from app.utils.user.utils import (
     EMOJI_NUMBERS,
@@ -26,19 +36,40 @@ from app.utils.user.utils import (
 )
 
 
+def has_lessons(events):
+    """Есть ли в событиях дня обычные (не дополнительные) уроки"""
+    return any(
+        item.source == "PLAN" and item.lesson_education_type in (None, "OO")
+        for item in events.response or []
+    )
+
+
+@single_flight()
 @handle_api_error()
-async def get_schedule(user_id, date_object, short=True, direction="right"):
+async def get_schedule(
+    user_id, date_object, short=True, direction="right", revalidate=False, mark_stale=False
+):
     logger.info(f"Getting schedule for user {user_id}, date: {date_object.strftime('%Y-%m-%d')}, direction={direction}")
     
     cache_key = f"get_schedule:{user_id}:{date_object.strftime('%Y-%m-%d')}:{direction}"
 
-    cached = await redis_client.get(cache_key)
-    if cached:
-        logger.debug(f"Cache hit for schedule: user {user_id}, date {date_object.strftime('%Y-%m-%d')}")
-        data = json.loads(cached)
+    data = await cache_get(cache_key, json.loads)
+    if data and not revalidate:
+        if not is_fresh(data):
+            if DEBUG_ENABLED:
+                logger.debug(f"Stale cache hit for schedule: user {user_id}, date {date_object.strftime('%Y-%m-%d')}")
+            return serve_stale(
+                cache_key,
+                data,
+                lambda: get_schedule(user_id, date_object, short, direction, revalidate=True),
+                mark=mark_stale,
+            )
+        if DEBUG_ENABLED:
+            logger.debug(f"Cache hit for schedule: user {user_id}, date {date_object.strftime('%Y-%m-%d')}")
         return data["text"], datetime.strptime(data["date"], "%Y-%m-%d")
     else:
-        logger.debug(f"Cache miss for schedule: user {user_id}, date {date_object.strftime('%Y-%m-%d')}")
+        if DEBUG_ENABLED:
+            logger.debug(f"Cache miss for schedule: user {user_id}, date {date_object.strftime('%Y-%m-%d')}")
 
     try:
         api, user = await get_student(user_id)
@@ -51,6 +82,10 @@ async def get_schedule(user_id, date_object, short=True, direction="right"):
         return "❌ <b>Ошибка</b>\n\nНе удалось получить данные ученика", date_object
 
     original_date = date_object
+    if revalidate:
+        # Фоновое обновление должно видеть свежие данные МЭШ
+        invalidate_prefetched(user_id, SCHEDULE)
+        invalidate_prefetched(user_id, EVENTS)
 
     async with await get_session() as session:
         result = await session.execute(
@@ -58,70 +93,47 @@ async def get_schedule(user_id, date_object, short=True, direction="right"):
         )
         settings: Settings = result.scalar_one_or_none()
 
-    logger.debug(f"Fetching schedule for {date_object.strftime('%Y-%m-%d')}")
-    schedule = await web_api.get_schedule(
-        student_id=user.student_id,
-        date=date_object
-    )
-
-    if (
-        schedule.activities
-        and datetime.fromtimestamp(schedule.activities[-1].end_utc, tz=timezone.utc) < datetime.now(timezone.utc)
-        and direction == "today"
-        and settings.next_day_if_lessons_end_schedule
-    ):
-        old_date = date_object
-        date_object += timedelta(days=1)
-        logger.debug(f"Lessons ended for today, moving to next day: {date_object.strftime('%Y-%m-%d')} (was {old_date.strftime('%Y-%m-%d')})")
-        
-        schedule = await web_api.get_schedule(
-            student_id=user.student_id,
-            date=date_object
-        )
-
-    # Пропуск пустых дней
+    # Проверка на окончание уроков
+    if direction == "today" and settings.next_day_if_lessons_end_schedule:
+        if DEBUG_ENABLED:
+            logger.debug(f"Fetching schedule for {date_object.strftime('%Y-%m-%d')}")
+        schedule = await get_for_day(SCHEDULE, web_api, user, date_object)
+
+        if (
+            schedule.activities
+            and datetime.fromtimestamp(schedule.activities[-1].end_utc, tz=timezone.utc) < datetime.now(timezone.utc)
+        ):
+            old_date = date_object
+            date_object += timedelta(days=1)
+            if DEBUG_ENABLED:
+                logger.debug(f"Lessons ended for today, moving to next day: {date_object.strftime('%Y-%m-%d')} (was {old_date.strftime('%Y-%m-%d')})")
+
+    # Пропуск пустых дней: ближайший день с уроками ищем по событиям за окно
+    # (один запрос), а веб-расписание загружаем только для найденного дня
     if settings.skip_empty_days_schedule:
-        lessons_count = 0
-        empty_days = 0
-        
-        logger.debug(f"Checking for empty days, starting from {date_object.strftime('%Y-%m-%d')}")
+        if DEBUG_ENABLED:
+            logger.debug(f"Checking for empty days, starting from {date_object.strftime('%Y-%m-%d')}")
 
-        while lessons_count <= 0 and empty_days <= 14:
-            schedule = await web_api.get_schedule(
-                student_id=user.student_id,
-                date=date_object
-            )
-            lessons_count = 0
-            for activity in schedule.activities:
-                if activity.type == "LESSON" and activity.lesson and activity.lesson.lesson_education_type == 'OO':
-                    lessons_count += 1
-                else:
-                    continue
+        step = -1 if direction == "left" else 1
+        found_day, _ = await find_day(EVENTS, api, user, date_object, step, has_lessons)
 
-            if lessons_count <= 0:
-                empty_days += 1
-                if direction in ["right", "today"]:
-                    date_object += timedelta(days=1)  # Переход вправо
-                else:
-                    date_object -= timedelta(days=1)  # Переход влево
-                logger.debug(f"No lessons on {date_object.strftime('%Y-%m-%d')}, moving to {date_object.strftime('%Y-%m-%d')}, empty days: {empty_days}")
-            else:
-                logger.debug(f"Found {lessons_count} lessons on {date_object.strftime('%Y-%m-%d')}")
-                empty_days = 0
-
-        if empty_days > 14:
-            logger.warning(f"Too many empty days ({empty_days}) for user {user_id}, reverting to original date")
-            schedule = await web_api.get_schedule(
-                student_id=user.student_id,
-                date=date_object
-            )
+        if found_day is None:
+            logger.warning(f"No lessons within {SKIP_EMPTY_MAX_DAYS} days for user {user_id}, reverting to original date")
             date_object = original_date
+        else:
+            date_object = shift_to_day(date_object, found_day)
+            if DEBUG_ENABLED:
+                logger.debug(f"Found lessons on {date_object.strftime('%Y-%m-%d')}")
+
+    # Если день не изменился, расписание уже загружено и берётся из памяти
+    schedule = await get_for_day(SCHEDULE, web_api, user, date_object)
 
     text = f'📅 <b>Расписание на</b> {date_object.strftime("%d %B (%a)")}:\n\n'
 
     num = 0
     lessons_count = 0
     now = datetime.now(timezone.utc)
+    catalog = None
     
     for activity in schedule.activities:
         if activity.type == "LESSON":
@@ -135,26 +147,10 @@ async def get_schedule(user_id, date_object, short=True, direction="right"):
             end_time = activity.end_time
             
             
-            subjects_list_cache_key = f"subjects_list:{user_id}"
-            if await redis_client.exists(subjects_list_cache_key):
-                cached_data = json.loads(await redis_client.get(subjects_list_cache_key))
-                subjects_list = Subjects.model_validate(cached_data) 
-            else:
-                subjects_list = await api.get_subjects(
-                    student_id=user.student_id, profile_id=user.profile_id
-                )
-                await redis_client.setex(subjects_list_cache_key, DEFAULT_LONG_CACHE_TTL, subjects_list.model_dump_json())
-                
-            subject_exists = next(
-                (
-                    True
-                    for subject in subjects_list.payload
-                    if subject.subject_id == activity.lesson.subject_id
-                ),
-                False,
-            )
+            if catalog is None:
+                catalog = await get_subjects_catalog(user_id, api, user)
             
-            if subject_exists:
+            if catalog and activity.lesson.subject_id in catalog:
                 deeplink = f'<a href="{await generate_deeplink(f'subject-menu-{activity.lesson.subject_id}-{date_object.strftime("%d_%m_%Y")}')}">{await get_emoji_subject(activity.lesson.subject_name)} <b>{activity.lesson.subject_name}</b></a>'
             else:
                 deeplink = f'<b>{await get_emoji_subject(activity.lesson.subject_name)} {activity.lesson.subject_name}</b>'
@@ -188,7 +184,7 @@ async def get_schedule(user_id, date_object, short=True, direction="right"):
     ttl = await get_ttl()
 
     cache_key = f"get_schedule:{user_id}:{date_object.strftime('%Y-%m-%d')}:{direction}"
-    await redis_client.setex(cache_key, ttl, json.dumps(cache_data))
+    await cache_set_swr(cache_key, ttl, cache_data, user_id, original_date, date_object)
     logger.debug(f"Cached schedule for user {user_id}, key: {cache_key}, TTL: {ttl}")
     
     logger.info(f"Schedule retrieved for user {user_id}, {lessons_count} lessons on {date_object.strftime('%Y-%m-%d')}")
@@ -0,0 +1,80 @@
+# SPDX-FileCopyrightText: 2024-2026 Mag329
+#
+# SPDX-License-Identifier: MIT
+
+import json
+
+from loguru import logger
+
+from app.config.config import SUBJECTS_CATALOG_TTL
+from app.utils.singleflight import single_flight
+from app.utils.user.cache import cache_get, cache_set
+
+UNKNOWN_SUBJECT = "Неизвестный предмет"
+
+
+class SubjectsCatalog:
+    """Предметы ученика: subject_id -> название, в порядке ответа МЭШ"""
+
+    __slots__ = ("names",)
+
+    def __init__(self, names: dict):
+        self.names = names
+
+    def __contains__(self, subject_id):
+        return subject_id in self.names
+
+    def __len__(self):
+        return len(self.names)
+
+    def get_name(self, subject_id, default=None):
+        return self.names.get(subject_id, default)
+
+    def items(self):
+        return self.names.items()
+
+    @classmethod
+    def from_response(cls, subjects):
+        return cls(
+            {subject.subject_id: subject.subject_name for subject in subjects.payload or []}
+        )
+
+    def dumps(self):
+        return json.dumps(list(self.names.items()), ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def loads(cls, raw):
+        return cls({subject_id: name for subject_id, name in json.loads(raw)})
+
+
+def get_catalog_key(user_id):
+    return f"subjects_catalog:{user_id}"
+
+
+@single_flight(key=lambda user_id, *args, **kwargs: user_id)
+async def get_subjects_catalog(user_id, api=None, user=None):
+    """Каталог предметов из памяти процесса / Redis, при промахе — один запрос к МЭШ"""
+    cache_key = get_catalog_key(user_id)
+
+    catalog = await cache_get(cache_key, SubjectsCatalog.loads)
+    if catalog is not None:
+        return catalog
+
+    if api is None or user is None:
+        from app.utils.user.utils import get_student
+
+        api, user = await get_student(user_id)
+        if not api or not user:
+            logger.error(f"Failed to get student data for user {user_id}")
+            return None
+
+    logger.debug(f"Fetching subjects catalog from API for user {user_id}")
+    subjects = await api.get_subjects(
+        student_id=user.student_id, profile_id=user.profile_id
+    )
+
+    catalog = SubjectsCatalog.from_response(subjects)
+    await cache_set(cache_key, SUBJECTS_CATALOG_TTL, catalog.dumps(), user_id)
+    logger.debug(f"Subjects catalog cached for user {user_id}: {len(catalog)} subjects")
+
+    return catalog
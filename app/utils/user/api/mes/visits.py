@@ -9,7 +9,8 @@ from loguru import logger
 
 from app.keyboards import user as kb
 from app.states.user.states import VisitState
-from app.utils.user.cache import redis_client
+from app.utils.singleflight import single_flight
+from app.utils.user.cache import cache_get, cache_set
 from app.utils.user.decorators import handle_api_error
 from app.utils.user.utils import get_student
 from app.utils.misc import morph
@@ -46,6 +47,7 @@ def format_time(time_string):
         return f"{minutes} {minute_form}"
 
 
+@single_flight()
 @handle_api_error()
 async def get_visits(user_id, date_object):
     logger.info(
@@ -56,7 +58,7 @@ async def get_visits(user_id, date_object):
     logger.debug(f"Cache key: {cache_key}")
 
     # Пытаемся получить данные из кэша
-    cached_text = await redis_client.get(cache_key)
+    cached_text = await cache_get(cache_key)
     if cached_text:
         logger.debug(
             f"Cache hit for visits: user {user_id}, date {date_object.strftime('%Y-%m-%d')}"
@@ -102,7 +104,7 @@ async def get_visits(user_id, date_object):
             text += f"    🔒 {visit_in_day.in_}\n    ⏱️ {format_time(visit_in_day.duration)}\n    🔓 {visit_in_day.out}\n\n"
 
     # Сохраняем в кэш
-    await redis_client.setex(cache_key, 7200, text)
+    await cache_set(cache_key, 7200, text, user_id, date_object)
     logger.debug(f"Cached visits for user {user_id} with TTL 7200s")
 
     return text
@@ -2,41 +2,359 @@
 #
 # SPDX-License-Identifier: MIT
 
+import asyncio
+import json
+import time as time_module
+from collections import OrderedDict
 from datetime import datetime, time
 
 import redis.asyncio as redis
+from loguru import logger
 
 from app.config.config import (
+    CACHE_L1_SIZE,
+    CACHE_L1_TTL,
     DEFAULT_CACHE_TTL,
     DEFAULT_LONG_CACHE_TTL,
     DEFAULT_MEDIUM_CACHE_TTL,
     DEFAULT_SHORT_CACHE_TTL,
     REDIS_HOST,
     REDIS_PORT,
+    SWR_STALE_TTL,
 )
 
-redis_client = redis.Redis(
-    host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True
+UNLINK_CHUNK_SIZE = 500
+
+
+class BatchingRedis:
+    """
+    Обёртка над клиентом Redis, объединяющая запросы одного тика цикла:
+    get -> один MGET, setex -> один pipeline. Остальные команды
+    передаются клиенту как есть.
+    """
+
+    def __init__(self, client: redis.Redis):
+        self._client = client
+        self._gets: dict[str, list[asyncio.Future]] = {}
+        self._sets: list[tuple] = []
+        self._flush_scheduled = False
+        self._flush_tasks: set[asyncio.Task] = set()
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _schedule_flush(self):
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            # call_soon срабатывает после всех уже готовых задач тика
+            asyncio.get_running_loop().call_soon(self._start_flush)
+
+    def _start_flush(self):
+        task = asyncio.ensure_future(self._flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def get(self, key):
+        future = asyncio.get_running_loop().create_future()
+        self._gets.setdefault(key, []).append(future)
+        self._schedule_flush()
+        return await future
+
+    async def setex(self, key, ttl, value, indexes=()):
+        """
+        indexes — множества, в которых регистрируется ключ (см. cache_set).
+        Первый индекс — индекс пользователя, в нём запоминаются и остальные.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._sets.append((key, ttl, value, indexes, future))
+        self._schedule_flush()
+        return await future
+
+    async def mget(self, *keys):
+        if len(keys) == 1 and isinstance(keys[0], (list, tuple)):
+            keys = keys[0]
+        if not keys:
+            return []
+        return await self._client.mget(keys)
+
+    async def unlink_many(self, keys):
+        deleted = 0
+        keys = list(keys)
+        for i in range(0, len(keys), UNLINK_CHUNK_SIZE):
+            deleted += await self._client.unlink(*keys[i : i + UNLINK_CHUNK_SIZE])
+        return deleted
+
+    async def _flush(self):
+        self._flush_scheduled = False
+        gets, self._gets = self._gets, {}
+        sets, self._sets = self._sets, []
+
+        if sets:
+            try:
+                positions = []
+                async with self._client.pipeline(transaction=False) as pipe:
+                    for key, ttl, value, indexes, _ in sets:
+                        positions.append(len(pipe))
+                        pipe.setex(key, ttl, value)
+                        if len(indexes) > 1:
+                            pipe.sadd(indexes[0], *indexes[1:])
+                        for index_key in indexes:
+                            pipe.sadd(index_key, key)
+                            # Индекс живёт не меньше самой долгой записи в нём
+                            pipe.expire(index_key, ttl, nx=True)
+                            pipe.expire(index_key, ttl, gt=True)
+                    results = await pipe.execute()
+                for (*_, future), position in zip(sets, positions):
+                    if not future.done():
+                        future.set_result(results[position])
+            except Exception as e:
+                for *_, future in sets:
+                    if not future.done():
+                        future.set_exception(e)
+
+        if gets:
+            keys = list(gets)
+            try:
+                values = await self._client.mget(keys)
+                for key, value in zip(keys, values):
+                    for future in gets[key]:
+                        if not future.done():
+                            future.set_result(value)
+            except Exception as e:
+                for futures in gets.values():
+                    for future in futures:
+                        if not future.done():
+                            future.set_exception(e)
+
+        if len(gets) > 1 or len(sets) > 1:
+            logger.trace(f"Redis batch: {len(gets)} gets, {len(sets)} writes")
+
+
+redis_client = BatchingRedis(
+    redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
 )
 
 
+class LocalCache:
+    """
+    LRU-кэш в памяти процесса с TTL на запись (L1 перед Redis).
+    TTL короткий: записи, удалённые явно, вычищаются через pub/sub,
+    а истёкшие в Redis живут здесь не дольше CACHE_L1_TTL.
+    """
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time_module.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = (time_module.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def discard(self, keys):
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+local_cache = LocalCache(CACHE_L1_SIZE, CACHE_L1_TTL)
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+
+async def cache_get(key, loads=None):
+    """
+    Читает запись сначала из памяти процесса, затем из Redis.
+    loads — функция разбора значения; в памяти хранится уже разобранный результат.
+    """
+    value = local_cache.get(key)
+    if value is not None:
+        return value
+
+    value = await redis_client.get(key)
+    if value is not None:
+        if loads is not None:
+            value = loads(value)
+        local_cache.put(key, value)
+    return value
+
+
+async def cache_mget(keys, loads=None):
+    """То же, что cache_get, для нескольких ключей: промахи читаются одним MGET"""
+    values = [local_cache.get(key) for key in keys]
+    missing = [i for i, value in enumerate(values) if value is None]
+
+    if missing:
+        fetched = await redis_client.mget([keys[i] for i in missing])
+        for i, value in zip(missing, fetched):
+            if value is None:
+                continue
+            if loads is not None:
+                value = loads(value)
+            local_cache.put(keys[i], value)
+            values[i] = value
+
+    return values
+
+
+async def publish_invalidation(keys):
+    """Удаляет ключи из памяти этого процесса и сообщает об этом остальным"""
+    keys = list(keys)
+    if not keys:
+        return
+
+    local_cache.discard(keys)
+    try:
+        await redis_client.publish(INVALIDATION_CHANNEL, json.dumps(keys))
+    except Exception as e:
+        logger.warning(f"Failed to publish cache invalidation: {e}")
+
+
+async def listen_cache_invalidation():
+    """Фоновая задача: применяет инвалидации из других процессов бота"""
+    # prefetch сам импортирует этот модуль
+    from app.utils.user.api.mes.prefetch import apply_prefetch_invalidation, prefetch_cache
+
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            logger.info("Listening for cache invalidations")
+
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                keys = json.loads(message["data"])
+                local_cache.discard(keys)
+                apply_prefetch_invalidation(keys)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Cache invalidation listener error: {e}")
+            # Пока подписки не было, могли пропустить сообщения
+            local_cache.clear()
+            prefetch_cache.clear()
+            await asyncio.sleep(5)
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+
+# Каждая запись кэша пользователя регистрируется в множестве cache_index:{user_id},
+# а записи за конкретный день — ещё и в cache_index:{user_id}:{YYYY-MM-DD}.
+# Инвалидация читает только эти множества, без обхода всего keyspace.
+CACHE_INDEX_PREFIX = "cache_index"
+
+
+def _format_day(day):
+    if hasattr(day, "strftime"):
+        return day.strftime("%Y-%m-%d")
+    return str(day)[:10]
+
+
+def get_user_index_key(user_id):
+    return f"{CACHE_INDEX_PREFIX}:{user_id}"
+
+
+def get_date_index_key(user_id, day):
+    return f"{CACHE_INDEX_PREFIX}:{user_id}:{_format_day(day)}"
+
+
+async def cache_set(key, ttl, value, user_id, *days):
+    """
+    setex с регистрацией ключа в индексах пользователя и указанных дней.
+    После записи старые копии в L1 сбрасываются во всех процессах.
+    """
+    indexes = [get_user_index_key(user_id)]
+    indexes.extend(
+        get_date_index_key(user_id, day) for day in {_format_day(day) for day in days if day}
+    )
+    result = await redis_client.setex(key, ttl, value, indexes=indexes)
+    await publish_invalidation((key,))
+    return result
+
+
+async def cache_set_swr(key, ttl, data: dict, user_id, *days):
+    """
+    Сохраняет запись для stale-while-revalidate: ttl — срок свежести,
+    после него запись ещё SWR_STALE_TTL секунд отдаётся как устаревшая.
+    """
+    now = time_module.time()
+    data = {**data, "cached_at": now, "fresh_until": now + ttl}
+    return await cache_set(key, ttl + SWR_STALE_TTL, json.dumps(data), user_id, *days)
+
+
+def is_fresh(data: dict):
+    return data.get("fresh_until", 0) > time_module.time()
+
+
+async def invalidate_user_date(user_id, day):
+    """Удаляет все записи кэша пользователя за день"""
+    date_index = get_date_index_key(user_id, day)
+    keys = await redis_client.smembers(date_index)
+    if keys:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.unlink(*keys, date_index)
+            pipe.srem(get_user_index_key(user_id), *keys, date_index)
+            await pipe.execute()
+        await publish_invalidation(keys)
+        logger.debug(f"Invalidated {len(keys)} cache entries for user {user_id} on {_format_day(day)}")
+    return len(keys)
+
+
 async def invalidate_cache_for_notification(user_id, notification):
     event_type = notification.event_type
 
     if event_type in ["create_homework", "update_homework"]:
-        date = notification.created_at
-        pattern = f"homework:{user_id}:{date}:*"
+        day = notification.new_date_prepared_for or notification.created_at
+    elif event_type in ["create_mark", "update_mark", "delete_mark"]:
+        day = notification.lesson_date or notification.created_at
+    else:
+        return
 
-        keys = await redis_client.keys(pattern)
-        if keys:
-            await redis_client.delete(*keys)
+    if day:
+        await invalidate_user_date(user_id, day)
 
 
-async def get_ttl():
-    now = datetime.now()
+SCHOOL = "school"
+EVENING = "evening"
+NIGHT = "night"
+WEEKEND_DAY = "weekend_day"
+WEEKEND_NIGHT = "weekend_night"
+
+DAY_PART_TTL = {
+    SCHOOL: DEFAULT_SHORT_CACHE_TTL,
+    EVENING: DEFAULT_MEDIUM_CACHE_TTL,
+    NIGHT: DEFAULT_LONG_CACHE_TTL,
+    WEEKEND_DAY: DEFAULT_MEDIUM_CACHE_TTL,
+    WEEKEND_NIGHT: DEFAULT_LONG_CACHE_TTL,
+}
+
+
+def get_day_part(now: datetime = None):
+    now = now or datetime.now()
     current_time = now.time()
     is_weekday = now.weekday() < 5  # Пн-Пт
-    is_weekend = now.weekday() >= 5  # Сб-Вс
 
     school_start = time(7, 30)
     school_end = time(16, 30)
@@ -44,43 +362,44 @@ async def get_ttl():
     evening_start = time(16, 30)
     evening_end = time(23, 0)
 
-    night_start = time(23, 0)
-    night_end = time(7, 30)
-
     if is_weekday:
         if school_start <= current_time < school_end:
             # Время уроков
-            return DEFAULT_SHORT_CACHE_TTL
+            return SCHOOL
         elif evening_start <= current_time < evening_end:
             # Вечер
-            return DEFAULT_MEDIUM_CACHE_TTL
+            return EVENING
         else:
             # Ночь
-            return DEFAULT_LONG_CACHE_TTL
-    elif is_weekend:
+            return NIGHT
+    else:
         if school_start <= current_time < evening_end:
             # Дневное время выходных
-            return DEFAULT_MEDIUM_CACHE_TTL
+            return WEEKEND_DAY
         else:
             # Ночь выходных
-            return DEFAULT_LONG_CACHE_TTL
-    else:
-        # По умолчанию
-        return DEFAULT_CACHE_TTL
+            return WEEKEND_NIGHT
+
+
+async def get_ttl():
+    return DAY_PART_TTL.get(get_day_part(), DEFAULT_CACHE_TTL)
 
 
 async def get_cache(key):
-    cached_text = await redis_client.get(key)
-    if cached_text and datetime.now().time() > time(16, 30):
-        return cached_text
-    return None
+    # Кэш отдаётся в любое время: актуальность проверяется через is_fresh
+    # и обновляется в фоне (см. app.utils.user.revalidation)
+    return await cache_get(key)
 
 
 async def clear_user_cache(user_id: str):
-    pattern = f"*{user_id}*"
+    user_index = get_user_index_key(user_id)
+    keys = await redis_client.smembers(user_index)
+
+    index_prefix = f"{user_index}:"
+    entries = [key for key in keys if not key.startswith(index_prefix)]
+    indexes = [key for key in keys if key.startswith(index_prefix)]
 
-    deleted = 0
-    async for key in redis_client.scan_iter(match=pattern):
-        await redis_client.delete(key)
-        deleted += 1
+    deleted = await redis_client.unlink_many(entries)
+    await redis_client.unlink_many([*indexes, user_index])
+    await publish_invalidation(entries)
     return deleted
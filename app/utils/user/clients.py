@@ -0,0 +1,214 @@
+# SPDX-FileCopyrightText: 2024-2026 Mag329
+#
+# SPDX-License-Identifier: MIT
+
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import aiohttp
+from loguru import logger
+from octodiary.apis import AsyncMobileAPI, AsyncWebAPI
+from octodiary.urls import Systems
+
+from app.config.config import (
+    MES_CLIENT_POOL_SIZE,
+    MES_CLIENT_POOL_TTL,
+    MES_CONNECTION_LIMIT,
+    MES_KEEPALIVE_TIMEOUT,
+)
+from app.utils.singleflight import SingleFlight
+
+_http_session: Optional[aiohttp.ClientSession] = None
+_get_requests = SingleFlight("mes_get")
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Общая aiohttp-сессия для запросов к МЭШ (keep-alive между вызовами)"""
+    global _http_session
+
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=MES_CONNECTION_LIMIT,
+            ttl_dns_cache=300,
+            keepalive_timeout=MES_KEEPALIVE_TIMEOUT,
+        )
+        # Куки не сохраняем: сессия общая для всех пользователей
+        _http_session = aiohttp.ClientSession(
+            connector=connector, cookie_jar=aiohttp.DummyCookieJar()
+        )
+        logger.debug(f"MES HTTP session created, connection limit {MES_CONNECTION_LIMIT}")
+
+    return _http_session
+
+
+async def close_http_session():
+    global _http_session
+
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+        logger.info("MES HTTP session closed")
+    _http_session = None
+
+
+def _freeze(mapping):
+    return tuple(sorted((key, str(value)) for key, value in (mapping or {}).items()))
+
+
+class PooledRequestMixin:
+    """
+    Выполняет запросы octodiary через общую сессию вместо новой на каждый вызов.
+    Одинаковые одновременные GET-запросы одного пользователя выполняются один раз.
+    """
+
+    async def request(
+        self,
+        method: str,
+        base_url: str,
+        path: str,
+        custom_headers: Optional[dict] = None,
+        model=None,
+        is_list: bool = False,
+        return_json: bool = False,
+        return_raw_text: bool = False,
+        required_token: bool = True,
+        return_raw_response: bool = False,
+        **kwargs,
+    ):
+        def send():
+            return self._send_request(
+                method,
+                base_url,
+                path,
+                custom_headers=custom_headers,
+                model=model,
+                is_list=is_list,
+                return_json=return_json,
+                return_raw_text=return_raw_text,
+                required_token=required_token,
+                return_raw_response=return_raw_response,
+                **kwargs,
+            )
+
+        # Тело ответа нельзя прочитать дважды, а запросы с телом не объединяем
+        if method.upper() != "GET" or return_raw_response or set(kwargs) - {"params"}:
+            return await send()
+
+        key = (
+            self.token if required_token else None,
+            base_url + path,
+            _freeze(kwargs.get("params")),
+            _freeze(custom_headers),
+            model,
+            is_list,
+            return_json,
+            return_raw_text,
+        )
+        return await _get_requests.do(key, send)
+
+    async def _send_request(
+        self,
+        method: str,
+        base_url: str,
+        path: str,
+        custom_headers: Optional[dict] = None,
+        model=None,
+        is_list: bool = False,
+        return_json: bool = False,
+        return_raw_text: bool = False,
+        required_token: bool = True,
+        return_raw_response: bool = False,
+        **kwargs,
+    ):
+        params = kwargs.pop("params", {})
+        async with get_http_session().request(
+            method=method,
+            url=self.init_params(base_url + path, params),
+            headers=self.headers(required_token, custom_headers),
+            **kwargs,
+        ) as response:
+            await self._check_response(response)
+            raw_text = await response.text()
+
+            if not raw_text:
+                return None
+
+            if return_raw_response:
+                return response
+            if return_json:
+                return await response.json()
+            if return_raw_text:
+                return raw_text
+            if is_list:
+                return self.parse_list_models(model, raw_text)
+            if model:
+                return model.model_validate_json(raw_text)
+            return raw_text
+
+
+class PooledMobileAPI(PooledRequestMixin, AsyncMobileAPI):
+    pass
+
+
+class PooledWebAPI(PooledRequestMixin, AsyncWebAPI):
+    pass
+
+
+class ClientEntry:
+    __slots__ = ("token", "expires_at", "mobile_api", "web_api")
+
+    def __init__(self, token, expires_at):
+        self.token = token
+        self.expires_at = expires_at
+        self.mobile_api = None
+        self.web_api = None
+
+
+class ClientPool:
+    """Клиенты МЭШ по user_id с вытеснением по LRU и TTL"""
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[int, ClientEntry] = OrderedDict()
+
+    def _get_entry(self, user_id, token):
+        entry = self._entries.get(user_id)
+        if entry is not None and (
+            entry.token != token or entry.expires_at < time.monotonic()
+        ):
+            entry = None
+
+        if entry is None:
+            entry = ClientEntry(token, time.monotonic() + self.ttl)
+            self._entries[user_id] = entry
+
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+        return entry
+
+    def get(self, user_id, token, web=False):
+        entry = self._get_entry(user_id, token)
+
+        if web:
+            if entry.web_api is None:
+                entry.web_api = PooledWebAPI(system=Systems.MES)
+                entry.web_api.token = token
+            return entry.web_api
+
+        if entry.mobile_api is None:
+            entry.mobile_api = PooledMobileAPI(system=Systems.MES)
+            entry.mobile_api.token = token
+        return entry.mobile_api
+
+    def invalidate(self, user_id):
+        if self._entries.pop(user_id, None) is not None:
+            logger.debug(f"MES clients for user {user_id} invalidated")
+
+    def clear(self):
+        self._entries.clear()
+
+
+client_pool = ClientPool(MES_CLIENT_POOL_SIZE, MES_CLIENT_POOL_TTL)
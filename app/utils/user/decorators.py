@@ -3,7 +3,7 @@
 # SPDX-License-Identifier: MIT
 
 import json
-from datetime import datetime, time
+from datetime import datetime
 
 from learnifyapi.exceptions import APIError as LearnifyAPIError
 from loguru import logger
@@ -17,7 +17,16 @@ from app.config.config import (
     ERROR_MESSAGE,
 )
 from app.utils.database import get_session, Settings, db
-from app.utils.user.cache import get_ttl, redis_client
+from app.utils.log import DEBUG_ENABLED
+from app.utils.user.cache import (
+    cache_get,
+    cache_set,
+    cache_set_swr,
+    get_ttl,
+    is_fresh,
+    redis_client,
+)
+from app.utils.user.revalidation import serve_stale
 
 
 def handle_api_error():
@@ -86,7 +95,8 @@ def cache(ttl=None):
             actual_ttl = ttl
             if not actual_ttl:
                 actual_ttl = await get_ttl()
-                logger.debug(f"Using default TTL: {actual_ttl}")
+                if DEBUG_ENABLED:
+                    logger.debug(f"Using default TTL: {actual_ttl}")
 
             # Извлекаем user_id и date_object из аргументов
             user_id = None
@@ -96,17 +106,19 @@ def cache(ttl=None):
             if len(args) >= 2:
                 user_id = args[0]
                 date_object = args[1]
-                logger.debug(
-                    f"Found user_id={user_id}, date_object={date_object} in positional args"
-                )
+                if DEBUG_ENABLED:
+                    logger.debug(
+                        f"Found user_id={user_id}, date_object={date_object} in positional args"
+                    )
 
             else:
                 # Ищем в ключевых аргументах
                 user_id = kwargs.get("user_id")
                 date_object = kwargs.get("date_object")
-                logger.debug(
-                    f"Found user_id={user_id}, date_object={date_object} in kwargs"
-                )
+                if DEBUG_ENABLED:
+                    logger.debug(
+                        f"Found user_id={user_id}, date_object={date_object} in kwargs"
+                    )
 
             if not user_id or not date_object:
                 # Если не нашли необходимые параметры, просто выполняем функцию
@@ -116,34 +128,39 @@ def cache(ttl=None):
                 return await func(*args, **kwargs)
 
             cache_key = f"{func.__name__}:{user_id}:{date_object.strftime('%Y-%m-%d')}"
-            logger.debug(f"Cache key: {cache_key}")
+            if DEBUG_ENABLED:
+                logger.debug(f"Cache key: {cache_key}")
 
             # Пытаемся получить данные из кэша
-            cached_data = await redis_client.get(cache_key)
+            async def execute():
+                logger.debug(f"Executing {func.__name__} for user {user_id}")
+                result = await func(*args, **kwargs)
+
+                # Сохраняем результат в кэш
+                if result and len(result) == 2:
+                    text, date_obj = result
+                    cache_data = {"text": text, "date": date_obj.strftime("%Y-%m-%d")}
+                    await cache_set_swr(
+                        cache_key, actual_ttl, cache_data, user_id, date_object, date_obj
+                    )
+                    logger.debug(f"Cached result for {cache_key} with TTL {actual_ttl}")
+                else:
+                    logger.debug(f"Result not suitable for caching")
 
-            if cached_data and datetime.now().time() > time(16, 30):
-                logger.debug(f"Cache hit for {cache_key}")
-                data = json.loads(cached_data)
-                return data["text"], datetime.strptime(data["date"], "%Y-%m-%d")
-            elif cached_data:
-                logger.debug(f"Cache hit but time condition not met (before 16:30)")
-            else:
-                logger.debug(f"Cache miss for {cache_key}")
+                return result
 
-            # Если данных нет в кэше, выполняем функцию
-            logger.debug(f"Executing {func.__name__} for user {user_id}")
-            result = await func(*args, **kwargs)
+            cached_data = await cache_get(cache_key, json.loads)
 
-            # Сохраняем результат в кэш
-            if result and len(result) == 2:
-                text, date_obj = result
-                cache_data = {"text": text, "date": date_obj.strftime("%Y-%m-%d")}
-                await redis_client.setex(cache_key, actual_ttl, json.dumps(cache_data))
-                logger.debug(f"Cached result for {cache_key} with TTL {actual_ttl}")
-            else:
-                logger.debug(f"Result not suitable for caching")
+            if cached_data and is_fresh(cached_data):
+                logger.debug(f"Cache hit for {cache_key}")
+                return cached_data["text"], datetime.strptime(cached_data["date"], "%Y-%m-%d")
+            elif cached_data:
+                # Отвечаем сразу, а свежие данные получаем в фоне
+                logger.debug(f"Stale cache hit for {cache_key}")
+                return serve_stale(cache_key, cached_data, execute)
 
-            return result
+            logger.debug(f"Cache miss for {cache_key}")
+            return await execute()
 
         return wrapper
 
@@ -156,7 +173,8 @@ def cache_text_only(ttl=None):
             actual_ttl = ttl
             if not actual_ttl:
                 actual_ttl = await get_ttl()
-                logger.debug(f"Using default TTL: {actual_ttl}")
+                if DEBUG_ENABLED:
+                    logger.debug(f"Using default TTL: {actual_ttl}")
 
             cache_key_parts = []
 
@@ -165,12 +183,13 @@ def cache_text_only(ttl=None):
             for arg in args:
                 if isinstance(arg, int):
                     user_id = arg
-                    logger.debug(f"Found user_id={user_id} in positional args")
+                    if DEBUG_ENABLED:
+                        logger.debug(f"Found user_id={user_id} in positional args")
                     break
 
             if not user_id:
                 user_id = kwargs.get("user_id")
-                if user_id:
+                if user_id and DEBUG_ENABLED:
                     logger.debug(f"Found user_id={user_id} in kwargs")
 
             # Добавляем user_id в ключ
@@ -181,20 +200,23 @@ def cache_text_only(ttl=None):
             subject_id = kwargs.get("subject_id")
             if subject_id:
                 cache_key_parts.append(f"subject:{subject_id}")
-                logger.debug(f"Found subject_id={subject_id}")
+                if DEBUG_ENABLED:
+                    logger.debug(f"Found subject_id={subject_id}")
 
             # Добавляем date_object если есть
             date_object = kwargs.get("date_object")
             if date_object and hasattr(date_object, "strftime"):
                 cache_key_parts.append(f"date:{date_object.strftime('%Y-%m-%d')}")
-                logger.debug(f"Found date_object={date_object.strftime('%Y-%m-%d')}")
+                if DEBUG_ENABLED:
+                    logger.debug(f"Found date_object={date_object.strftime('%Y-%m-%d')}")
 
             # Создаем ключ кэша
             cache_key = f"text_only:{func.__name__}:{':'.join(cache_key_parts)}"
-            logger.debug(f"Cache key: {cache_key}")
+            if DEBUG_ENABLED:
+                logger.debug(f"Cache key: {cache_key}")
 
             # Пытаемся получить данные из кэша
-            cached_text = await redis_client.get(cache_key)
+            cached_text = await cache_get(cache_key)
 
             if cached_text:
                 logger.debug(f"Cache hit for {cache_key}")
@@ -207,7 +229,10 @@ def cache_text_only(ttl=None):
 
             # Сохраняем результат в кэш
             if result:
-                await redis_client.setex(cache_key, actual_ttl, result)
+                if user_id:
+                    await cache_set(cache_key, actual_ttl, result, user_id, date_object)
+                else:
+                    await redis_client.setex(cache_key, actual_ttl, result)
                 logger.debug(f"Cached result for {cache_key} with TTL {actual_ttl}")
             else:
                 logger.debug(f"Empty result, not caching")
@@ -0,0 +1,174 @@
+# SPDX-FileCopyrightText: 2024-2026 Mag329
+#
+# SPDX-License-Identifier: MIT
+
+import time
+from collections import OrderedDict
+
+from loguru import logger
+
+from app.config.config import IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL
+from app.utils.database import get_session, User, UserData, db
+from app.utils.user.clients import client_pool
+
+
+class UserIdentity:
+    """Данные пользователя, нужные для запросов к МЭШ"""
+
+    __slots__ = (
+        "user_id",
+        "token",
+        "profile_id",
+        "role",
+        "person_id",
+        "student_id",
+        "contract_id",
+        "active",
+        "username",
+        "has_user_data",
+    )
+
+    def __init__(
+        self,
+        user_id,
+        token=None,
+        profile_id=None,
+        role=None,
+        person_id=None,
+        student_id=None,
+        contract_id=None,
+        active=False,
+        username=None,
+        has_user_data=False,
+    ):
+        self.user_id = user_id
+        self.token = token
+        self.profile_id = profile_id
+        self.role = role
+        self.person_id = person_id
+        self.student_id = student_id
+        self.contract_id = contract_id
+        self.active = active
+        self.username = username
+        self.has_user_data = has_user_data
+
+    @classmethod
+    def from_user(cls, user: User, username=None, has_user_data=False):
+        return cls(
+            user_id=user.user_id,
+            token=user.token,
+            profile_id=user.profile_id,
+            role=user.role,
+            person_id=user.person_id,
+            student_id=user.student_id,
+            contract_id=user.contract_id,
+            active=bool(user.active),
+            username=username,
+            has_user_data=has_user_data,
+        )
+
+    def __repr__(self):
+        return f"<UserIdentity user_id={self.user_id} active={self.active}>"
+
+
+class IdentityCache:
+    """
+    Ограниченный по размеру LRU-кэш UserIdentity с TTL.
+    Хранит и отрицательные результаты (None), чтобы не искать
+    незарегистрированных пользователей в БД на каждом апдейте.
+    """
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[int, tuple] = OrderedDict()
+
+    def lookup(self, user_id):
+        """Возвращает (найдено, identity)"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return False, None
+
+        expires_at, identity = entry
+        if expires_at < time.monotonic():
+            del self._entries[user_id]
+            return False, None
+
+        self._entries.move_to_end(user_id)
+        return True, identity
+
+    def put(self, user_id, identity):
+        self._entries[user_id] = (time.monotonic() + self.ttl, identity)
+        self._entries.move_to_end(user_id)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+identity_cache = IdentityCache(IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL)
+
+
+def _identity_query():
+    return db.select(User, UserData.username, UserData.id).outerjoin(
+        UserData, UserData.user_id == User.user_id
+    )
+
+
+def _row_to_identity(row):
+    user, username, user_data_id = row
+    return UserIdentity.from_user(
+        user, username=username, has_user_data=user_data_id is not None
+    )
+
+
+async def get_identity(user_id, active=True):
+    found, identity = identity_cache.lookup(user_id)
+    if not found:
+        async with await get_session() as session:
+            result = await session.execute(
+                _identity_query().filter(User.user_id == user_id)
+            )
+            row = result.first()
+
+        identity = _row_to_identity(row) if row else None
+        identity_cache.put(user_id, identity)
+        logger.debug(f"Identity for user {user_id} loaded from DB")
+
+    if identity is None or (active and not identity.active):
+        return None
+    return identity
+
+
+async def load_identities(active=True):
+    """Загружает данные пользователей одним запросом и прогревает кэш"""
+    query = _identity_query()
+    if active:
+        query = query.filter(User.active == True)
+
+    async with await get_session() as session:
+        result = await session.execute(query)
+        identities = [_row_to_identity(row) for row in result.all()]
+
+    for identity in identities:
+        identity_cache.put(identity.user_id, identity)
+
+    return identities
+
+
+def invalidate_identity(user_id):
+    """Вызывается после любого изменения User/UserData пользователя"""
+    identity_cache.invalidate(user_id)
+    client_pool.invalidate(user_id)
+    logger.debug(f"Identity for user {user_id} invalidated")
+
+
+def set_cached_username(user_id, username):
+    found, identity = identity_cache.lookup(user_id)
+    if found and identity is not None:
+        identity.username = username
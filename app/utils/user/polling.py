@@ -0,0 +1,168 @@
+# SPDX-FileCopyrightText: 2024-2026 Mag329
+#
+# SPDX-License-Identifier: MIT
+
+import time
+from datetime import datetime
+
+from loguru import logger
+
+from app.config.config import (
+    NOTIFICATIONS_CHECKER_INTERVAL,
+    POLL_IDLE_AFTER_DAYS,
+    POLL_INTERVAL_FAST,
+    POLL_INTERVAL_IDLE,
+    POLL_INTERVAL_NORMAL,
+    POLL_INTERVAL_SLOW,
+    POLL_RECENT_ACTIVITY_MINUTES,
+)
+from app.utils.user.cache import (
+    EVENING,
+    NIGHT,
+    SCHOOL,
+    WEEKEND_DAY,
+    WEEKEND_NIGHT,
+    get_day_part,
+    redis_client,
+)
+
+# user_id -> время последнего уведомления (unix timestamp)
+LAST_EVENT_KEY = "notifications:last_event"
+# user_id -> время последнего опроса (unix timestamp)
+LAST_POLLED_KEY = "notifications:last_polled"
+REDIS_CHUNK_SIZE = 5000
+
+DAY_PART_INTERVAL = {
+    SCHOOL: POLL_INTERVAL_FAST,
+    EVENING: POLL_INTERVAL_NORMAL,
+    WEEKEND_DAY: POLL_INTERVAL_NORMAL,
+    NIGHT: POLL_INTERVAL_SLOW,
+    WEEKEND_NIGHT: POLL_INTERVAL_SLOW,
+}
+
+
+def get_poll_interval(day_part, last_event_at, now_ts):
+    """Интервал опроса пользователя в минутах"""
+    if last_event_at is not None:
+        quiet_for = now_ts - last_event_at
+        if quiet_for < POLL_RECENT_ACTIVITY_MINUTES * 60:
+            # Только что пришла оценка или ДЗ — скорее всего, будут ещё
+            return POLL_INTERVAL_FAST
+        if quiet_for > POLL_IDLE_AFTER_DAYS * 86400:
+            return POLL_INTERVAL_IDLE
+
+    return DAY_PART_INTERVAL.get(day_part, POLL_INTERVAL_NORMAL)
+
+
+def interval_to_ticks(minutes):
+    return max(1, round(minutes * 60 / NOTIFICATIONS_CHECKER_INTERVAL))
+
+
+def get_current_tick(now_ts=None):
+    return int((now_ts or time.time()) // NOTIFICATIONS_CHECKER_INTERVAL)
+
+
+def is_due(user_id, tick, interval_minutes, last_polled_at, now_ts):
+    """
+    Опрашивать ли пользователя на этом тике. Решение принимается по времени
+    последнего опроса, поэтому пропущенный тик (предыдущий запуск ещё идёт
+    или планировщик объединил запуски) лишь откладывает опрос до следующего.
+    """
+    if last_polled_at is None:
+        # Первый опрос: пользователи с одинаковым интервалом равномерно
+        # распределены по тикам, дальше фаза сохраняется сама
+        return (tick + user_id) % interval_to_ticks(interval_minutes) == 0
+
+    # Полтика запаса на неточность срабатывания планировщика
+    return now_ts - last_polled_at >= interval_minutes * 60 - NOTIFICATIONS_CHECKER_INTERVAL / 2
+
+
+async def get_last_polled(user_ids):
+    """Время последнего опроса для пользователей, которых уже опрашивали"""
+    last_polled = {}
+    for i in range(0, len(user_ids), REDIS_CHUNK_SIZE):
+        chunk = user_ids[i : i + REDIS_CHUNK_SIZE]
+        values = await redis_client.hmget(LAST_POLLED_KEY, chunk)
+        last_polled.update(
+            (user_id, float(value)) for user_id, value in zip(chunk, values) if value is not None
+        )
+    return last_polled
+
+
+async def mark_polled(user_ids, now_ts):
+    """
+    Запоминает время опроса. Вызывается только для успешно опрошенных
+    пользователей: неудавшийся опрос повторится на следующем тике.
+    """
+    for i in range(0, len(user_ids), REDIS_CHUNK_SIZE):
+        chunk = user_ids[i : i + REDIS_CHUNK_SIZE]
+        await redis_client.hset(
+            LAST_POLLED_KEY, mapping={user_id: int(now_ts) for user_id in chunk}
+        )
+
+
+async def get_last_events(user_ids, now_ts):
+    """
+    Возвращает время последнего уведомления для каждого пользователя.
+    Пользователям без записи ставится метка "давно, но не слишком",
+    чтобы отсчёт периода тишины начался с первого опроса.
+    """
+    last_events = {}
+    for i in range(0, len(user_ids), REDIS_CHUNK_SIZE):
+        chunk = user_ids[i : i + REDIS_CHUNK_SIZE]
+        values = await redis_client.hmget(LAST_EVENT_KEY, chunk)
+
+        missing = {}
+        for user_id, value in zip(chunk, values):
+            if value is None:
+                value = now_ts - POLL_RECENT_ACTIVITY_MINUTES * 60
+                missing[user_id] = int(value)
+            last_events[user_id] = float(value)
+
+        if missing:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for user_id, value in missing.items():
+                    pipe.hsetnx(LAST_EVENT_KEY, user_id, value)
+                await pipe.execute()
+
+    return last_events
+
+
+async def select_due_users(user_ids, now: datetime = None):
+    """Отбирает пользователей, которых нужно опросить на текущем тике"""
+    now = now or datetime.now()
+    now_ts = now.timestamp()
+    tick = get_current_tick(now_ts)
+    day_part = get_day_part(now)
+
+    try:
+        last_events = await get_last_events(list(user_ids), now_ts)
+        last_polled = await get_last_polled(list(user_ids))
+    except Exception as e:
+        logger.warning(f"Failed to load polling activity, using day part only: {e}")
+        last_events = {}
+        last_polled = {}
+
+    due = []
+    intervals = {}
+    for user_id in user_ids:
+        interval = get_poll_interval(day_part, last_events.get(user_id), now_ts)
+        intervals[interval] = intervals.get(interval, 0) + 1
+        if is_due(user_id, tick, interval, last_polled.get(user_id), now_ts):
+            due.append(user_id)
+
+
+    logger.debug(
+        f"Polling tick {tick} ({day_part}): {len(due)}/{len(user_ids)} users due, "
+        f"intervals: {dict(sorted(intervals.items()))}"
+    )
+    return due
+
+
+async def mark_user_activity(user_id, event_time: datetime = None):
+    """Запоминает время последнего уведомления пользователя"""
+    timestamp = int((event_time or datetime.now()).timestamp())
+    try:
+        await redis_client.hset(LAST_EVENT_KEY, user_id, timestamp)
+    except Exception as e:
+        logger.warning(f"Failed to save polling activity for user {user_id}: {e}")
@@ -0,0 +1,102 @@
+# SPDX-FileCopyrightText: 2024-2026 Mag329
+#
+# SPDX-License-Identifier: MIT
+
+import asyncio
+from datetime import datetime
+
+from aiogram.types import Message
+from loguru import logger
+
+STALE_MARKER = "\n\n<i>🔄 Обновляем данные...</i>"
+
+# cache_key -> фоновая задача обновления (одна на ключ)
+_revalidations: dict[str, asyncio.Task] = {}
+# (chat_id, message_id) -> номер последнего ответа в этом сообщении
+_message_versions: dict[tuple, int] = {}
+
+
+class StaleText(str):
+    """
+    Устаревший текст с пометкой об обновлении. Сам текст служит handle
+    для revalidate_message: revalidation = (задача, текст без пометки, дата).
+    """
+
+    revalidation = None
+
+
+def serve_stale(cache_key, data: dict, render, mark=False):
+    """
+    Возвращает устаревший (text, date) из кэша и запускает render() в фоне.
+    render должен вернуть свежий (text, date), минуя кэш.
+    С mark=True текст возвращается как StaleText с пометкой — тогда вызывающий
+    обязан передать его в revalidate_message вместе с отправленным сообщением.
+    Без mark фоновое обновление только обновляет кэш.
+    """
+    text = data["text"]
+    date = datetime.strptime(data["date"], "%Y-%m-%d")
+
+    task = _revalidations.get(cache_key)
+    if task is None:
+        task = asyncio.create_task(render())
+        _revalidations[cache_key] = task
+        task.add_done_callback(lambda _: _revalidations.pop(cache_key, None))
+        logger.debug(f"Serving stale {cache_key}, revalidating in background")
+
+    if not mark:
+        return text, date
+
+    stale = StaleText(text + STALE_MARKER)
+    stale.revalidation = (task, text, date)
+    return stale, date
+
+
+async def revalidate_message(message, text, reply_markup=None):
+    """
+    Вызывается обработчиком после отправки ответа с тем text, который вернул
+    рендер. Если ответ был устаревшим, сообщение будет отредактировано,
+    когда фоновое обновление завершится.
+    """
+    if not isinstance(message, Message):
+        return
+
+    message_key = (message.chat.id, message.message_id)
+    version = _message_versions.get(message_key, 0) + 1
+    _message_versions[message_key] = version
+
+    pending = getattr(text, "revalidation", None)
+    if pending is None:
+        # Новый ответ отменяет ожидающее редактирование этого сообщения
+        _message_versions.pop(message_key, None)
+        return
+
+    asyncio.create_task(
+        _apply_revalidation(pending, message, message_key, version, reply_markup)
+    )
+
+
+async def _apply_revalidation(pending, message, message_key, version, reply_markup):
+    task, stale_text, stale_date = pending
+
+    try:
+        result = await task
+    except Exception as e:
+        logger.warning(f"Background revalidation failed: {e}")
+        result = None
+
+    # Пользователь успел перейти к другому дню — сообщение уже не наше
+    if _message_versions.get(message_key) != version:
+        return
+    del _message_versions[message_key]
+
+    text = stale_text
+    if result and result[0] and result[1].date() == stale_date.date():
+        text = result[0]
+
+    try:
+        # Даже если текст не изменился, нужно убрать пометку об обновлении
+        await message.edit_text(text, reply_markup=reply_markup)
+        if text != stale_text:
+            logger.debug(f"Message {message_key} updated after revalidation")
+    except Exception as e:
+        logger.debug(f"Failed to edit message {message_key} after revalidation: {e}")
@@ -0,0 +1,96 @@
+# SPDX-FileCopyrightText: 2024-2026 Mag329
+#
+# SPDX-License-Identifier: MIT
+
+from collections import OrderedDict
+
+from loguru import logger
+
+from app.config.config import USERNAME_SYNC_CACHE_SIZE
+from app.utils.database import get_session, UserData, db
+from app.utils.user.identity import set_cached_username
+
+
+class UsernameSync:
+    """
+    Отложенная запись username в user_data.
+    На апдейте username сравнивается с последним известным в памяти процесса;
+    изменения копятся в pending и пишутся одним UPDATE в flush по расписанию.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._known: OrderedDict[int, str] = OrderedDict()
+        self._pending: dict[int, str] = {}
+
+    def observe(self, user_id, username, stored_username=None):
+        """
+        Возвращает True, если username изменился и поставлен в очередь.
+        stored_username — значение из БД (identity) для пользователей,
+        которых процесс ещё не видел.
+        """
+        known = self._known.get(user_id, stored_username)
+        self._remember(user_id, username)
+        if known == username:
+            return False
+
+        self._pending[user_id] = username
+        set_cached_username(user_id, username)
+        return True
+
+    def _remember(self, user_id, username):
+        self._known[user_id] = username
+        self._known.move_to_end(user_id)
+
+        while len(self._known) > self.maxsize:
+            self._known.popitem(last=False)
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    async def flush(self):
+        if not self._pending:
+            return 0
+
+        batch, self._pending = self._pending, {}
+        values = db.values(
+            db.column("user_id", db.BigInteger),
+            db.column("username", db.String),
+            name="new_usernames",
+        ).data(list(batch.items()))
+
+        try:
+            async with await get_session() as session:
+                result = await session.execute(
+                    db.update(UserData)
+                    .where(
+                        UserData.user_id == values.c.user_id,
+                        UserData.username.is_distinct_from(values.c.username),
+                    )
+                    .values(username=values.c.username)
+                    .returning(UserData.user_id)
+                )
+                updated = result.scalars().all()
+                await session.commit()
+        except Exception as e:
+            # Более свежие значения, пришедшие во время записи, не перезаписываются
+            for user_id, username in batch.items():
+                self._pending.setdefault(user_id, username)
+            logger.error(f"Failed to flush {len(batch)} username updates: {e}")
+            return 0
+
+        # Identity могла перечитаться из БД до записи — возвращаем новые значения
+        for user_id in updated:
+            if user_id not in self._pending:
+                set_cached_username(user_id, batch[user_id])
+
+        logger.info(f"Flushed username updates: {len(updated)} of {len(batch)} changed")
+        return len(updated)
+
+
+username_sync = UsernameSync(USERNAME_SYNC_CACHE_SIZE)
+
+
+async def flush_username_updates():
+    await username_sync.flush()
@@ -12,7 +12,6 @@ from aiogram.types import Message
 from aiogram.utils.media_group import MediaGroupBuilder
 from loguru import logger
 from octodiary.apis import AsyncMobileAPI, AsyncWebAPI
-from octodiary.urls import Systems
 
 from app.keyboards import user as kb
 from app.config import config
@@ -29,11 +28,16 @@ from app.utils.database import (
     PremiumSubscription,
     SettingDefinition,
     Settings,
-    User,
     UserData,
     db,
 )
+from app.utils.user.clients import client_pool
 from app.utils.user.decorators import handle_api_error
+from app.utils.user.identity import (
+    UserIdentity,
+    get_identity,
+    invalidate_identity,
+)
 
 EMOJI_SUBJECTS = {
     "Иностранный (английский) язык": "🇬🇧",
@@ -100,55 +104,35 @@ async def get_mark_with_weight(mark, weight):
     return f"{mark}{str(weight).translate(SUBSCRIPT_MAP)}"
 
 
-@handle_api_error()
-async def get_student(user_id, active=True) -> list[AsyncMobileAPI, User]:
-    logger.debug(f"Getting student data for user {user_id}, active={active}")
+async def get_pooled_api(user_id, active=True, web=False):
+    identity = await get_identity(user_id, active)
+    if not identity:
+        logger.warning(f"User {user_id} not found or inactive")
+        return None, None
 
-    async with await get_session() as session:
-        try:
-            query = db.select(User).filter_by(user_id=user_id)
-            if active:
-                query = query.filter_by(active=True)
+    return client_pool.get(user_id, identity.token, web=web), identity
 
-            result = await session.execute(query)
-            user = result.scalar_one_or_none()
 
-            if not user:
-                logger.warning(f"User {user_id} not found or inactive")
-                return None, None
+@handle_api_error()
+async def get_student(user_id, active=True) -> list[AsyncMobileAPI, UserIdentity]:
+    logger.debug(f"Getting student data for user {user_id}, active={active}")
 
-            api = AsyncMobileAPI(system=Systems.MES)
-            api.token = user.token
-            logger.debug(f"Student API created for user {user_id}")
-            return api, user
-        except Exception as e:
-            logger.exception(f"Error getting student data for user {user_id}: {e}")
-            return None, None
+    try:
+        return await get_pooled_api(user_id, active)
+    except Exception as e:
+        logger.exception(f"Error getting student data for user {user_id}: {e}")
+        return None, None
 
 
 @handle_api_error()
-async def get_web_api(user_id, active=True) -> list[AsyncWebAPI, User]:
+async def get_web_api(user_id, active=True) -> list[AsyncWebAPI, UserIdentity]:
     logger.debug(f"Getting web API for user {user_id}, active={active}")
 
-    async with await get_session() as session:
-        try:
-            query = db.select(User).filter_by(user_id=user_id)
-            if active:
-                query = query.filter_by(active=True)
-
-            result = await session.execute(query)
-            user = result.scalar_one_or_none()
-
-            if not user:
-                logger.warning(f"User {user_id} not found or inactive")
-                return None, None
-
-            api = AsyncWebAPI(system=Systems.MES)
-            api.token = user.token
-            return api, user
-        except Exception as e:
-            logger.exception(f"Error getting web API for user {user_id}: {e}")
-            return None, None
+    try:
+        return await get_pooled_api(user_id, active, web=True)
+    except Exception as e:
+        logger.exception(f"Error getting web API for user {user_id}: {e}")
+        return None, None
 
 
 async def render_settings_text(
@@ -298,6 +282,15 @@ async def save_profile_data(session, user_id, profile_data, username):
 
         profile = await api.get_family_profile(profile_id=user.profile_id)
 
+        # Класс нужен для общего учебного календаря, запоминаем его сразу
+        from app.utils.user.api.mes.calendar import save_class_unit_id
+
+        child = next(
+            (c for c in profile.children or [] if c.id == user.student_id), None
+        )
+        if child:
+            await save_class_unit_id(user_id, child.class_unit_id)
+
         phone = profile.profile.phone
         if phone and not phone.startswith("7"):
             if phone.startswith("8"):
@@ -339,6 +332,7 @@ async def save_profile_data(session, user_id, profile_data, username):
             logger.info(f"Updated UserData record for user {user_id}")
 
         await session.commit()
+        invalidate_identity(user_id)
         logger.success(f"Profile data saved successfully for user {user_id}")
 
     except Exception as e:
@@ -584,17 +578,14 @@ async def deep_links(message: Message, args, bot: Bot, state: FSMContext):
         await message.delete()
 
         try:
-            api, user = await get_student(message.from_user.id)
-            subjects = await api.get_subjects(
-                student_id=user.student_id, profile_id=user.profile_id
+            from app.utils.user.api.mes.subjects import (
+                UNKNOWN_SUBJECT,
+                get_subjects_catalog,
             )
-            subject_name = next(
-                (
-                    subject.subject_name
-                    for subject in subjects.payload
-                    if subject.subject_id == subject_id
-                ),
-                "Неизвестный предмет",
+
+            catalog = await get_subjects_catalog(message.from_user.id)
+            subject_name = (
+                catalog.get_name(subject_id, UNKNOWN_SUBJECT) if catalog else UNKNOWN_SUBJECT
             )
 
             logger.debug(f"Subject name: {subject_name}")
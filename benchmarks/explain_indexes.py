@@ -0,0 +1,182 @@
+# SPDX-FileCopyrightText: 2024-2026 Mag329
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Планы горячих запросов до и после индексов из app/utils/database.py.
+
+Создаёт отдельную схему, заполняет её данными на N пользователей, снимает
+EXPLAIN ANALYZE без индексов, создаёт индексы и снимает планы ещё раз.
+
+    python -m benchmarks.explain_indexes --users 100000
+
+Подключение берётся из PG_* в .env, как у бота. Схема удаляется
+после прогона (--keep оставляет её).
+"""
+
+import argparse
+import asyncio
+import time
+
+import sqlalchemy as db
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.schema import AddConstraint, CreateIndex
+
+from app.utils.database import DATABASE_URL, Base
+
+SCHEMA = "bench_indexes"
+
+HOT_TABLES = [
+    "settings",
+    "user_data",
+    "auth_data",
+    "premium_subscriptions",
+    "gdz",
+    "student_books",
+    "events",
+    "bot_notifications",
+    "homeworks",
+]
+
+# :user — случайный пользователь из середины диапазона
+QUERIES = {
+    "settings": "SELECT * FROM settings WHERE user_id = :user",
+    "user_data": "SELECT * FROM user_data WHERE user_id = :user",
+    "auth_data": "SELECT * FROM auth_data WHERE user_id = :user",
+    "premium_subscriptions": "SELECT * FROM premium_subscriptions WHERE user_id = :user",
+    "gdz": "SELECT * FROM gdz WHERE user_id = :user AND subject_id = 3",
+    "student_books": "SELECT * FROM student_books WHERE user_id = :user AND subject_id = 3",
+    "events": "SELECT * FROM events WHERE student_id = :user",
+    "bot_notifications": (
+        "SELECT * FROM bot_notifications "
+        "WHERE user_id = :user AND created_at < now() - interval '1 day'"
+    ),
+    "homeworks": (
+        "SELECT id FROM homeworks WHERE subject_id = 3 "
+        "AND task_hash = encode(sha256(convert_to('task ' || :user, 'UTF8')), 'hex')"
+    ),
+}
+
+SEED = [
+    """
+    INSERT INTO users (user_id, student_id, active)
+    SELECT i, i, true FROM generate_series(1, :users) i
+    """,
+    "INSERT INTO settings (user_id) SELECT i FROM generate_series(1, :users) i",
+    "INSERT INTO user_data (user_id, username) SELECT i, 'user' || i FROM generate_series(1, :users) i",
+    "INSERT INTO auth_data (user_id, auth_method) SELECT i, 'token' FROM generate_series(1, :users) i",
+    """
+    INSERT INTO premium_subscriptions (user_id, is_active, balance, auto_renew)
+    SELECT i, i % 10 = 0, 0, true FROM generate_series(1, :users) i
+    """,
+    """
+    INSERT INTO gdz (user_id, subject_id, subject_name)
+    SELECT i, s, 'subject ' || s FROM generate_series(1, :users) i, generate_series(1, 3) s
+    """,
+    """
+    INSERT INTO student_books (user_id, subject_id, subject_name)
+    SELECT i, s, 'subject ' || s FROM generate_series(1, :users) i, generate_series(1, 3) s
+    """,
+    """
+    INSERT INTO events (student_id, event_type, subject_name, date, teacher_id)
+    SELECT i, 'create_mark', 'subject', now() - (n || ' day')::interval, 1
+    FROM generate_series(1, :users) i, generate_series(1, 5) n
+    """,
+    """
+    INSERT INTO bot_notifications (user_id, type, text, created_at)
+    SELECT i, 'replaces', 'text', now() - (n || ' day')::interval
+    FROM generate_series(1, :users) i, generate_series(0, 2) n
+    """,
+    """
+    INSERT INTO homeworks (task, subject_id, task_hash)
+    SELECT 'task ' || i, 3, encode(sha256(convert_to('task ' || i, 'UTF8')), 'hex')
+    FROM generate_series(1, :users) i
+    """,
+]
+
+
+def hot_indexes():
+    """Индексы и уникальные ограничения горячих таблиц из моделей"""
+    indexes, constraints = [], []
+    for name in HOT_TABLES:
+        table = Base.metadata.tables[name]
+        indexes.extend(table.indexes)
+        constraints.extend(
+            constraint
+            for constraint in table.constraints
+            if isinstance(constraint, db.UniqueConstraint) and constraint.name
+        )
+    return indexes, constraints
+
+
+async def explain_all(conn, user):
+    plans = {}
+    for name, query in QUERIES.items():
+        result = await conn.execute(
+            db.text(f"EXPLAIN (ANALYZE, BUFFERS) {query}"), {"user": user}
+        )
+        plans[name] = [row[0] for row in result]
+    return plans
+
+
+def summary(plan):
+    # Первая строка плана — верхний узел, последняя — время выполнения
+    return f"{plan[0].split('  (')[0].strip():<60} {plan[-1].strip()}"
+
+
+async def main(users: int, keep: bool, verbose: bool):
+    engine = create_async_engine(DATABASE_URL, echo=False)
+    indexes, constraints = hot_indexes()
+
+    async with engine.begin() as conn:
+        await conn.execute(db.text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(db.text(f"CREATE SCHEMA {SCHEMA}"))
+        await conn.execute(db.text(f"SET LOCAL search_path TO {SCHEMA}"))
+        await conn.run_sync(Base.metadata.create_all)
+
+        # Базовая схема — без новых индексов
+        for index in indexes:
+            await conn.execute(db.text(f"DROP INDEX {index.name}"))
+        for constraint in constraints:
+            await conn.execute(
+                db.text(f"ALTER TABLE {constraint.table.name} DROP CONSTRAINT {constraint.name}")
+            )
+
+        started = time.perf_counter()
+        for statement in SEED:
+            await conn.execute(db.text(statement), {"users": users})
+        await conn.execute(db.text("ANALYZE"))
+        print(f"Seeded {users} users in {time.perf_counter() - started:.1f}s")
+
+        user = users // 2
+        before = await explain_all(conn, user)
+
+        for index in indexes:
+            await conn.execute(CreateIndex(index))
+        for constraint in constraints:
+            await conn.execute(AddConstraint(constraint))
+        await conn.execute(db.text("ANALYZE"))
+
+        after = await explain_all(conn, user)
+
+        for name in QUERIES:
+            print(f"\n{name}")
+            print(f"  before: {summary(before[name])}")
+            print(f"  after:  {summary(after[name])}")
+            if verbose:
+                print("\n".join(f"    {line}" for line in after[name]))
+
+        if not keep:
+            await conn.execute(db.text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--keep", action="store_true", help=f"не удалять схему {SCHEMA}")
+    parser.add_argument("--verbose", action="store_true", help="печатать планы целиком")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.users, args.keep, args.verbose))
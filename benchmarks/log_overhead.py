@@ -0,0 +1,66 @@
+# SPDX-FileCopyrightText: 2024-2026 Mag329
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Цена отключённого logger.debug в горячих циклах.
+
+Sink настроен на INFO, как в продакшене. Сравниваются f-строка со strftime,
+тот же вызов под DEBUG_ENABLED и ленивый logger.opt(lazy=True).
+
+    python -m benchmarks.log_overhead --calls 200000
+"""
+
+import argparse
+import sys
+import timeit
+from datetime import datetime
+
+from loguru import logger
+
+# Одно обновление «Итогов»: ~15 предметов по 2 сообщения и ~170 учебных дней
+# посещений по 2 вызова str_to_time с 2 сообщениями каждый
+DEBUG_CALLS_PER_UPDATE = 15 * 2 + 170 * 2 * 2
+
+DEBUG_ENABLED = False
+
+
+def eager(day, user_id):
+    logger.debug(f"Cache hit for schedule: user {user_id}, date {day.strftime('%Y-%m-%d')}")
+
+
+def gated(day, user_id):
+    if DEBUG_ENABLED:
+        logger.debug(f"Cache hit for schedule: user {user_id}, date {day.strftime('%Y-%m-%d')}")
+
+
+def lazy(day, user_id):
+    logger.opt(lazy=True).debug(
+        "Cache hit for schedule: user {}, date {}", lambda: user_id, lambda: day.strftime("%Y-%m-%d")
+    )
+
+
+def main(calls: int):
+    logger.remove()
+    logger.add(sys.stderr, level="INFO")
+
+    day = datetime.now()
+    results = {}
+    for func in (eager, lazy, gated):
+        seconds = timeit.timeit(lambda: func(day, 123456789), number=calls)
+        results[func.__name__] = seconds / calls * 1e9
+
+    print(f"{'variant':<8} {'ns/call':>10} {'us/update':>10}")
+    for name, ns in results.items():
+        print(f"{name:<8} {ns:>10.0f} {ns * DEBUG_CALLS_PER_UPDATE / 1000:>10.1f}")
+
+    saved = (results["eager"] - results["gated"]) * DEBUG_CALLS_PER_UPDATE / 1000
+    print(f"\nSaved per update with {DEBUG_CALLS_PER_UPDATE} debug calls: {saved:.1f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200_000)
+    args = parser.parse_args()
+
+    main(args.calls)
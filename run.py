@@ -3,56 +3,21 @@
 # SPDX-License-Identifier: MIT
 
 import asyncio
+import atexit
 import os
 import sys
-import socket
-from datetime import datetime
-import json
 
 from loguru import logger
 
 from app import main
-from app.config.config import LOG_FILE, ERRORS_LOG_FILE, LOG_LEVEL, LOGSTASH_HOST, LOGSTASH_PORT, BOT_VERSION
+from app.config.config import LOG_FILE, ERRORS_LOG_FILE, LOG_LEVEL, LOGSTASH_HOST, LOGSTASH_PORT
+from app.utils.logstash import create_log_sink
 
 log_dir = os.path.dirname(LOG_FILE)
 
 if log_dir and not os.path.exists(log_dir):
     os.makedirs(log_dir, exist_ok=True)
 
-def logstash_sink(message):
-    try:
-        record = message.record
-        
-        # Формируем документ для Logstash
-        log_entry = {
-            "event_type": "log", 
-            "@timestamp": record["time"].isoformat(),
-            "level": record["level"].name,
-            "logger": record["name"],
-            "module": record["name"],
-            "function": record["function"],
-            "line": record["line"],
-            "message": record["message"],
-            "process_id": record["process"].id,
-            "thread_id": record["thread"].id,
-            "bot_version": BOT_VERSION,
-            "environment": os.getenv("ENVIRONMENT", "development"),
-        }
-        
-        # Добавляем exception если есть
-        if record["exception"]:
-            log_entry["exception"] = str(record["exception"])
-            log_entry["traceback"] = record["exception"].traceback
-        
-        # Отправляем в Logstash
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(2)  # Таймаут 2 секунды
-        sock.connect((LOGSTASH_HOST, LOGSTASH_PORT))
-        sock.sendall((json.dumps(log_entry, ensure_ascii=False) + "\n").encode("utf-8"))
-        sock.close()
-    except Exception:
-        pass
-
 logger.remove()
 
 logger.add(
@@ -86,6 +51,9 @@ logger.add(
 
 if LOGSTASH_HOST and LOGSTASH_PORT:
     try:
+        # Sink только ставит запись в очередь, отправка идёт в отдельном потоке
+        logstash_sink = create_log_sink()
+        atexit.register(logstash_sink.stop)
         logstash_handler = logger.add(
             logstash_sink,
             level=LOG_LEVEL,  # Можно изменить на "INFO" если не хотим отправлять DEBUG в Logstash